@@ -0,0 +1,152 @@
+import re
+from typing import Iterable, Iterator, List, Tuple
+from chdbpyreader.utils import base_type, quote_string
+
+# Keep LowCardinality columns dictionary encoded, they become categoricals
+ARROW_SETTINGS = "output_format_arrow_low_cardinality_as_dictionary = 1"
+
+# ClickHouse writes Date, DateTime and Bool columns as these integer types,
+# only the ClickHouse type of the column tells them from plain integers
+AMBIGUOUS_ARROW_TYPES = frozenset(["uint8", "uint16", "uint32"])
+
+DATETIME_TIMEZONE_PATTERN = re.compile(r"DateTime\('([^']+)'\)")
+# Formats chDB writes Date and DateTime columns to as plain integers
+INTEGER_DATE_FORMATS = {"Parquet", "Arrow", "ArrowStream"}
+
+
+def needs_column_types(table: "pyarrow.Table") -> bool:
+    """Whether restore_types() needs the ClickHouse types of a result"""
+    return any(
+        str(_value_type(field.type)) in AMBIGUOUS_ARROW_TYPES for field in table.schema
+    )
+
+
+def _value_type(arrow_type: "pyarrow.DataType") -> "pyarrow.DataType":
+    """Type of the values, of the dictionary for LowCardinality columns"""
+    return getattr(arrow_type, "value_type", arrow_type)
+
+
+def restore_types(table: "pyarrow.Table", column_types: List[str]) -> "pyarrow.Table":
+    """Give Date, DateTime and Bool columns of a result their Arrow types.
+
+    Args:
+        table: Result of a query in the ArrowTable format
+        column_types: ClickHouse type of each column of the result, in order
+
+    Returns:
+        Table with date32, timestamp and bool columns instead of integers
+    """
+    import pyarrow as pa
+
+    for i, (field, col_type) in enumerate(zip(table.schema, column_types)):
+        value_type = _value_type(field.type)
+        if str(value_type) not in AMBIGUOUS_ARROW_TYPES:
+            continue
+        col_type = base_type(col_type)
+        # LowCardinality dates are few distinct values, decoded like the others
+        column = table.column(i).cast(value_type)
+        if col_type == "Date":
+            # Days since the epoch
+            arrow_type = pa.date32()
+            column = column.cast(pa.int32()).cast(arrow_type)
+        elif col_type.startswith("DateTime"):
+            # Seconds since the epoch
+            timezone = DATETIME_TIMEZONE_PATTERN.match(col_type)
+            arrow_type = pa.timestamp("s", tz=timezone.group(1) if timezone else None)
+            column = column.cast(pa.int64()).cast(arrow_type)
+        elif col_type == "Bool":
+            arrow_type = pa.bool_()
+            column = column.cast(arrow_type)
+        else:
+            continue
+        table = table.set_column(
+            i, pa.field(field.name, arrow_type, field.nullable), column
+        )
+    return table
+
+
+def date_preserving_columns(columns: Iterable[Tuple[str, str]]) -> str:
+    """Select list writing dates to INTEGER_DATE_FORMATS files as dates.
+
+    Date columns are widened to Date32 and DateTime columns to DateTime64,
+    which chDB writes as Arrow date32 and timestamp values.
+
+    Args:
+        columns: (name, ClickHouse type) of each column, e.g. from DESCRIBE
+
+    Returns:
+        The select list, "*" when no column needs widening
+    """
+    selected = []
+    widened = False
+    for name, col_type in columns:
+        column = f"`{name}`"
+        col_type = base_type(col_type)
+        timezone = DATETIME_TIMEZONE_PATTERN.match(col_type)
+        if col_type == "Date":
+            column = f"toDate32({column}) AS {column}"
+        elif col_type == "DateTime" or timezone:
+            scale = f"0, {quote_string(timezone.group(1))}" if timezone else "0"
+            column = f"toDateTime64({column}, {scale}) AS {column}"
+        widened = widened or column.endswith(f"AS `{name}`")
+        selected.append(column)
+    return ", ".join(selected) if widened else "*"
+
+
+def arrow_to_dataframe(table: "pyarrow.Table") -> "pandas.DataFrame":
+    """Convert a query result to a DataFrame.
+
+    Nullable integer and Bool columns use the pandas nullable dtypes instead
+    of float64 and object, dates and times are datetime64, dictionary
+    encoded columns are categoricals and decimals stay exact Decimal objects.
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    nullable_dtypes = {
+        pa.int8(): pd.Int8Dtype(),
+        pa.int16(): pd.Int16Dtype(),
+        pa.int32(): pd.Int32Dtype(),
+        pa.int64(): pd.Int64Dtype(),
+        pa.uint8(): pd.UInt8Dtype(),
+        pa.uint16(): pd.UInt16Dtype(),
+        pa.uint32(): pd.UInt32Dtype(),
+        pa.uint64(): pd.UInt64Dtype(),
+        pa.bool_(): pd.BooleanDtype(),
+    }
+
+    df = table.to_pandas(date_as_object=False)
+    for i, field in enumerate(table.schema):
+        # ClickHouse only marks Nullable columns as nullable
+        if field.nullable and field.type in nullable_dtypes:
+            df.isetitem(i, table.column(i).to_pandas(types_mapper=nullable_dtypes.get))
+    return df
+
+
+def rebatch(
+    batches: Iterable["pyarrow.RecordBatch"], batch_rows: int
+) -> Iterator["pyarrow.Table"]:
+    """Regroup record batches into single chunk tables of batch_rows rows.
+
+    Only the rows of the batch being split are held, the last table may be
+    shorter.
+    """
+    import pyarrow as pa
+
+    pending = []
+    pending_rows = 0
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows < batch_rows:
+            continue
+        table = pa.Table.from_batches(pending)
+        offset = 0
+        while pending_rows - offset >= batch_rows:
+            yield table.slice(offset, batch_rows).combine_chunks()
+            offset += batch_rows
+        rest = table.slice(offset)
+        pending = rest.to_batches()
+        pending_rows = rest.num_rows
+    if pending_rows:
+        yield pa.Table.from_batches(pending).combine_chunks()
@@ -0,0 +1,190 @@
+import asyncio
+import contextvars
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from chainfunc.session_pool import DEFAULT_POOL_SIZE
+
+DEFAULT_MAX_WORKERS = DEFAULT_POOL_SIZE
+
+
+class QueryCancelled(Exception):
+    """Raised in a worker when its task is cancelled before the query starts"""
+
+
+class QueryTask:
+    """Cancellation handle of the queries run by one worker call.
+
+    chDB cannot interrupt a running query. Cancelling a task ends the
+    Python() tables of its running query, which then completes as if the
+    API sources were exhausted. Later queries of the task are not started.
+    The results of a cancelled task are partial and never cached.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._scans: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add_scans(self, scans: Dict[str, Any]) -> None:
+        """Register the scans of a query starting in this task"""
+        with self._lock:
+            self._scans.update(scans)
+            cancelled = self.cancelled
+        if cancelled:
+            for scan in scans.values():
+                scan.cancel()
+
+    def remove_scans(self, scans: Dict[str, Any]) -> None:
+        """Unregister the scans of a finished query"""
+        with self._lock:
+            for name in scans:
+                self._scans.pop(name, None)
+
+    def check(self) -> None:
+        """Raise QueryCancelled if the task was cancelled"""
+        if self.cancelled:
+            raise QueryCancelled("Query cancelled before it started")
+
+    def cancel(self) -> None:
+        """Cancel the task, see QueryTask"""
+        with self._lock:
+            self.cancelled = True
+            scans = list(self._scans.values())
+        for scan in scans:
+            scan.cancel()
+
+
+_current_task: "contextvars.ContextVar[Optional[QueryTask]]" = contextvars.ContextVar(
+    "query_task", default=None
+)
+
+
+def current_task() -> Optional[QueryTask]:
+    """Task of the worker call running in this thread, None outside of one"""
+    return _current_task.get()
+
+
+_default_executor: Optional[ThreadPoolExecutor] = None
+_default_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the thread pool running asynchronous queries"""
+    global _default_executor
+    with _default_lock:
+        if _default_executor is None:
+            _default_executor = ThreadPoolExecutor(
+                DEFAULT_MAX_WORKERS, thread_name_prefix="chdb-query"
+            )
+        return _default_executor
+
+
+def configure_executor(max_workers: int = DEFAULT_MAX_WORKERS) -> ThreadPoolExecutor:
+    """Replace the thread pool running asynchronous queries.
+
+    Queries already submitted finish on the previous pool.
+    """
+    global _default_executor
+    with _default_lock:
+        previous = _default_executor
+        _default_executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="chdb-query"
+        )
+    if previous is not None:
+        previous.shutdown(wait=False)
+    return _default_executor
+
+
+async def run_async(
+    func: Callable[..., Any], *args: Any, timeout: Optional[float] = None
+) -> Any:
+    """Run a blocking query function on the query thread pool.
+
+    The event loop stays free while the query runs, but queries do not run
+    in parallel: chDB runs one query at a time, and SessionPool runs them
+    one after the other under a single lock.
+
+    Args:
+        func: Function running queries, e.g. a bound QueryBuilder.execute
+        *args: Arguments of func
+        timeout: Seconds to wait for the result, None to wait forever
+
+    Raises:
+        asyncio.TimeoutError: If the result is not ready within timeout,
+            the query is cancelled, see QueryTask
+    """
+    loop = asyncio.get_running_loop()
+    task = QueryTask()
+
+    def work():
+        token = _current_task.set(task)
+        try:
+            task.check()
+            return func(*args)
+        except Exception as e:
+            # Release the chDB result held by the failed frames now, the
+            # garbage collector could free it while chDB runs a query
+            traceback.clear_frames(e.__traceback__)
+            raise
+        finally:
+            _current_task.reset(token)
+
+    future = loop.run_in_executor(get_executor(), work)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except BaseException:
+        # Timed out, cancelled by the caller or failed
+        task.cancel()
+        raise
+
+
+async def gather(
+    *builders: Any,
+    max_concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    output_format: Optional[str] = None,
+) -> List[Any]:
+    """Run the queries of several builders from the event loop.
+
+    Only the work outside chDB, e.g. converting results to DataFrames,
+    overlaps. The queries themselves, API pages read through Python()
+    tables included, run one after the other: SessionPool serializes every
+    query of the process under a single lock, see run_async().
+
+    Args:
+        *builders: QueryBuilder instances
+        max_concurrency: Maximum number of queries waiting for the pool at
+            the same time, None for no limit beyond the thread pool
+        timeout: Seconds each query may take, waiting for the queries before
+            it included, None for no limit
+        output_format: Return execute() results in this format instead of
+            DataFrames
+
+    Returns:
+        The results in the order of the builders
+
+    Raises:
+        The first error of a query, the other queries are then cancelled
+    """
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def call(builder: Any) -> Any:
+        if output_format is None:
+            return await builder.to_dataframe_async(timeout=timeout)
+        return await builder.execute_async(output_format, timeout=timeout)
+
+    async def run(builder: Any) -> Any:
+        if semaphore is None:
+            return await call(builder)
+        async with semaphore:
+            return await call(builder)
+
+    tasks = [asyncio.ensure_future(run(builder)) for builder in builders]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
@@ -0,0 +1,150 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+# chDB counters diffed around a profiled query, see SessionPool.query()
+PROFILE_EVENTS = ("SelectedRows", "SelectedBytes")
+
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def reset_peak_rss() -> Optional[int]:
+    """Reset the peak resident memory of the process and return the current one.
+
+    The peak is the one of the whole process, every thread and library
+    included, and anything else reading VmHWM sees it reset too.
+
+    Returns None where the peak cannot be reset, i.e. outside of Linux.
+    """
+    try:
+        with open(PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return _proc_status_bytes("VmRSS")
+    except OSError:
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident memory of the process since reset_peak_rss()"""
+    try:
+        return _proc_status_bytes("VmHWM")
+    except OSError:
+        return None
+
+
+def _proc_status_bytes(key: str) -> Optional[int]:
+    with open(PROC_STATUS) as f:
+        for line in f:
+            if line.startswith(key + ":"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+@dataclass
+class SourceStats:
+    rows: int = 0  # Rows served to chDB
+    bytes: int = 0  # Size of the served column buffers
+    batches: int = 0
+    read_seconds: float = 0.0  # Time chDB waited in DataReader.read
+
+
+@dataclass
+class QueryStats:
+    """Cost of one QueryBuilder run, e.g. one to_dataframe() call.
+
+    Timings are always collected. rows_read and bytes_read come from chDB
+    and process_peak_memory from the kernel, they are only filled for
+    builders marked with profile().
+    """
+
+    queries: int = 0  # chDB queries run, e.g. a DESCRIBE for column types
+    cache_hits: int = 0  # Queries served by the result cache
+    build_seconds: float = 0.0  # Building the SQL
+    execute_seconds: float = 0.0  # Running the queries in chDB
+    convert_seconds: float = 0.0  # Converting the results, and the rest
+    total_seconds: float = 0.0
+    # Python() sources by collection name
+    sources: Dict[str, SourceStats] = field(default_factory=dict)
+    rows_read: Optional[int] = None  # Rows read by chDB from every source
+    bytes_read: Optional[int] = None
+    # Bytes the resident memory of the whole process grew by at the peak of
+    # the largest query, Python threads working meanwhile included. Not
+    # attributed to sources, None outside of Linux.
+    process_peak_memory: Optional[int] = None
+    profiled: bool = False
+
+    def add_query(
+        self,
+        seconds: float,
+        scans: Dict[str, Any],
+        profile: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """Account for one chDB query and the scans it read"""
+        self.queries += 1
+        self.execute_seconds += seconds
+        for scan in scans.values():
+            source = self.sources.setdefault(scan.table_name, SourceStats())
+            source.rows += scan.rows_read
+            source.bytes += scan.bytes_read
+            source.batches += scan.batches
+            source.read_seconds += scan.read_seconds
+        if profile:
+            self.rows_read = (self.rows_read or 0) + profile["SelectedRows"]
+            self.bytes_read = (self.bytes_read or 0) + profile["SelectedBytes"]
+            if "ProcessPeakMemory" in profile:
+                self.process_peak_memory = max(
+                    self.process_peak_memory or 0, profile["ProcessPeakMemory"]
+                )
+
+    def __str__(self) -> str:
+        lines = [
+            f"queries: {self.queries} ({self.cache_hits} cached)",
+            f"total: {self.total_seconds * 1000:.1f} ms "
+            f"(build {self.build_seconds * 1000:.1f} ms, "
+            f"execute {self.execute_seconds * 1000:.1f} ms, "
+            f"convert {self.convert_seconds * 1000:.1f} ms)",
+        ]
+        if self.profiled:
+            lines.append(
+                f"read: {self.rows_read} rows, {self.bytes_read} bytes, "
+                f"process peak memory {self.process_peak_memory} bytes"
+            )
+        for name, source in self.sources.items():
+            lines.append(
+                f"source {name}: {source.rows} rows, {source.bytes} bytes, "
+                f"{source.batches} batches, read {source.read_seconds * 1000:.1f} ms"
+            )
+        return "\n".join(lines)
+
+
+_current_stats: "contextvars.ContextVar[Optional[QueryStats]]" = contextvars.ContextVar(
+    "query_stats", default=None
+)
+
+
+def current_stats() -> Optional[QueryStats]:
+    """Stats of the QueryBuilder run in progress, None outside of one"""
+    return _current_stats.get()
+
+
+@contextmanager
+def collect_stats(profiled: bool = False) -> Iterator[QueryStats]:
+    """Collect the stats of a run, nested runs add to the outer one"""
+    stats = _current_stats.get()
+    if stats is not None:
+        yield stats
+        return
+    stats = QueryStats(profiled=profiled)
+    token = _current_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+        stats.total_seconds = time.perf_counter() - start
+        stats.convert_seconds = max(
+            stats.total_seconds - stats.build_seconds - stats.execute_seconds, 0.0
+        )
@@ -1,16 +1,127 @@
-from typing import List, Dict, Any, Optional, Union
-from dataclasses import dataclass
-import chdb
+import copy
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import weakref
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
+from dataclasses import dataclass, fields, replace
+from chdbpyreader.utils import (
+    QUERY_PARAM_PATTERN,
+    TemplateCache,
+    query_param_type,
+    quote_string,
+    render_query_params,
+)
 from chdbpyreader.data_reader import DataReader
+from chdbpyreader.registry import READERS
+from chainfunc.session_pool import SessionPool, get_pool
+from chainfunc.result_cache import ResultCache, get_result_cache
+from chainfunc.schema_cache import get_schema_cache
+from chainfunc.executor import current_task, run_async
+from chainfunc.profile import QueryStats, collect_stats, current_stats
+from chainfunc.arrow import (
+    ARROW_SETTINGS,
+    INTEGER_DATE_FORMATS,
+    arrow_to_dataframe,
+    date_preserving_columns,
+    needs_column_types,
+    rebatch,
+    restore_types,
+)
 from agent import Agent
 import re
 
+DEFAULT_BATCH_ROWS = 65536
+
+# Plain column names, qualified with the table alias unlike expressions
+IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# File extension of each export format, the lowercase name otherwise
+EXPORT_EXTENSIONS = {
+    "CSVWithNames": "csv",
+    "TabSeparated": "tsv",
+    "TabSeparatedWithNames": "tsv",
+    "JSONEachRow": "jsonl",
+    "ArrowStream": "arrows",
+}
+# Setting holding the internal compression codec of columnar formats, text
+# formats compress the whole file instead
+EXPORT_COMPRESSION_SETTINGS = {
+    "Parquet": "output_format_parquet_compression_method",
+    "Arrow": "output_format_arrow_compression_method",
+    "ArrowStream": "output_format_arrow_compression_method",
+    "ORC": "output_format_orc_compression_method",
+}
+
+# Words of a join type, e.g. "LEFT", "ANY INNER" or "LEFT SEMI"
+JOIN_KEYWORDS = {
+    "INNER",
+    "LEFT",
+    "RIGHT",
+    "FULL",
+    "OUTER",
+    "ANY",
+    "ALL",
+    "SEMI",
+    "ANTI",
+    "ASOF",
+}
+# Values of the join_algorithm setting
+JOIN_ALGORITHMS = {
+    "default",
+    "auto",
+    "hash",
+    "parallel_hash",
+    "grace_hash",
+    "partial_merge",
+    "prefer_partial_merge",
+    "full_sorting_merge",
+    "direct",
+}
+# Join types keeping the rows of the joined table even without a match, a
+# filter on the joined table then only applies after the join
+OUTER_JOIN_KEYWORDS = {"LEFT", "FULL", "ANTI"}
+
+# SQL of each builder shape, builders differing only in filter values share it
+SQL_TEMPLATES = TemplateCache()
+
 
 @dataclass
 class JoinInfo:
     table_func: str
     conditions: Dict[str, str]
     alias: str
+    reader: Optional[DataReader] = None
+    how: str = "INNER"
+    # Joined table with its own fields, filters and limit, compiled to a
+    # subquery reducing that side before the join
+    builder: Optional["QueryBuilder"] = None
+
+
+class MaterializedTable:
+    """Temporary chDB table holding the results of a query.
+
+    The table is dropped with the last builder referencing it, or by drop().
+    """
+
+    def __init__(self, name: str, pool: SessionPool):
+        self.name = name
+        self._pool = pool
+        # Finalizers may run while a query holds the pool, the drop waits
+        # for the next query
+        self._finalizer = weakref.finalize(
+            self, pool.defer, f"DROP TEMPORARY TABLE IF EXISTS {name}"
+        )
+
+    def drop(self) -> None:
+        """Drop the table now"""
+        if self._finalizer.alive:
+            self._finalizer()
+            self._pool.run_deferred()
 
 
 @dataclass
@@ -23,6 +134,16 @@ class QueryState:
     explain: bool = False
     table_alias: str = None
     schema: Optional[Dict[str, str]] = None  # Store column name -> type mapping
+    # (field, operator, value) filters on the main table an API source can apply
+    pushdown_filters: List[Tuple[str, str, Any]] = None
+    # Values of the {pN:Type} parameters of where_conditions
+    params: Dict[str, Any] = None
+    group_by: List[str] = None
+    # "function(field) AS name" expressions added to the selected fields
+    aggregations: List[str] = None
+    having_conditions: List[str] = None
+    order_by: List[str] = None
+    join_algorithm: Optional[str] = None
 
 
 class QueryBuilder:
@@ -32,6 +153,8 @@ class QueryBuilder:
         reader: Optional[DataReader] = None,
         alias: Optional[str] = None,
         sql: Optional[str] = None,
+        path: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
     ):
         """Initialize QueryBuilder.
 
@@ -40,7 +163,20 @@ class QueryBuilder:
             reader: Optional DataReader instance
             alias: Optional table alias
             sql: Optional existing SQL query string
+            path: Optional chDB data path holding local tables the query reads
+            params: Optional values of {name:Type} parameters of the SQL
         """
+        self._path = path
+        self._params = dict(params or {})
+        self._reader = reader
+        self._result_cache: Optional[ResultCache] = None
+        # Temporary tables the query reads, kept alive by this builder
+        self._materialized: List[MaterializedTable] = []
+        # Table created by materialize() for this builder, see drop()
+        self._owned_table: Optional[MaterializedTable] = None
+        # Cost of the last run, see profile()
+        self.stats: Optional[QueryStats] = None
+        self._profile = False
         if sql:
             # If SQL is provided, use it directly
             self._sql = sql
@@ -49,7 +185,6 @@ class QueryBuilder:
             # Otherwise initialize normally
             self.state = QueryState(table=table_func)
             self._sql = None
-            self._reader = reader
             # Generate table alias if not provided
             if not alias:
                 alias = self._generate_alias(table_func)
@@ -74,8 +209,8 @@ class QueryBuilder:
             if match:
                 # Get the last part of the path and remove extension
                 filename = match.group(1).split("/")[-1].split(".")[0]
-                # Use the table name from the file path
-                return filename
+                # Use the table name from the file path, without glob characters
+                return re.sub(r"\W+", "_", filename).strip("_") or "file"
             return "file"
         else:
             return "table"
@@ -88,15 +223,47 @@ class QueryBuilder:
         return self
 
     def filter(self, field: str, operator: str, value: Any) -> "QueryBuilder":
-        """Add a WHERE condition to the query"""
+        """Add a WHERE condition to the query.
+
+        A field prefixed with the alias of a joined table filters that table
+        before the join, unless the join keeps its unmatched rows.
+        """
+        prefix, _, column = field.rpartition(".")
+        if prefix and prefix == self.state.table_alias:
+            field = column
+        elif prefix:
+            join = self._find_join(prefix)
+            if join is not None and not OUTER_JOIN_KEYWORDS & set(join.how.split()):
+                join.builder = join.builder._copy().filter(column, operator, value)
+                return self
+
         if self.state.where_conditions is None:
             self.state.where_conditions = []
         # Add table alias to field if it exists
         field_with_alias = (
-            f"{self.state.table_alias}.{field}" if self.state.table_alias else field
+            f"{self.state.table_alias}.{field}"
+            if self.state.table_alias and "." not in field
+            else field
         )
-        condition = f"{field_with_alias} {operator} {self._format_value(value)}"
+        # Values are bound as query parameters, the SQL only depends on the shape
+        if operator.upper() == "BETWEEN":
+            low, high = value
+            formatted = f"{self._bind_value(low)} AND {self._bind_value(high)}"
+        else:
+            formatted = self._bind_value(value)
+        condition = f"{field_with_alias} {operator} {formatted}"
         self.state.where_conditions.append(condition)
+
+        # Simple predicates on the main table can also be applied by the source,
+        # when it compares the value like chDB
+        if (
+            "." not in field
+            and self._reader is not None
+            and self._reader.can_push_down(field, operator, value)
+        ):
+            if self.state.pushdown_filters is None:
+                self.state.pushdown_filters = []
+            self.state.pushdown_filters.append((field, operator.upper(), value))
         return self
 
     def join(
@@ -104,42 +271,333 @@ class QueryBuilder:
         other: Union[str, "QueryBuilder"],
         on: Dict[str, str],
         alias: Optional[str] = None,
+        how: str = "INNER",
+        algorithm: Optional[str] = None,
     ) -> "QueryBuilder":
-        """Add a JOIN condition to the query"""
+        """Add a JOIN condition to the query.
+
+        The fields, filters and limit of a joined QueryBuilder are kept: its
+        side is read through a subquery and reduced before the join.
+
+        Args:
+            other: Table function or QueryBuilder to join
+            on: Join keys, fields of this table to fields of the joined one
+            alias: Alias of the joined table, by default the one of a joined
+                QueryBuilder or one generated from the table function
+            how: Join type, e.g. LEFT, ANY INNER or LEFT SEMI
+            algorithm: join_algorithm setting of the query, e.g. parallel_hash
+
+        Raises:
+            ValueError: If the join type or algorithm is unknown, or the alias
+                is already used by the query
+        """
+        how = " ".join(how.upper().split())
+        if not how or not set(how.split()) <= JOIN_KEYWORDS:
+            raise ValueError(f"Unsupported join type: {how}")
+        if algorithm is not None:
+            if algorithm not in JOIN_ALGORITHMS:
+                raise ValueError(f"Unsupported join algorithm: {algorithm}")
+            self.state.join_algorithm = algorithm
         if self.state.joins is None:
             self.state.joins = []
 
         # Get the table function string and generate alias if needed
+        reader = None
         if isinstance(other, QueryBuilder):
             table_func = other.state.table
-            alias = other.state.table_alias  # Use the original QueryBuilder's alias
+            # The joined side is read as a subquery, so it can be renamed
+            alias = alias or other.state.table_alias
+            reader = other._reader
+            # Later changes to the joined builder do not affect this query
+            builder = other._copy()
+            # Local tables of the joined builder must be visible to the query
+            if other._path and not self._path:
+                self._path = other._path
+            self._materialized.extend(other._materialized)
         else:
             table_func = other
             # Only generate alias if not provided
             if not alias:
                 temp_builder = QueryBuilder(table_func)
                 alias = temp_builder.state.table_alias
+            builder = QueryBuilder(table_func, alias=alias)
+        if alias == self.state.table_alias or any(
+            join.alias == alias for join in self.state.joins
+        ):
+            raise ValueError(
+                f"Duplicate table alias: {alias}, pass another alias to join()"
+            )
+
+        # The subquery of the joined side must return its join keys
+        if builder.state.select_fields and not builder._is_aggregated():
+            for field in on.values():
+                prefix, _, column = field.rpartition(".")
+                if prefix in ("", alias) and not {field, column} & set(
+                    builder.state.select_fields
+                ):
+                    builder.state.select_fields = builder.state.select_fields + [column]
 
         self.state.joins.append(
-            JoinInfo(table_func=table_func, conditions=on, alias=alias)
+            JoinInfo(
+                table_func=table_func,
+                conditions=on,
+                alias=alias,
+                reader=reader,
+                how=how,
+                builder=builder,
+            )
         )
         return self
 
+    def _copy(self) -> "QueryBuilder":
+        """Builder with its own copy of the query state"""
+        builder = copy.copy(self)
+        builder._materialized = list(self._materialized)
+        if self.state is not None:
+            builder.state = replace(self.state)
+            for state_field in fields(builder.state):
+                value = getattr(builder.state, state_field.name)
+                if isinstance(value, (list, dict)):
+                    setattr(builder.state, state_field.name, copy.copy(value))
+            if builder.state.joins:
+                builder.state.joins = [replace(join) for join in builder.state.joins]
+        return builder
+
+    def _find_join(self, alias: str) -> Optional[JoinInfo]:
+        for join in self.state.joins or ():
+            if join.alias == alias and join.builder is not None:
+                return join
+        return None
+
+    @staticmethod
+    def _is_subquery(builder: Optional["QueryBuilder"]) -> bool:
+        """Whether a joined builder does more than read its table"""
+        if builder is None:
+            return False
+        state = builder.state
+        return bool(
+            state.select_fields
+            or state.where_conditions
+            or state.limit_value is not None
+            or state.joins
+            or state.order_by
+            or builder._is_aggregated()
+        )
+
+    def group_by(self, fields: Union[str, List[str]]) -> "QueryBuilder":
+        """Group the results by fields, selected unless select() is used"""
+        if isinstance(fields, str):
+            fields = [field.strip() for field in fields.split(",")]
+        self.state.group_by = fields
+        return self
+
+    def agg(self, **aggregations: Union[str, Tuple[Any, ...]]) -> "QueryBuilder":
+        """Add aggregate columns, computed per group_by() group or overall.
+
+        Each keyword names a result column. Its value is either a tuple
+        (function, field, *parameters) or a ClickHouse expression, e.g.
+
+            .agg(
+                users=("count",),
+                revenue=("sum", "amount"),
+                customers=("uniq", "user_id"),
+                p95=("quantile", "latency", 0.95),
+                paid="countIf(amount > 0)",
+            )
+        """
+        if self.state.aggregations is None:
+            self.state.aggregations = []
+        for name, spec in aggregations.items():
+            if not isinstance(spec, str):
+                spec = self._aggregate_expression(*spec)
+            self.state.aggregations.append(f"{spec} AS {name}")
+        return self
+
+    def _aggregate_expression(
+        self, function: str, field: str = "*", *parameters: Union[int, float]
+    ) -> str:
+        """ClickHouse call of an aggregate function, e.g. quantile(0.95)(x)"""
+        if not IDENTIFIER_PATTERN.match(function):
+            raise ValueError(f"Invalid aggregate function: {function}")
+        for parameter in parameters:
+            if isinstance(parameter, bool) or not isinstance(parameter, (int, float)):
+                raise ValueError(
+                    f"Parameters of {function} must be numbers, got {parameter!r}"
+                )
+        if parameters:
+            function += f"({', '.join(map(repr, parameters))})"
+        argument = "" if field == "*" else self._qualify(field)
+        return f"{function}({argument})"
+
+    def having(self, field: str, operator: str, value: Any) -> "QueryBuilder":
+        """Add a condition on the groups, e.g. on an agg() column"""
+        if self.state.having_conditions is None:
+            self.state.having_conditions = []
+        if operator.upper() == "BETWEEN":
+            low, high = value
+            formatted = f"{self._bind_value(low)} AND {self._bind_value(high)}"
+        else:
+            formatted = self._bind_value(value)
+        self.state.having_conditions.append(f"{field} {operator} {formatted}")
+        return self
+
+    def order_by(
+        self, fields: Union[str, List[str]], desc: bool = False
+    ) -> "QueryBuilder":
+        """Sort the results.
+
+        Args:
+            fields: Fields or agg() columns, each may end with ASC or DESC
+            desc: Sort the fields without a direction in descending order
+        """
+        if isinstance(fields, str):
+            fields = [field.strip() for field in fields.split(",")]
+        if self.state.order_by is None:
+            self.state.order_by = []
+        for field in fields:
+            if desc and not re.search(r"\s(ASC|DESC)$", field, re.IGNORECASE):
+                field += " DESC"
+            self.state.order_by.append(field)
+        return self
+
     def limit(self, n: int) -> "QueryBuilder":
         """Limit the number of results"""
         self.state.limit_value = n
         return self
 
+    def cached(self, cache: Optional[ResultCache] = None) -> "QueryBuilder":
+        """Serve the results of this query from a result cache.
+
+        Args:
+            cache: Cache to use, defaults to the process result cache, see
+                get_result_cache()
+        """
+        self._result_cache = cache or get_result_cache()
+        return self
+
+    def profile(self) -> "QueryBuilder":
+        """Also collect chDB read counters and the process peak memory into stats.
+
+        Every run of a builder records its timings and what each API source
+        served in `stats`. Profiled runs also ask chDB how many rows and
+        bytes it read, which costs two small queries per query, and on Linux
+        how much the memory of the whole process grew at the peak of a query.
+        """
+        self._profile = True
+        return self
+
     def explain(self) -> "QueryBuilder":
         """Add EXPLAIN to the query"""
         self.state.explain = True
         return self
 
-    def _format_value(self, value: Any) -> str:
-        """Format values for SQL query"""
-        if isinstance(value, str):
-            return f"'{value}'"
-        return str(value)
+    def _bind_value(self, value: Any) -> str:
+        """Bind a value to a new query parameter and return its placeholder"""
+        if self.state.params is None:
+            self.state.params = {}
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        name = f"p{len(self.state.params)}"
+        self.state.params[name] = value
+        return f"{{{name}:{query_param_type(value)}}}"
+
+    def _qualify(self, field: str) -> str:
+        """Prefix a plain column name with the table alias"""
+        if self.state.table_alias and IDENTIFIER_PATTERN.match(field):
+            return f"{self.state.table_alias}.{field}"
+        return field
+
+    def _is_aggregated(self) -> bool:
+        state = self.state
+        return bool(state.group_by or state.aggregations or state.having_conditions)
+
+    def _plain_columns(self) -> Optional[List[str]]:
+        """Selected columns when every selected field is a column of the table,
+        None when one is an expression, e.g. an aggregate or DISTINCT"""
+        columns = []
+        for field in self.state.select_fields or []:
+            prefix, _, column = field.rpartition(".")
+            if prefix not in ("", self.state.table_alias):
+                return None
+            if not IDENTIFIER_PATTERN.match(column):
+                return None
+            columns.append(column)
+        return columns
+
+    def _query_params(self) -> Dict[str, Any]:
+        """Values of the query parameters of the SQL"""
+        if not self.state:
+            return self._params
+        params = dict(self.state.params or {})
+        for i, join in enumerate(self.state.joins or ()):
+            if self._is_subquery(join.builder):
+                for name, value in join.builder._query_params().items():
+                    params[f"j{i}_{name}"] = value
+        return params
+
+    def _scan_args(self) -> Dict[str, tuple]:
+        """Filters and limit each API source of the query can apply"""
+        scan_args = {}
+        if not self.state:
+            return scan_args
+        if self._reader:
+            scan_args[self._reader.name] = self._pushdown()
+        for join in self.state.joins or ():
+            if self._is_subquery(join.builder):
+                # The first reference of a reader gets its arguments
+                for name, args in join.builder._scan_args().items():
+                    scan_args.setdefault(name, args)
+        return scan_args
+
+    def _shape(self) -> tuple:
+        """Everything the SQL depends on, i.e. the state without the values"""
+        state = self.state
+        return (
+            state.table,
+            state.table_alias,
+            state.explain,
+            state.limit_value,
+            tuple(state.select_fields or ()),
+            tuple(state.where_conditions or ()),
+            tuple(
+                (
+                    join.table_func,
+                    join.alias,
+                    join.how,
+                    tuple(join.conditions.items()),
+                    join.builder._shape() if self._is_subquery(join.builder) else None,
+                )
+                for join in state.joins or ()
+            ),
+            state.join_algorithm,
+            tuple(state.group_by or ()),
+            tuple(state.aggregations or ()),
+            tuple(state.having_conditions or ()),
+            tuple(state.order_by or ()),
+        )
+
+    def _pushdown(self) -> Tuple[List[Tuple[str, str, Any]], Optional[int]]:
+        """Filters and limit an API source can apply before chDB re-checks them"""
+        filters = self.state.pushdown_filters or []
+        # Rows of this table without a match are kept with default values,
+        # which the filters must see
+        for join in self.state.joins or ():
+            if {"RIGHT", "FULL"} & set(join.how.split()):
+                filters = []
+        limit = None
+        # The limit is only exact at the source when every condition is pushed
+        # and it applies to the source rows, not to groups, aggregates of the
+        # select list or sorted rows
+        if (
+            self.state.limit_value is not None
+            and not self.state.joins
+            and not self._is_aggregated()
+            and self._plain_columns() is not None
+            and not self.state.order_by
+            and len(filters) == len(self.state.where_conditions or [])
+        ):
+            limit = self.state.limit_value
+        return filters, limit
 
     def _build_sql(self) -> str:
         """Build the SQL query from the current state"""
@@ -154,7 +612,15 @@ class QueryBuilder:
             parts.append("EXPLAIN")
 
         # Add SELECT clause with table aliases
-        if self.state.select_fields:
+        if self._is_aggregated():
+            # Group keys and aggregates, rows of joined tables are grouped too
+            fields = [
+                self._qualify(field)
+                for field in self.state.select_fields or self.state.group_by or []
+            ]
+            fields.extend(self.state.aggregations or [])
+            select_fields = ", ".join(fields)
+        elif self.state.select_fields:
             fields = []
             for field in self.state.select_fields:
                 if "." not in field:  # Add table alias if field doesn't have one
@@ -203,8 +669,16 @@ class QueryBuilder:
 
         # Add JOIN clauses with aliases
         if self.state.joins:
-            for join in self.state.joins:
-                join_clause = f"JOIN {join.table_func}"
+            for i, join in enumerate(self.state.joins):
+                table = join.table_func
+                if self._is_subquery(join.builder):
+                    # Parameters of the subquery are renamed apart from ours
+                    subquery = QUERY_PARAM_PATTERN.sub(
+                        lambda m: f"{{j{i}_{m.group(1)}:{m.group(2)}}}",
+                        join.builder._build_sql(),
+                    )
+                    table = f"({subquery})"
+                join_clause = f"{join.how} JOIN {table}"
                 if join.alias:
                     join_clause += f" AS {join.alias}"
                 conditions = []
@@ -226,107 +700,522 @@ class QueryBuilder:
         if self.state.where_conditions:
             parts.append(f"WHERE {' AND '.join(self.state.where_conditions)}")
 
+        if self.state.group_by:
+            group_by = ", ".join(map(self._qualify, self.state.group_by))
+            parts.append(f"GROUP BY {group_by}")
+
+        if self.state.having_conditions:
+            parts.append(f"HAVING {' AND '.join(self.state.having_conditions)}")
+
+        # Unqualified, the fields may be agg() columns
+        if self.state.order_by:
+            parts.append(f"ORDER BY {', '.join(self.state.order_by)}")
+
         # Add LIMIT clause
         if self.state.limit_value is not None:
             parts.append(f"LIMIT {self.state.limit_value}")
 
+        if self.state.join_algorithm:
+            parts.append(f"SETTINGS join_algorithm = '{self.state.join_algorithm}'")
+
         return " ".join(parts)
 
     def execute(self, output_format: str = "PrettyCompact") -> str:
         """Execute the query using chdb and return the results"""
-        # If SQL was already built (e.g., from a question), use it directly
-        if self._sql:
-            sql = self._sql
-        else:
-            sql = self._build_sql()
-            self._sql = sql
+        with self._collect_stats():
+            return self._run(self._get_sql(), output_format)
+
+    @contextmanager
+    def _collect_stats(self) -> Iterator[QueryStats]:
+        """Record the cost of a run in stats, nested runs add to the outer one"""
+        with collect_stats(self._profile) as stats:
+            try:
+                yield stats
+            finally:
+                self.stats = stats
+
+    async def execute_async(
+        self, output_format: str = "PrettyCompact", timeout: Optional[float] = None
+    ) -> Any:
+        """Execute the query on the query thread pool, see execute().
+
+        Args:
+            output_format: chDB output format
+            timeout: Seconds to wait for the results, None to wait forever
 
-        # If the query uses Python(reader) and we have a reader instance,
-        # declare it globally for ClickHouse to use
-        if "Python(reader)" in sql and hasattr(self, "_reader") and self._reader:
-            global reader
-            reader = self._reader
+        Raises:
+            asyncio.TimeoutError: If the query takes longer than timeout
+        """
+        return await run_async(self.execute, output_format, timeout=timeout)
+
+    def _get_sql(self) -> str:
+        """SQL of the query, compiled once per builder shape"""
+        # SQL given directly (e.g., from a question) is used as it is
+        if self.state is None:
+            return self._sql
+        start = time.perf_counter()
+        sql = SQL_TEMPLATES.get(self._shape(), self._build_sql)
+        stats = current_stats()
+        if stats is not None:
+            stats.build_seconds += time.perf_counter() - start
+        return sql
+
+    def _run(
+        self,
+        sql: str,
+        output_format: str,
+        scans: Optional[Dict[str, Any]] = None,
+        cache: bool = True,
+    ) -> Any:
+        """Run SQL reading the Python() tables of this builder.
+
+        Args:
+            sql: Query to run
+            output_format: chDB output format
+            scans: Optional dictionary receiving the scans of the query while
+                it runs, e.g. to cancel them from another thread
+            cache: Whether the result cache of the builder, if any, applies
+        """
+        if self._reader:
+            # Python(reader) is the legacy name of this builder's reader
+            sql = sql.replace("Python(reader)", f"Python({self._reader.name})")
+        # Let the API sources apply simple filters and limits themselves
+        scan_args = self._scan_args()
+
+        params = self._query_params()
+        stats = current_stats()
+        cache_key = ttl = None
+        shared = False
+        if self._result_cache is not None and cache:
+            cache_key, ttl, shared, result = self._result_cache.lookup(
+                sql, output_format, params, self._path
+            )
+            if result is not None:
+                if stats is not None:
+                    stats.cache_hits += 1
+                return result
 
-        # Execute the query and get results
-        result = chdb.query(sql, output_format)
+        task = current_task()
+        if task is not None:
+            task.check()
+
+        # Every Python() table of the query reads through its own scan
+        bound_sql, bound_scans = READERS.bind_scans(sql, globals(), scan_args)
+        if scans is not None:
+            scans.update(bound_scans)
+        if task is not None:
+            # Cancelling the task ends the scans of the running query
+            task.add_scans(bound_scans)
+        profile = {} if stats is not None and stats.profiled else None
+        pool = get_pool(self._path)
+        tables: List[str] = []
+        start = time.perf_counter()
+        try:
+            if len(bound_scans) > 1:
+                # chDB reads one Python() table per query, the others are
+                # copied to temporary tables first
+                bound_sql, tables = READERS.materialize_scans(
+                    bound_sql, bound_scans, pool.query
+                )
+            result = pool.query(bound_sql, output_format, params, profile)
+        finally:
+            if stats is not None:
+                stats.add_query(time.perf_counter() - start, bound_scans, profile)
+            if task is not None:
+                task.remove_scans(bound_scans)
+            for table in tables:
+                pool.query(f"DROP TEMPORARY TABLE IF EXISTS {table}")
+            READERS.release_scans(globals(), bound_scans)
+        # The results of a cancelled task are partial
+        if cache_key is not None and not (task is not None and task.cancelled):
+            result = self._result_cache.put(cache_key, result, sql, ttl, shared)
         return result
 
+    def to_arrow(self) -> "pyarrow.Table":
+        """Execute the query and return the results as an Arrow table"""
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("pyarrow is required for to_arrow() method")
+
+        with self._collect_stats():
+            sql = self._get_sql().strip().rstrip(";")
+            table = self._run(
+                f"SELECT * FROM ({sql}) SETTINGS {ARROW_SETTINGS}", "ArrowTable"
+            )
+            if needs_column_types(table):
+                # Date, DateTime and Bool columns arrive as integers
+                column_types = self._schema_types(table.column_names)
+                table = restore_types(table, column_types or self._column_types(sql))
+            return table
+
+    def _column_types(self, sql: str) -> List[str]:
+        """ClickHouse types of the result columns of a query, in order"""
+        result = self._run(f"DESCRIBE TABLE ({sql})", "TabSeparatedRaw")
+        return [line.split("\t")[1] for line in result.bytes().decode().splitlines()]
+
+    def _table_schema(self) -> Optional[Dict[str, str]]:
+        """Column types of the main table, found once per source state"""
+        if self.state.schema:
+            return self.state.schema
+        if self.state.table.startswith("Python("):
+            return dict(self._reader.column_types) if self._reader else None
+        return get_schema_cache().get(self.state.table, self._path)
+
+    def _schema_types(self, names: Optional[List[str]] = None) -> Optional[List[str]]:
+        """Types of the result columns known from the table schema.
+
+        Saves a DESCRIBE of the query when the results are plain columns of
+        a file, postgres or local table, None otherwise.
+
+        Args:
+            names: Result column names, defaults to the selected fields
+        """
+        state = self.state
+        if state is None or state.joins or state.explain or self._is_aggregated():
+            return None
+        # Reader types are what the API serves, chDB may report others
+        if state.table.startswith("Python("):
+            return None
+        # Expressions, e.g. toDate(ts) AS ts, may be named like a column
+        # but have another type
+        columns = self._plain_columns()
+        if columns is None:
+            return None
+        schema = self._table_schema()
+        if not schema:
+            return None
+        if names is None:
+            names = columns or list(schema)
+        if not all(name in schema for name in names):
+            return None
+        return [schema[name] for name in names]
+
+    def iter_batches(
+        self, batch_rows: int = DEFAULT_BATCH_ROWS, dataframe: bool = False
+    ) -> Iterator[Union["pyarrow.RecordBatch", "pandas.DataFrame"]]:
+        """Iterate over the query results in batches while the query runs.
+
+        chDB writes the results to a named pipe from a background thread and
+        batches are read from the pipe as they are produced, so memory holds
+        a few batches whatever the size of the results.
+
+        Leaving the loop early cancels the Python() tables of the query, which
+        then ends as if the API sources were exhausted. chDB cannot interrupt
+        a running query otherwise and ignores the closed pipe, so file and
+        postgres sources are read to the end in the background with the
+        results discarded, and queries of other threads wait for them. chDB
+        runs one query at a time, so queries run inside the loop raise
+        RuntimeError instead of waiting for this one forever.
+
+        Args:
+            batch_rows: Number of rows per batch, the last one may be shorter
+            dataframe: Yield pandas DataFrames instead of Arrow record batches
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("pyarrow is required for iter_batches() method")
+
+        sql = self._get_sql().strip().rstrip(";")
+        # Asked first, the query holds chDB until the iteration ends
+        column_types = self._schema_types() or self._column_types(sql)
+
+        # Queries of the loop would wait for this one, they fail instead
+        with get_pool(self._path).streaming():
+            spool_dir = tempfile.mkdtemp(prefix="query-batches-")
+            pipe = os.path.join(spool_dir, "results.arrows")
+            os.mkfifo(pipe)
+            # Holding a write end, reads wait for chDB instead of seeing the
+            # end of the stream, even when the query fails before opening it
+            read_fd = os.open(pipe, os.O_RDONLY | os.O_NONBLOCK)
+            os.set_blocking(read_fd, True)
+            write_fd = os.open(pipe, os.O_WRONLY)
+            stream = os.fdopen(read_fd, "rb")
+            errors: List[Exception] = []
+            scans: Dict[str, Any] = {}
+
+            def run_query():
+                try:
+                    self._run(
+                        f"INSERT INTO FUNCTION file('{pipe}', 'ArrowStream') "
+                        f"SELECT * FROM ({sql}) SETTINGS {ARROW_SETTINGS}",
+                        "CSV",
+                        scans,
+                        cache=False,
+                    )
+                except Exception as e:
+                    # Release the chDB result held by the failed frames now,
+                    # the garbage collector could free it while chDB runs a query
+                    traceback.clear_frames(e.__traceback__)
+                    errors.append(e)
+                finally:
+                    os.close(write_fd)
+
+            worker = threading.Thread(
+                target=run_query, name="query-batches", daemon=True
+            )
+            worker.start()
+            try:
+                try:
+                    for table in rebatch(pa.ipc.open_stream(stream), batch_rows):
+                        table = restore_types(table, column_types)
+                        if dataframe:
+                            yield arrow_to_dataframe(table)
+                        else:
+                            yield table.to_batches()[0]
+                except pa.ArrowInvalid:
+                    # The stream ended early or was never written, the query failed
+                    worker.join()
+                    if errors:
+                        raise errors[0]
+                    raise
+            finally:
+                if worker.is_alive():
+                    # Left early, chDB ignores the closed pipe and keeps writing
+                    for scan in list(scans.values()):
+                        scan.cancel()
+                stream.close()
+                shutil.rmtree(spool_dir, ignore_errors=True)
+            worker.join()
+        if errors:
+            raise errors[0]
+
     def to_dataframe(self) -> "pandas.DataFrame":
         """Convert query results to a pandas DataFrame"""
         try:
-            import pandas as pd
+            import pandas  # noqa: F401
         except ImportError:
             raise ImportError("pandas is required for to_dataframe() method")
 
-        # Execute query with JSON format for easier parsing
-        result = self.execute("JSON")
-
-        # Parse JSON result into DataFrame
-        import json
-
-        data = json.loads(str(result))
-
-        # Handle empty results
-        if not data or "data" not in data or not data["data"]:
-            return pd.DataFrame()
-
-        # Extract data and create DataFrame
-        df = pd.DataFrame(data["data"])
-
-        # Set column types based on meta information if available
-        if "meta" in data:
-            type_mapping = {
-                "Int8": "int8",
-                "Int16": "int16",
-                "Int32": "int32",
-                "Int64": "int64",
-                "UInt8": "uint8",
-                "UInt16": "uint16",
-                "UInt32": "uint32",
-                "UInt64": "uint64",
-                "Float32": "float32",
-                "Float64": "float64",
-                "String": "string",
-                "Date": "datetime64[ns]",
-                "DateTime": "datetime64[ns]",
-                "Boolean": "bool",
-            }
-
-            for col_meta in data["meta"]:
-                col_name = col_meta["name"]
-                col_type = col_meta["type"]
-                if col_type in type_mapping and col_name in df.columns:
-                    try:
-                        df[col_name] = df[col_name].astype(type_mapping[col_type])
-                    except (ValueError, TypeError):
-                        # If type conversion fails, keep original type
-                        pass
-
-        return df
+        # Columnar Arrow output, no text round-trip
+        with self._collect_stats():
+            return arrow_to_dataframe(self.to_arrow())
+
+    async def to_dataframe_async(
+        self, timeout: Optional[float] = None
+    ) -> "pandas.DataFrame":
+        """Convert query results to a DataFrame on the query thread pool.
+
+        Args:
+            timeout: Seconds to wait for the results, None to wait forever
+
+        Raises:
+            asyncio.TimeoutError: If the query takes longer than timeout
+        """
+        return await run_async(self.to_dataframe, timeout=timeout)
 
     def to_dict(self) -> Dict[str, List[Any]]:
         """Convert query results to a dictionary of lists"""
-        # Execute query with JSON format for easier parsing
-        result = self.execute("JSON")
+        with self._collect_stats():
+            table = self.to_arrow()
 
-        # Parse JSON result into dictionary
-        import json
+            # Handle empty results
+            if not table.num_rows:
+                return {}
 
-        data = json.loads(str(result))
+            return table.to_pydict()
+
+    def materialize(
+        self,
+        name: Optional[str] = None,
+        engine: str = "Memory",
+        order_by: Optional[Union[str, List[str]]] = None,
+    ) -> "QueryBuilder":
+        """Run the query once into a temporary table and return a builder over it.
 
-        # Handle empty results
-        if not data or "data" not in data or not data["data"]:
-            return {}
+        Later filters, joins and questions on the returned builder read the
+        local table instead of the sources. The table lives in the chDB
+        session and is dropped when no builder references it anymore, or
+        when leaving a `with` block on the returned builder.
+
+        Args:
+            name: Table name, a unique one by default
+            engine: Memory or MergeTree
+            order_by: Sorting key of a MergeTree table, none by default
+        """
+        with self._collect_stats():
+            alias = self.state.table_alias if self.state else "materialized"
+            name = name or READERS.unique_name(f"materialized_{alias}")
+            engine_clause = self._engine_clause(engine, order_by)
+
+            sql = self._get_sql().strip().rstrip(";")
+            self._run(
+                f"CREATE TEMPORARY TABLE {name} {engine_clause} "
+                f"AS SELECT * FROM ({sql})",
+                "CSV",
+                cache=False,
+            )
+            table = MaterializedTable(name, get_pool(self._path))
+
+            builder = QueryBuilder(name, alias=alias, path=self._path)
+            builder._materialized.append(table)
+            builder._owned_table = table
+            builder._result_cache = self._result_cache
+            if self._result_cache is not None:
+                # Results of an earlier table of the same name
+                self._result_cache.invalidate(name)
+            result = builder._run(
+                f"DESCRIBE TABLE {name}", "TabSeparatedRaw", cache=False
+            )
+            builder.state.schema = dict(
+                line.split("\t")[:2] for line in result.bytes().decode().splitlines()
+            )
+            return builder
+
+    @staticmethod
+    def _engine_clause(
+        engine: str,
+        order_by: Optional[Union[str, List[str]]] = None,
+        partition_by: Optional[str] = None,
+    ) -> str:
+        """ENGINE clause of a table, MergeTree ones are sorted by order_by"""
+        engine_clause = f"ENGINE = {engine}"
+        if engine.endswith("MergeTree"):
+            if partition_by:
+                engine_clause += f" PARTITION BY {partition_by}"
+            if isinstance(order_by, (list, tuple)):
+                order_by = f"({', '.join(order_by)})"
+            engine_clause += f" ORDER BY {order_by or 'tuple()'}"
+        return engine_clause
+
+    def to_file(
+        self,
+        path: str,
+        format: str = "Parquet",
+        compression: Optional[str] = None,
+        partition_by: Optional[str] = None,
+        overwrite: bool = True,
+    ) -> None:
+        """Write the query results to files, without converting them to Python.
+
+        chDB runs the query straight into the file, so memory stays flat
+        whatever the size of the results.
+
+        Args:
+            path: File path. With partition_by, a path containing
+                {_partition_id}, or a directory receiving one key=value
+                directory per partition, readable with partitioning="hive"
+            format: chDB output format, e.g. Parquet, CSVWithNames or ORC
+            compression: Codec of columnar formats, e.g. zstd or snappy, or
+                compression of the file for text formats, e.g. gzip
+            partition_by: Column or expression splitting the results into
+                one file per value
+            overwrite: Replace existing files instead of failing or appending
+        """
+        extension = EXPORT_EXTENSIONS.get(format, format.lower())
+        if partition_by and "{_partition_id}" not in path:
+            if not IDENTIFIER_PATTERN.match(partition_by):
+                raise ValueError(
+                    "path must contain {_partition_id} to partition by an expression"
+                )
+            path = os.path.join(path, f"{partition_by}={{_partition_id}}")
+            path = os.path.join(path, f"data.{extension}")
 
-        # Convert to dictionary of lists
-        result_dict = {}
-        for row in data["data"]:
-            for key, value in row.items():
-                if key not in result_dict:
-                    result_dict[key] = []
-                result_dict[key].append(value)
+        arguments = [quote_string(path), quote_string(format)]
+        settings = []
+        if compression and format in EXPORT_COMPRESSION_SETTINGS:
+            setting = EXPORT_COMPRESSION_SETTINGS[format]
+            settings.append(f"{setting} = {quote_string(compression)}")
+        elif compression:
+            arguments += ["'auto'", quote_string(compression)]
+        if overwrite:
+            settings.append("engine_file_truncate_on_insert = 1")
 
-        return result_dict
+        with self._collect_stats():
+            sql = self._get_sql().strip().rstrip(";")
+            columns = "*"
+            if format in INTEGER_DATE_FORMATS:
+                columns = self._export_columns(sql)
+            insert = f"INSERT INTO FUNCTION file({', '.join(arguments)})"
+            if partition_by:
+                insert += f" PARTITION BY {partition_by}"
+            insert += f" SELECT {columns} FROM ({sql})"
+            if settings:
+                insert += f" SETTINGS {', '.join(settings)}"
+            self._run(insert, "CSV", cache=False)
+        if self._result_cache is not None:
+            self._result_cache.invalidate(path.split("{")[0])
+
+    def _export_columns(self, sql: str) -> str:
+        """Columns of a query with dates widened to types files keep as dates"""
+        result = self._run(f"DESCRIBE TABLE ({sql})", "TabSeparatedRaw")
+        return date_preserving_columns(
+            line.split("\t")[:2] for line in result.bytes().decode().splitlines()
+        )
+
+    def to_table(
+        self,
+        name: str,
+        engine: str = "MergeTree",
+        order_by: Optional[Union[str, List[str]]] = None,
+        partition_by: Optional[str] = None,
+        if_exists: str = "fail",
+    ) -> "QueryBuilder":
+        """Write the query results to a table, without converting them to Python.
+
+        The table lives in the data path of this builder, e.g. the one of
+        synced or replicated tables, and outlives the session.
+
+        Args:
+            name: Table name, optionally with a database
+            engine: Table engine of a new table, e.g. MergeTree or Memory
+            order_by: Sorting key of a MergeTree table, none by default
+            partition_by: Partition key of a MergeTree table
+            if_exists: fail, append or replace when the table exists, a
+                replaced table is missing while the new one is written
+
+        Returns:
+            A QueryBuilder over the table
+        """
+        if if_exists not in ("fail", "append", "replace"):
+            raise ValueError(f"Unsupported if_exists: {if_exists}")
+        engine_clause = self._engine_clause(engine, order_by, partition_by)
+        with self._collect_stats():
+            sql = self._get_sql().strip().rstrip(";")
+            exists = False
+            if if_exists == "append":
+                result = self._run(f"EXISTS TABLE {name}", "TabSeparated", cache=False)
+                exists = result.bytes().strip() == b"1"
+            if exists:
+                # Table functions of the query otherwise take the structure of
+                # the table, and qualified columns of them read as NULL
+                self._run(
+                    f"INSERT INTO {name} SELECT * FROM ({sql}) SETTINGS "
+                    "use_structure_from_insertion_table_in_table_functions = 0",
+                    "CSV",
+                    cache=False,
+                )
+            else:
+                if if_exists == "replace":
+                    # CREATE OR REPLACE needs an Atomic database, in-memory
+                    # sessions have none
+                    self._run(f"DROP TABLE IF EXISTS {name}", "CSV", cache=False)
+                self._run(
+                    f"CREATE TABLE {name} {engine_clause} AS SELECT * FROM ({sql})",
+                    "CSV",
+                    cache=False,
+                )
+        # Results and schemas of an earlier table of the same name
+        get_schema_cache().invalidate(name)
+        if self._result_cache is not None:
+            self._result_cache.invalidate(name)
+
+        alias = name.split(".")[-1].strip("`")
+        builder = QueryBuilder(name, alias=alias, path=self._path)
+        builder._result_cache = self._result_cache
+        return builder
+
+    def drop(self) -> None:
+        """Drop the temporary table created by materialize() for this builder"""
+        if self._owned_table is not None:
+            self._owned_table.drop()
+
+    def __enter__(self) -> "QueryBuilder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.drop()
 
     def plot(self, **kwargs) -> None:
         """Generate a chart from query results using pandas plotting"""
@@ -349,17 +1238,22 @@ class QueryBuilder:
         return self.execute()
 
     def __str__(self) -> str:
-        """Return the current SQL query"""
-        return self._build_sql()
+        """Return the current SQL query, with the bound values inlined"""
+        return render_query_params(self._get_sql(), self._query_params())
 
     def get_schema(self) -> Dict[str, Union[List[str], Dict[str, str]]]:
-        """Extract schema information from the query builder."""
+        """Extract schema information from the query builder.
+
+        Column types of file, postgres and local tables are found with
+        DESCRIBE, cached per source state, see SchemaCache.
+        """
         schema = {}
 
         # Get schema from the main table
         if self.state.table_alias:
-            if self.state.schema:  # If we have column types
-                schema[self.state.table_alias] = self.state.schema
+            column_types = self._table_schema()
+            if column_types:  # If we have column types
+                schema[self.state.table_alias] = column_types
             else:
                 schema[self.state.table_alias] = self.state.select_fields or ["*"]
 
@@ -367,25 +1261,29 @@ class QueryBuilder:
         if self.state.joins:
             for join in self.state.joins:
                 if join.alias:
-                    # For file sources, we can't know the exact columns
                     # For API sources, we can get columns from DataReader
-                    if join.table_func.startswith("file("):
-                        schema[join.alias] = ["*"]  # All columns from file
-                    elif join.table_func.startswith("Python("):
-                        # Try to get columns from DataReader if available
-                        if hasattr(self, "_reader") and self._reader:
-                            schema[join.alias] = self._reader.get_schema() or ["*"]
+                    if join.table_func.startswith("Python("):
+                        # Try to get columns from the joined DataReader
+                        if join.reader:
+                            schema[join.alias] = join.reader.column_types or ["*"]
                         else:
                             schema[join.alias] = ["*"]
                     else:
-                        schema[join.alias] = ["*"]  # Default to all columns
+                        schema[join.alias] = get_schema_cache().get(
+                            join.table_func, self._path
+                        ) or ["*"]
 
         return schema
 
     def question(self, question: str) -> "QueryBuilder":
         """Generate SQL from a natural language question using Agent."""
         agent = Agent()
-        return agent.question_wrapper(self, question)
+        builder = agent.question_wrapper(self, question)
+        builder._path = self._path
+        builder._result_cache = self._result_cache
+        builder._materialized = list(self._materialized)
+        builder._profile = self._profile
+        return builder
 
     def table(self, name: str) -> "QueryBuilder":
         """Create a QueryBuilder for the specified table"""
@@ -395,7 +1293,6 @@ class QueryBuilder:
 
         # Get schema information if available
         if self._reader:
-            schema = self._reader.get_schema()
-            builder.state.schema = schema
+            builder.state.schema = dict(self._reader.column_types)
 
         return builder
@@ -0,0 +1,573 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from chdbpyreader.registry import READERS, PYTHON_TABLE_PATTERN
+from chdbpyreader.utils import quote_string
+from chainfunc.session_pool import get_pool
+
+DEFAULT_RESULT_CACHE_BYTES = 256 * 1024**2
+DEFAULT_RESULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "data-sdk", "results"
+)
+DEFAULT_POSTGRES_TTL = 60  # Seconds a result read from postgres is served
+
+FILE_TABLE_PATTERN = re.compile(r"file\('([^']+)'")
+# Tables a query reads, not table functions, e.g. FROM db.`table`
+LOCAL_TABLE_PATTERN = re.compile(
+    r"\b(?:FROM|JOIN)\s+((?:`[^`]+`|[A-Za-z_]\w*)(?:\.(?:`[^`]+`|[A-Za-z_]\w*))?)"
+    r"(?![\w`(])",
+    re.IGNORECASE,
+)
+# String literals are kept as they are when normalizing SQL
+SQL_TOKEN_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'|\s+")
+# The user and password arguments of postgresql() table functions
+_SQL_STRING = r"'(?:[^'\\]|\\.)*'"
+POSTGRES_CREDENTIALS_PATTERN = re.compile(
+    rf"(postgresql\(\s*{_SQL_STRING}\s*,\s*{_SQL_STRING}\s*,\s*{_SQL_STRING})"
+    rf"\s*,\s*{_SQL_STRING}\s*,\s*{_SQL_STRING}",
+    re.IGNORECASE,
+)
+
+# File extension of each kind of cached result
+RESULT_FILE_KINDS = {"arrow": "arrow", "bytes": "bin"}
+
+
+class BufferedResult:
+    """Query result held in memory, with the interface of a chDB result.
+
+    chDB results point into buffers owned by chDB, a cached result keeps
+    its own copy of the output.
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        rows_read: int = 0,
+        bytes_read: int = 0,
+        elapsed: float = 0.0,
+    ):
+        self._data = data
+        self._rows_read = rows_read
+        self._bytes_read = bytes_read
+        self._elapsed = elapsed
+
+    @classmethod
+    def from_result(cls, result: Any) -> "BufferedResult":
+        """Copy a chDB query result"""
+        return cls(
+            result.bytes(), result.rows_read(), result.bytes_read(), result.elapsed()
+        )
+
+    def bytes(self) -> bytes:
+        return self._data
+
+    def data(self) -> str:
+        return self._data.decode()
+
+    def size(self) -> int:
+        return len(self._data)
+
+    def rows_read(self) -> int:
+        return self._rows_read
+
+    def bytes_read(self) -> int:
+        return self._bytes_read
+
+    def elapsed(self) -> float:
+        return self._elapsed
+
+    def has_error(self) -> bool:
+        return False
+
+    def error_message(self) -> str:
+        return ""
+
+    def show(self) -> None:
+        print(self)
+
+    def __str__(self) -> str:
+        return self.data()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    disk_hits: int = 0  # Hits served by the disk tier, included in hits
+    misses: int = 0
+    evictions: int = 0  # Entries dropped from memory to stay within max_bytes
+    entries: int = 0
+    bytes: int = 0  # Size of the results held in memory
+
+
+def file_state(sql: str) -> List[Any]:
+    """Path, mtime and size of every file matched by the file() sources of SQL"""
+    parts: List[Any] = []
+    for pattern in FILE_TABLE_PATTERN.findall(sql):
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            try:
+                stat = os.stat(path)
+                parts.append(("file", path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                parts.append(("file", path, None, None))
+    return parts
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and drop a trailing semicolon, outside literals"""
+    sql = SQL_TOKEN_PATTERN.sub(
+        lambda m: m.group(0) if m.group(0).startswith("'") else " ", sql
+    )
+    return sql.strip().rstrip(";").strip()
+
+
+def redact_credentials(sql: str) -> str:
+    """Drop the user and password of postgresql() sources, for SQL written to disk.
+
+    The host, database and table stay, e.g. for invalidate() to match.
+    """
+    return POSTGRES_CREDENTIALS_PATTERN.sub(r"\1", sql)
+
+
+class ResultCache:
+    """Cache of query results keyed by SQL, output format and source state.
+
+    The key includes a fingerprint of every input of the query: path,
+    modification time and size of file() sources, the version of API
+    readers, see DataReader.refresh(), and the parts of local MergeTree
+    tables. Queries reading postgres expire after postgres_ttl. Queries
+    reading temporary or Memory tables, or Python objects that are not
+    registered readers, are not cached.
+
+    Results are held in memory up to max_bytes, least recently used first
+    out. With a directory, results only reading files and postgres are also
+    written there and outlive the process, shared by every process on the
+    host. Readers and local tables are only known to their process.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_RESULT_CACHE_BYTES,
+        directory: Optional[str] = None,
+        disk_max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        postgres_ttl: float = DEFAULT_POSTGRES_TTL,
+    ):
+        """Initialize ResultCache.
+
+        Args:
+            max_bytes: Size of the results held in memory
+            directory: Directory of the disk tier, None for memory only
+            disk_max_bytes: Size above which old results are removed from
+                disk, None for no bound
+            ttl: Seconds any result is served, None to serve results until
+                their sources change
+            postgres_ttl: Seconds a result reading postgres is served
+        """
+        self.max_bytes = max_bytes
+        self.directory = os.path.abspath(directory) if directory else None
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self.postgres_ttl = postgres_ttl
+        # key -> (result, size, expiry time or None, SQL)
+        self._entries: "OrderedDict[str, Tuple[Any, int, Optional[float], str]]" = (
+            OrderedDict()
+        )
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def fingerprint(
+        self, sql: str, path: Optional[str] = None
+    ) -> Optional[Tuple[List[Any], Optional[float], bool]]:
+        """State of the sources a query reads.
+
+        Args:
+            sql: Query
+            path: chDB data path of the session holding the local tables
+
+        Returns:
+            The fingerprint, the seconds the result may be served and whether
+            other processes may share it, or None if the query reads sources
+            the cache cannot follow
+        """
+        parts = file_state(sql)
+        ttl = self.ttl
+        shared = True
+        for name in PYTHON_TABLE_PATTERN.findall(sql):
+            reader = READERS.get(name)
+            if reader is None:
+                return None
+            # Reader names and versions are counters of this process
+            parts.append(("reader", name, reader.version))
+            shared = False
+        tables = LOCAL_TABLE_PATTERN.findall(sql)
+        if tables:
+            table_state = self._table_state(tables, path)
+            if table_state is None:
+                return None
+            if table_state:
+                parts.extend(table_state)
+                shared = False
+        if "postgresql(" in sql:
+            ttl = self.postgres_ttl if ttl is None else min(ttl, self.postgres_ttl)
+        return parts, ttl, shared
+
+    @staticmethod
+    def _table_state(tables: List[str], path: Optional[str]) -> Optional[List[Any]]:
+        """Parts of the local tables among names a query reads.
+
+        Names that are no table, e.g. aliases of subqueries, are skipped.
+
+        Returns:
+            UUID, creation time, and active parts, rows, last block number and
+            last modification of every MergeTree table, None if a table has
+            another engine or is temporary
+        """
+        conditions = []
+        for table in dict.fromkeys(tables):
+            database, _, name = table.replace("`", "").rpartition(".")
+            if database:
+                match = f"t.database = {quote_string(database)}"
+            else:
+                match = "(t.database = currentDatabase() OR t.is_temporary)"
+            conditions.append(f"({match} AND t.name = {quote_string(name)})")
+        result = get_pool(path).query(
+            "SELECT t.database, t.name, t.engine, t.is_temporary, toString(t.uuid), "
+            "toString(t.metadata_modification_time), p.parts, p.rows, p.blocks, "
+            "toString(p.modified) FROM system.tables AS t LEFT JOIN ("
+            "SELECT database, table, count() AS parts, sum(rows) AS rows, "
+            "max(max_block_number) AS blocks, max(modification_time) AS modified "
+            "FROM system.parts WHERE active GROUP BY database, table"
+            ") AS p ON t.database = p.database AND t.name = p.table "
+            f"WHERE {' OR '.join(conditions)} ORDER BY t.database, t.name",
+            "TabSeparatedRaw",
+        )
+        state: List[Any] = []
+        for line in result.bytes().decode().splitlines():
+            row = line.split("\t")
+            if row[3] != "0" or not row[2].endswith("MergeTree"):
+                return None
+            state.append(("table", *row[:2], *row[4:]))
+        return state
+
+    def key(
+        self,
+        sql: str,
+        output_format: str,
+        fingerprint: List[Any],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Cache key of a query result"""
+        payload = json.dumps(
+            [normalize_sql(sql), output_format, fingerprint, params or {}],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(
+        self,
+        sql: str,
+        output_format: str,
+        params: Optional[Dict[str, Any]] = None,
+        path: Optional[str] = None,
+    ) -> Tuple[Optional[str], Optional[float], bool, Any]:
+        """Return the cache key of a query, its TTL and its cached result.
+
+        Args:
+            sql: Query
+            output_format: chDB output format
+            params: Values of the query parameters
+            path: chDB data path of the session holding the local tables
+
+        Returns:
+            (key, ttl, shared, result), the key is None when the query cannot
+            be cached, shared whether the disk tier may hold the result, and
+            the result None on a miss
+        """
+        fingerprint = self.fingerprint(sql, path)
+        if fingerprint is None:
+            return None, None, False, None
+        parts, ttl, shared = fingerprint
+        key = self.key(sql, output_format, parts, params)
+        return key, ttl, shared, self.get(key, shared)
+
+    def get(self, key: str, shared: bool = True) -> Any:
+        """Return the cached result of a key, None on a miss.
+
+        Args:
+            key: Cache key, see lookup()
+            shared: Whether the result may come from the disk tier
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, _, expires, _ = entry
+                if expires is None or expires > now:
+                    self._entries.move_to_end(key)
+                    self._stats.hits += 1
+                    return result
+                self._drop(key)
+
+        loaded = self._load(key, now) if self.directory and shared else None
+        with self._lock:
+            if loaded is None:
+                self._stats.misses += 1
+                return None
+            result, expires, sql = loaded
+            self._stats.hits += 1
+            self._stats.disk_hits += 1
+            self._insert(key, result, expires, sql)
+        return result
+
+    def put(
+        self,
+        key: str,
+        result: Any,
+        sql: str,
+        ttl: Optional[float] = None,
+        shared: bool = True,
+    ) -> Any:
+        """Cache a query result and return the cached copy.
+
+        chDB results are copied into a BufferedResult and Arrow tables are
+        kept as they are, other results are returned without being cached.
+        Results that are not shared stay out of the disk tier.
+        """
+        kind = _result_kind(result)
+        if kind is None:
+            return result
+        if kind == "bytes" and not isinstance(result, BufferedResult):
+            result = BufferedResult.from_result(result)
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._insert(key, result, expires, sql)
+        if self.directory and shared:
+            self._store(key, result, kind, expires, sql)
+        return result
+
+    def invalidate(self, source: Optional[str] = None) -> int:
+        """Remove cached results.
+
+        Args:
+            source: Remove the results of queries mentioning this table,
+                file path or reader name, None to remove every result
+
+        Returns:
+            Number of results removed from memory
+        """
+        with self._lock:
+            keys = [
+                key
+                for key, (_, _, _, sql) in self._entries.items()
+                if source is None or source in sql
+            ]
+            for key in keys:
+                self._drop(key)
+        if self.directory:
+            for meta_path in glob.glob(os.path.join(self.directory, "*.json")):
+                meta = self._read_meta(meta_path)
+                if meta is not None and (source is None or source in meta["sql"]):
+                    self._remove_files(meta_path[: -len(".json")])
+        return len(keys)
+
+    def clear(self) -> None:
+        """Remove every cached result"""
+        self.invalidate()
+
+    @property
+    def stats(self) -> CacheStats:
+        """Hit, miss and eviction counts, and the current memory usage"""
+        with self._lock:
+            return CacheStats(**vars(self._stats))
+
+    def reset_stats(self) -> None:
+        """Reset the hit, miss and eviction counts"""
+        with self._lock:
+            self._stats.hits = self._stats.disk_hits = 0
+            self._stats.misses = self._stats.evictions = 0
+
+    def _insert(
+        self, key: str, result: Any, expires: Optional[float], sql: str
+    ) -> None:
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return  # Larger than the whole budget, only the disk tier holds it
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (result, size, expires, sql)
+        self._stats.entries += 1
+        self._stats.bytes += size
+        while self._stats.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self._stats.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, size, _, _ = self._entries.pop(key)
+        self._stats.entries -= 1
+        self._stats.bytes -= size
+
+    def _base_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _store(
+        self, key: str, result: Any, kind: str, expires: Optional[float], sql: str
+    ) -> None:
+        """Write a result and its metadata, renamed into place when complete"""
+        base = self._base_path(key)
+        path = f"{base}.{RESULT_FILE_KINDS[kind]}"
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        tmp_meta = f"{base}.json.{uuid.uuid4().hex}.tmp"
+        try:
+            if kind == "arrow":
+                import pyarrow as pa
+
+                with pa.OSFile(tmp_path, "wb") as sink:
+                    with pa.ipc.new_file(sink, result.schema) as writer:
+                        writer.write_table(result)
+            else:
+                with open(tmp_path, "wb") as f:
+                    f.write(result.bytes())
+            # Credentials of postgres sources stay out of the files
+            meta = {"kind": kind, "expires": expires, "sql": redact_credentials(sql)}
+            if kind == "bytes":
+                meta["counters"] = [
+                    result.rows_read(),
+                    result.bytes_read(),
+                    result.elapsed(),
+                ]
+            with open(tmp_meta, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, path)
+            os.replace(tmp_meta, f"{base}.json")
+        finally:
+            for tmp in (tmp_path, tmp_meta):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        self._evict_disk(keep=base)
+
+    def _load(self, key: str, now: float) -> Optional[Tuple[Any, Optional[float], str]]:
+        """Read a result of the disk tier, None if missing or expired"""
+        base = self._base_path(key)
+        meta = self._read_meta(f"{base}.json")
+        if meta is None:
+            return None
+        expires = meta["expires"]
+        if expires is not None and expires <= now:
+            self._remove_files(base)
+            return None
+        path = f"{base}.{RESULT_FILE_KINDS[meta['kind']]}"
+        try:
+            if meta["kind"] == "arrow":
+                import pyarrow as pa
+
+                with pa.OSFile(path, "rb") as source:
+                    result = pa.ipc.open_file(source).read_all()
+            else:
+                with open(path, "rb") as f:
+                    result = BufferedResult(f.read(), *meta.get("counters", []))
+            # The access time orders results for LRU eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None  # Removed or being replaced by another process
+        return result, expires, meta["sql"]
+
+    def _evict_disk(self, keep: str) -> None:
+        """Remove the least recently used results above disk_max_bytes"""
+        if self.disk_max_bytes is None:
+            return
+        results = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            base, ext = os.path.splitext(entry.path)
+            if ext.lstrip(".") not in RESULT_FILE_KINDS.values():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Removed by another process
+            total += stat.st_size
+            if base != keep:
+                results.append((stat.st_atime, stat.st_size, base))
+        for _, size, base in sorted(results):
+            if total <= self.disk_max_bytes:
+                break
+            self._remove_files(base)
+            total -= size
+
+    @staticmethod
+    def _read_meta(meta_path: str) -> Optional[dict]:
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _remove_files(base: str) -> None:
+        for ext in ("json", *RESULT_FILE_KINDS.values()):
+            try:
+                os.remove(f"{base}.{ext}")
+            except FileNotFoundError:
+                pass
+
+
+def _result_kind(result: Any) -> Optional[str]:
+    """How a result is cached, None if it is not"""
+    if hasattr(result, "schema") and hasattr(result, "to_batches"):
+        return "arrow"
+    if hasattr(result, "bytes") and hasattr(result, "rows_read"):
+        return "bytes"
+    return None
+
+
+def _result_size(result: Any) -> int:
+    if isinstance(result, BufferedResult):
+        return result.size()
+    return result.nbytes
+
+
+_default_cache: Optional[ResultCache] = None
+_default_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Return the default result cache of the process, in memory only"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
+
+
+def configure_result_cache(
+    max_bytes: int = DEFAULT_RESULT_CACHE_BYTES,
+    directory: Optional[str] = None,
+    disk_max_bytes: Optional[int] = None,
+    ttl: Optional[float] = None,
+    postgres_ttl: float = DEFAULT_POSTGRES_TTL,
+) -> ResultCache:
+    """Replace the default result cache, see ResultCache for the arguments"""
+    global _default_cache
+    with _default_lock:
+        _default_cache = ResultCache(
+            max_bytes,
+            directory=directory,
+            disk_max_bytes=disk_max_bytes,
+            ttl=ttl,
+            postgres_ttl=postgres_ttl,
+        )
+        return _default_cache
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from chainfunc.session_pool import get_pool
+from chainfunc.result_cache import file_state, normalize_sql, redact_credentials
+
+DEFAULT_SCHEMA_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "data-sdk", "schemas"
+)
+DEFAULT_POSTGRES_SCHEMA_TTL = 300  # Seconds a postgres schema is served
+
+
+class SchemaCache:
+    """Column types of tables and table functions, found with DESCRIBE.
+
+    DESCRIBE infers the schema of a file() source from the file contents
+    and asks the server for a postgresql() source. Schemas of files are
+    served until a matching file changes, schemas of postgres tables for
+    postgres_ttl. Both are also written to the directory, shared by every
+    process on the host. Schemas of local tables are kept in memory until
+    invalidate(). Python() tables are not supported, their readers know
+    their column types.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = DEFAULT_SCHEMA_CACHE_DIR,
+        postgres_ttl: float = DEFAULT_POSTGRES_SCHEMA_TTL,
+    ):
+        """Initialize SchemaCache.
+
+        Args:
+            directory: Directory of the schemas of file and postgres sources,
+                None for memory only
+            postgres_ttl: Seconds a postgres schema is served
+        """
+        self.directory = os.path.abspath(directory) if directory else None
+        self.postgres_ttl = postgres_ttl
+        # key -> (schema, expiry time or None, table)
+        self._entries: Dict[str, Tuple[Dict[str, str], Optional[float], str]] = {}
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, table: str, path: Optional[str] = None) -> Dict[str, str]:
+        """Column types by name of a table or table function.
+
+        Args:
+            table: Table name, table function or subquery in parentheses
+            path: chDB data path of the session holding local tables
+        """
+        table = normalize_sql(table)
+        files = file_state(table)
+        postgres = "postgresql(" in table
+        # Sources outside of the session have the same schema in any process
+        shared = bool(files) or postgres
+        key = hashlib.sha256(
+            json.dumps([table, None if shared else path, files], default=str).encode()
+        ).hexdigest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and (entry[1] is None or entry[1] > now):
+            return dict(entry[0])
+        if shared and self.directory:
+            loaded = self._load(key, now)
+            if loaded is not None:
+                with self._lock:
+                    self._entries[key] = loaded
+                return dict(loaded[0])
+
+        result = get_pool(path).query(f"DESCRIBE TABLE {table}", "TabSeparatedRaw")
+        schema = dict(
+            line.split("\t")[:2] for line in result.bytes().decode().splitlines()
+        )
+        expires = now + self.postgres_ttl if postgres else None
+        with self._lock:
+            self._entries[key] = (schema, expires, table)
+        if shared and self.directory:
+            self._store(key, schema, expires, table)
+        return dict(schema)
+
+    def invalidate(self, source: Optional[str] = None) -> int:
+        """Remove cached schemas.
+
+        Args:
+            source: Remove the schemas of tables mentioning this table name
+                or file path, None to remove every schema
+
+        Returns:
+            Number of schemas removed from memory
+        """
+        with self._lock:
+            keys = [
+                key
+                for key, (_, _, table) in self._entries.items()
+                if source is None or source in table
+            ]
+            for key in keys:
+                del self._entries[key]
+        if self.directory:
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".json"):
+                    continue
+                meta = self._read(entry.path)
+                if meta is not None and (source is None or source in meta["table"]):
+                    self._remove(entry.path)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Remove every cached schema"""
+        self.invalidate()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(
+        self, key: str, now: float
+    ) -> Optional[Tuple[Dict[str, str], Optional[float], str]]:
+        """Read a schema from the directory, None if missing or expired"""
+        meta = self._read(self._path(key))
+        if meta is None:
+            return None
+        if meta["expires"] is not None and meta["expires"] <= now:
+            self._remove(self._path(key))
+            return None
+        return dict(meta["schema"]), meta["expires"], meta["table"]
+
+    def _store(
+        self, key: str, schema: Dict[str, str], expires: Optional[float], table: str
+    ) -> None:
+        """Write a schema to the directory, renamed into place"""
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        columns: List[List[Any]] = [list(column) for column in schema.items()]
+        # The key stands for the table, only invalidate() matches the name,
+        # so the credentials of postgres sources stay out of the file
+        table = redact_credentials(table)
+        with open(tmp_path, "w") as f:
+            json.dump({"table": table, "expires": expires, "schema": columns}, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_default_cache: Optional[SchemaCache] = None
+_default_lock = threading.Lock()
+
+
+def get_schema_cache() -> SchemaCache:
+    """Return the default schema cache of the process"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SchemaCache()
+        return _default_cache
+
+
+def configure_schema_cache(
+    directory: Optional[str] = DEFAULT_SCHEMA_CACHE_DIR,
+    postgres_ttl: float = DEFAULT_POSTGRES_SCHEMA_TTL,
+) -> SchemaCache:
+    """Replace the default schema cache, see SchemaCache for the arguments"""
+    global _default_cache
+    with _default_lock:
+        _default_cache = SchemaCache(directory, postgres_ttl=postgres_ttl)
+        return _default_cache
@@ -0,0 +1,301 @@
+import atexit
+import os
+import queue
+import threading
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+import chdb
+from chdbpyreader.utils import query_params_setting
+from chainfunc.profile import PROFILE_EVENTS, peak_rss, reset_peak_rss
+
+DEFAULT_POOL_SIZE = 4
+MEMORY_PATH = ":memory:"
+
+# Pools not closed yet, closed at interpreter exit, see _close_pools()
+_open_pools: "weakref.WeakSet[SessionPool]" = weakref.WeakSet()
+
+
+class SessionPool:
+    """Pool of persistent chDB connections on one data path.
+
+    chdb.query() opens and closes a connection for every query, which costs
+    more than a small query itself. Pooled connections stay open, so
+    settings, temporary tables and caches persist between queries.
+
+    All connections of a process share one chDB engine on one data path,
+    and closing any of them closes the engine. Queries must therefore go
+    through the pool, not chdb.query(), while the pool is open.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        size: int = DEFAULT_POOL_SIZE,
+        timeout: Optional[float] = None,
+    ):
+        """Initialize SessionPool.
+
+        Args:
+            path: chDB data path, None for an in-memory session
+            size: Maximum number of connections checked out at the same time
+            timeout: Seconds to wait for a free connection, None to wait forever
+        """
+        self.path = os.path.abspath(path) if path else MEMORY_PATH
+        self.size = max(size, 1)
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self._connections: List[Any] = []
+        self._lock = threading.Lock()
+        self._query_lock = threading.Lock()
+        self._local = threading.local()
+        # Threads reading the results of a running query, see streaming()
+        self._streaming_threads: Set[int] = set()
+        self._closed = False
+        # Statements run before the next query, see defer()
+        self._deferred: "deque[str]" = deque()
+        _open_pools.add(self)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Check out a connection for the current thread.
+
+        Nested checkouts in the same thread get the same connection, so a
+        query can run while its caller holds a connection.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._idle.put(conn)
+
+    @contextmanager
+    def streaming(self) -> Iterator[None]:
+        """Mark the current thread as reading the results of a running query.
+
+        The running query holds the pool until its results are read, so a
+        query of the reading thread would wait for itself forever. Such
+        queries raise RuntimeError instead.
+        """
+        thread = threading.get_ident()
+        self._check_not_streaming()
+        with self._lock:
+            self._streaming_threads.add(thread)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._streaming_threads.discard(thread)
+
+    def _check_not_streaming(self) -> None:
+        if threading.get_ident() in self._streaming_threads:
+            raise RuntimeError(
+                "Cannot run a query while reading the results of another one "
+                "in the same thread, e.g. inside an iter_batches() loop. It "
+                "would wait for the running query, which waits for its "
+                "results to be read."
+            )
+
+    def query(
+        self,
+        sql: str,
+        output_format: str = "CSV",
+        params: Optional[Dict[str, Any]] = None,
+        profile: Optional[Dict[str, int]] = None,
+    ) -> Any:
+        """Run a query on a pooled connection, see chdb.query()
+
+        Args:
+            sql: Query, may hold {name:Type} parameter placeholders
+            output_format: chDB output format
+            params: Values of the query parameters by name
+            profile: Optional dictionary receiving the PROFILE_EVENTS
+                counters of the query and, on Linux, ProcessPeakMemory: how
+                much the resident memory of the whole process grew at its
+                peak while the query ran, see reset_peak_rss()
+
+        Raises:
+            RuntimeError: If the current thread reads the results of a
+                running query, see streaming()
+        """
+        self._check_not_streaming()
+        with self.connection() as conn:
+            # chDB runs one query at a time anyway, but a connection waiting
+            # for it holds the GIL and deadlocks a query reading a Python()
+            # table, so queries wait here instead. Parameters are settings of
+            # the session all connections share, bound under the same lock.
+            with self._query_lock:
+                self._run_deferred(conn)
+                if params:
+                    conn.query(query_params_setting(params))
+                if profile is None:
+                    return conn.query(sql, output_format)
+                # Queries run one at a time, so the process counters only
+                # move for this query (and a few rows for reading them)
+                before = self._counters(conn)
+                start_rss = reset_peak_rss()
+                result = conn.query(sql, output_format)
+                end_rss = peak_rss()
+                after = self._counters(conn)
+                for name in PROFILE_EVENTS:
+                    profile[name] = after.get(name, 0) - before.get(name, 0)
+                if start_rss is not None and end_rss is not None:
+                    profile["ProcessPeakMemory"] = max(end_rss - start_rss, 0)
+                return result
+
+    @staticmethod
+    def _counters(conn: Any) -> Dict[str, int]:
+        """Process counters of chDB"""
+        events = ", ".join(f"'{name}'" for name in PROFILE_EVENTS)
+        result = conn.query(
+            f"SELECT event, value FROM system.events WHERE event IN ({events})",
+            "TabSeparated",
+        )
+        counters = {}
+        for line in result.bytes().decode().splitlines():
+            name, value = line.split("\t")
+            counters[name] = int(value)
+        return counters
+
+    def defer(self, sql: str) -> None:
+        """Run a statement before the next query of the pool.
+
+        Safe from finalizers, which may run while a query holds the pool.
+        Failures of deferred statements are ignored.
+        """
+        self._deferred.append(sql)
+
+    def run_deferred(self) -> None:
+        """Run the deferred statements now"""
+        if not self._deferred:
+            return
+        with self.connection() as conn:
+            with self._query_lock:
+                self._run_deferred(conn)
+
+    def _run_deferred(self, conn: Any) -> None:
+        while self._deferred:
+            try:
+                conn.query(self._deferred.popleft())
+            except (IndexError, RuntimeError):
+                pass  # Taken by another thread, or e.g. a table already gone
+
+    def _acquire(self) -> Any:
+        """Take an idle connection, opening one while below size"""
+        if self._closed:
+            raise RuntimeError("Session pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.size:
+                # Opening a connection waits for running queries like query()
+                with self._query_lock:
+                    conn = chdb.connect(self.path)
+                self._connections.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"No chDB connection free after {self.timeout} seconds"
+            ) from None
+
+    def has_tables(self) -> bool:
+        """Whether the session holds tables, temporary ones included"""
+        if not self._connections:
+            return False
+        result = self.query(
+            "SELECT count() FROM system.tables WHERE is_temporary "
+            "OR database NOT IN ('system', 'information_schema', "
+            "'INFORMATION_SCHEMA')",
+            "TabSeparated",
+        )
+        return int(result.bytes()) > 0
+
+    def close(self) -> None:
+        """Close the connections, and with them the chDB engine"""
+        with self._lock:
+            self._closed = True
+            connections, self._connections = self._connections, []
+        _open_pools.discard(self)
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass  # Closing one connection already closed the others
+
+
+@atexit.register
+def _close_pools() -> None:
+    """Close the open pools before the interpreter tears down chDB.
+
+    A connection still open at exit is closed by chDB's own destructors
+    after Python() readers are gone, which crashes the process.
+    """
+    for pool in list(_open_pools):
+        pool.close()
+
+
+_default_pool: Optional[SessionPool] = None
+_default_lock = threading.Lock()
+
+
+def get_pool(path: Optional[str] = None) -> SessionPool:
+    """Return the default session pool of the process.
+
+    chDB opens one data path per process. The default pool starts in memory
+    and moves to the first data path asked for while the in-memory session
+    holds no tables. Call configure_pool() with the data path up front to
+    keep tables of the session, e.g. the ones of materialize().
+
+    Args:
+        path: chDB data path the caller needs, None for any
+
+    Raises:
+        ValueError: If the default pool is already open on another path, or
+            in memory with tables that moving would drop
+    """
+    global _default_pool
+    with _default_lock:
+        pool = _default_pool
+        if pool is not None and (path is None or pool.path == os.path.abspath(path)):
+            return pool
+        if pool is not None and pool.path != MEMORY_PATH:
+            raise ValueError(
+                f"chDB is already open on {pool.path}, cannot open {path} as well"
+            )
+        if pool is not None and pool.has_tables():
+            raise ValueError(
+                f"The in-memory chDB session holds tables, opening {path} would "
+                f"drop them. Call configure_pool({path!r}) before creating them."
+            )
+        size = pool.size if pool else DEFAULT_POOL_SIZE
+        timeout = pool.timeout if pool else None
+        if pool is not None:
+            pool.close()
+        _default_pool = SessionPool(path, size=size, timeout=timeout)
+        return _default_pool
+
+
+def configure_pool(
+    path: Optional[str] = None,
+    size: int = DEFAULT_POOL_SIZE,
+    timeout: Optional[float] = None,
+) -> SessionPool:
+    """Replace the default session pool, see SessionPool for the arguments"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is not None:
+            _default_pool.close()
+        _default_pool = SessionPool(path, size=size, timeout=timeout)
+        return _default_pool
@@ -1,31 +1,492 @@
+import re
 import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import chdb
-from mock_api.api import get_data
-from chdb.utils import infer_data_types, convert_to_columnar
+import numpy as np
+from mock_api.api import get_data, FILTER_OPERATORS
+from chdbpyreader.utils import (
+    DEFAULT_SAMPLE_SIZE,
+    base_type,
+    chdb_dtype,
+    infer_data_types,
+    convert_to_columnar,
+    numpy_dtype,
+    python_table_type,
+    to_numpy_columns,
+    value_shape,
+)
+from chdbpyreader.prefetch import (
+    PagePrefetcher,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_QUEUE_DEPTH,
+)
+from chdbpyreader.registry import READERS
+
+DEFAULT_PAGE_SIZE = 10000
+SCHEMA_SAMPLE_ROWS = DEFAULT_SAMPLE_SIZE
+# Filter operators the source can evaluate, see DataReader.scan
+PUSHDOWN_OPERATORS = frozenset(FILTER_OPERATORS)
+# Operators comparing a column with a list of values
+LIST_OPERATORS = {"IN", "NOT IN", "BETWEEN"}
+# Operators true for the NaN chDB reads for nulls
+NEGATED_OPERATORS = {"!=", "<>", "NOT IN"}
+# Largest integer a Float64 holds with every integer below it
+FLOAT64_EXACT_INT = 2**53
+
+Filters = List[Tuple[str, str, Any]]
+
+
+def streamed_type(col_type: str, values: List[Any]) -> str:
+    """Type of a column inferred from the first rows of a streamed collection.
+
+    Later pages may hold floats or nulls in a column of integers or booleans
+    sampled without them, so such columns are read as Float64 when it holds
+    the sampled values exactly. Other types are kept.
+    """
+    if "Nullable(" in col_type:
+        return col_type  # Already read as Float64 or String
+    inner = base_type(col_type)
+    if inner == "Bool":
+        return "Float64"
+    if inner.startswith(("Int", "UInt")):
+        exact = all(abs(v) <= FLOAT64_EXACT_INT for v in values if v is not None)
+        return "Float64" if exact else col_type
+    return col_type
 
 
 class DataReader(chdb.PyReader):
-    def __init__(self, table_name: str):
+    def __init__(
+        self,
+        table_name: str,
+        streaming: bool = False,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        prefetch: bool = False,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        queue_depth: int = DEFAULT_QUEUE_DEPTH,
+        sample_rows: int = SCHEMA_SAMPLE_ROWS,
+    ):
+        """Initialize DataReader.
+
+        Columns are fetched from the source only when chDB reads them, so a
+        query touching two columns of a wide collection only transfers and
+        converts those two columns. Fetched columns are kept as typed NumPy
+        arrays and every read() returns views into them.
+
+        The reader is registered under a unique name, see `name`. Queries
+        read it through scans (see scan()), each with its own cursor, so the
+        same reader can be used by concurrent queries and self-joins.
+
+        Args:
+            table_name: Name of the API collection to read
+            streaming: Fetch pages lazily from the source while chDB reads,
+                instead of loading the whole collection on the first read
+            page_size: Number of rows requested from the source per page
+            prefetch: Fetch the following pages in background threads while
+                chDB consumes the current one, implies streaming
+            concurrency: Number of pages fetched at the same time when prefetching
+            queue_depth: Maximum number of pages fetched ahead when prefetching
+            sample_rows: Number of rows fetched to infer the column types of
+                a streamed collection, a larger collection read without
+                streaming is loaded whole and typed from every row
+        """
         self.table_name = table_name
-        raw_data = get_data(table_name)["data"]
-        self.data = convert_to_columnar(raw_data)
+        self.streaming = streaming or prefetch
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+
+        # Columns loaded for the whole collection, shared by non-streaming scans
+        self._cache_lock = threading.Lock()
+        self._cached_pushdown = None
+        self._cached_columns: Dict[str, np.ndarray] = {}
+        self._cached_rows = 0
+        # Incremented by refresh(), identifies the source data of cached results
+        self.version = 0
+
+        # A sample with every field is enough to know the schema, a sample
+        # shorter than requested is the whole collection
+        rows = get_data(table_name, limit=sample_rows)["data"]
+        complete = len(rows) < sample_rows
+        loaded = not complete and not self.streaming
+        if loaded:
+            # The first query loads the whole collection anyway, loading it
+            # now types the columns from every value before chDB reads them
+            rows = get_data(table_name)["data"]
+            complete = True
+        sample = convert_to_columnar(rows)
+        # ClickHouse type chDB reads each column as, e.g. DateTime, or
+        # Float64 for integers with nulls, see python_table_type
+        self.sample_rows = sample_rows
+        inferred = infer_data_types(
+            sample, sample_size=max(sample_rows, len(rows)), complete=complete
+        )
+        # Numeric columns of a streamed collection whose later pages may hold
+        # floats or nulls, see streamed_type
+        self._unsampled = set()
+        if not complete:
+            for col, col_type in inferred.items():
+                streamed = streamed_type(col_type, sample[col])
+                if streamed != col_type:
+                    inferred[col] = streamed
+                    self._unsampled.add(col)
+        self.column_types = {
+            col: python_table_type(col_type) for col, col_type in inferred.items()
+        }
+        # Columns with nulls, which chDB reads as NaN or empty strings
+        self._nullable = {
+            col for col, col_type in inferred.items() if "Nullable(" in col_type
+        }
+        # Shapes of the sampled strings of temporal columns, e.g. 0000-00-00
+        self._value_shapes = {
+            col: {value_shape(v) for v in sample[col] if isinstance(v, str)}
+            for col, col_type in self.column_types.items()
+            if base_type(col_type).startswith("Date")
+        }
+        if loaded:
+            # Served to the scans without pushed down filters
+            self._cached_pushdown = ([], None)
+            self._cached_rows = len(rows)
+            self._cached_columns = self._to_arrays(rows, list(self.column_types))
+        self.data: Dict[str, np.ndarray] = {}
+        super().__init__(self.data)
+
+        self.name = READERS.register(self, re.sub(r"\W", "_", table_name))
+        # Scan used when chDB reads this reader directly as Python(reader)
+        self._scan = self.scan()
+
+    def get_schema(self):
+        """Column names and the types chDB reads them as, see column_types"""
+        return [
+            (name, chdb_dtype(col_type)) for name, col_type in self.column_types.items()
+        ]
+
+    def scan(
+        self, filters: Optional[Filters] = None, limit: Optional[int] = None
+    ) -> "ReaderScan":
+        """Create a scan of the collection for one table reference of a query.
+
+        chDB still evaluates the full WHERE and LIMIT of the query, so pushed
+        filters only need to be a subset of the query conditions.
+
+        Args:
+            filters: (field, operator, value) conditions the source applies
+            limit: Maximum number of rows to fetch, None for no limit
+        """
+        return ReaderScan(self, filters, limit)
+
+    def can_push_down(self, field: str, operator: str, value: Any) -> bool:
+        """Whether the source can apply a filter without dropping rows chDB keeps.
+
+        The source compares JSON values as Python does, chDB first converts
+        the value to the column type, e.g. '2' to 2 for an integer column.
+        Filters are only pushed down when the value already has the type of
+        the column: numbers for numeric columns, booleans for Bool columns,
+        and strings for string columns, shaped like the source values for
+        temporal ones. Filters on columns with nulls are never pushed down,
+        chDB compares the NaN or empty string it reads for them.
+
+        Args:
+            field: Column of the filter
+            operator: Filter operator, see PUSHDOWN_OPERATORS
+            value: Filter value, a list of values for IN and BETWEEN
+        """
+        operator = operator.upper()
+        if operator not in PUSHDOWN_OPERATORS or field not in self.column_types:
+            return False
+        if field in self._nullable:
+            return False
+        if field in self._unsampled and operator in NEGATED_OPERATORS:
+            # Rows of later pages may lack the field, chDB keeps their NaN
+            return False
+        values = [value]
+        if operator in LIST_OPERATORS:
+            if not isinstance(value, (list, tuple, set, frozenset)):
+                return False
+            values = list(value)
+        return all(self._comparable(field, v) for v in values)
+
+    def _comparable(self, field: str, value: Any) -> bool:
+        """Whether Python compares a value with the column like chDB"""
+        col_type = base_type(self.column_types[field])
+        if isinstance(value, bool):
+            return col_type == "Bool"
+        if isinstance(value, (int, float)):
+            return col_type.startswith(("Int", "UInt", "Float"))
+        if not isinstance(value, str):
+            return False
+        if col_type.startswith("Date"):
+            # ISO strings of one shape sort like the times they stand for
+            return self._value_shapes.get(field) == {value_shape(value)}
+        return col_type == "String"
+
+    def push_down(
+        self, filters: Optional[Filters] = None, limit: Optional[int] = None
+    ) -> None:
+        """Restart the direct scan of this reader with pushed down filters"""
+        self._scan.close()
+        self._scan = self.scan(filters, limit)
+
+    def read(self, col_names, count):
+        return self._scan.read(col_names, count)
+
+    def refresh(self) -> None:
+        """Drop the loaded columns, later scans fetch the collection again"""
+        with self._cache_lock:
+            self._cached_columns = {}
+            self._cached_pushdown = None
+            self._cached_rows = 0
+            self.version += 1
+
+    def max_value(self, field: str, filters: Optional[Filters] = None) -> Any:
+        """Largest value of a field in the source, as the source represents it.
+
+        Values of temporal columns are ordered as times, not as strings, so
+        e.g. 2024-01-20T09:00:00 sorts before 2024-01-20 10:00:00.
+
+        Args:
+            field: Column to read
+            filters: (field, operator, value) conditions the source applies
+
+        Returns:
+            The largest non-null value, None if the source has none
+        """
+        key = None
+        if base_type(self.column_types.get(field, "String")).startswith("Date"):
+            key = np.datetime64
+        largest = None
+        for rows in self._fetch_rows([field], list(filters or []), None):
+            values = [row[field] for row in rows if row.get(field) is not None]
+            if largest is not None:
+                values.append(largest)
+            if values:
+                largest = max(values, key=key)
+        return largest
+
+    def _to_arrays(
+        self, rows: List[Dict[str, Any]], fields: List[str]
+    ) -> Dict[str, np.ndarray]:
+        """Convert fetched rows to the arrays chDB reads for their types.
+
+        Every requested field gets a column, of nulls when no row has it.
+
+        Raises:
+            ValueError: If a column holds values its type cannot hold, e.g.
+                strings in a Float64 column. Only the types of streamed
+                collections, inferred from their first sample_rows rows, and
+                of collections changed since the reader was created can miss
+                values. chDB already planned the query with the type, so the
+                values are not converted to something they are not.
+        """
+        columns = convert_to_columnar(rows, self.column_types)
+        for col in fields:
+            columns.setdefault(col, [None] * len(rows))
+        arrays = to_numpy_columns(columns, self.column_types)
+        for col, array in arrays.items():
+            col_type = self.column_types.get(col, "String")
+            dtype = numpy_dtype(col_type)
+            if dtype is not None and array.dtype != dtype:
+                raise ValueError(
+                    f"Column {col} of {self.table_name} holds values its type "
+                    f"{col_type} cannot hold. Sample more rows, read the "
+                    f"collection without streaming, or create a new reader "
+                    f"after the source changed."
+                )
+        return arrays
+
+    def _fetch_page(
+        self, offset: int, limit: int, fields: List[str], filters: Filters
+    ) -> Tuple[Dict[str, np.ndarray], int]:
+        """Fetch one page of the requested fields as typed arrays.
+
+        Returns:
+            The arrays, and the number of rows of the page
+        """
+        rows = get_data(
+            self.table_name,
+            fields=fields,
+            filters=filters,
+            offset=offset,
+            limit=limit,
+        )["data"]
+        return self._to_arrays(rows, fields), len(rows)
+
+    def _iter_pages(
+        self, fields: List[str], filters: Filters, limit: Optional[int]
+    ) -> Iterator[Tuple[Dict[str, np.ndarray], int]]:
+        """Iterate over the requested fields of the collection page by page,
+        with the number of rows of each page"""
+        if self.prefetch:
+            return PagePrefetcher(
+                lambda offset, size: self._fetch_page(offset, size, fields, filters),
+                self.page_size,
+                limit=limit,
+                concurrency=self.concurrency,
+                queue_depth=self.queue_depth,
+            )
+        return self._fetch_pages(fields, filters, limit)
+
+    def _fetch_pages(
+        self, fields: List[str], filters: Filters, limit: Optional[int]
+    ) -> Iterator[Tuple[Dict[str, np.ndarray], int]]:
+        """Yield the requested fields of the collection page by page, with
+        the number of rows of each page"""
+        for rows in self._fetch_rows(fields, filters, limit):
+            yield self._to_arrays(rows, fields), len(rows)
+
+    def _fetch_rows(
+        self, fields: List[str], filters: Filters, limit: Optional[int]
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the rows of the collection page by page"""
+        offset = 0
+        while limit is None or offset < limit:
+            page_size = self.page_size
+            if limit is not None:
+                page_size = min(page_size, limit - offset)
+            rows = get_data(
+                self.table_name,
+                fields=fields,
+                filters=filters,
+                offset=offset,
+                limit=page_size,
+            )["data"]
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            offset += len(rows)
+
+    def _load_columns(
+        self, col_names: List[str], filters: Filters, limit: Optional[int]
+    ) -> Tuple[Dict[str, np.ndarray], int]:
+        """Return the requested columns for the whole collection.
+
+        Columns not loaded yet are fetched and kept for later scans with the
+        same filters and limit.
+        """
+        with self._cache_lock:
+            pushdown = (filters, limit)
+            if pushdown != self._cached_pushdown:
+                # Loaded columns only hold the rows matching the previous pushdown
+                self._cached_columns = {}
+                self._cached_pushdown = pushdown
+            missing = [col for col in col_names if col not in self._cached_columns]
+            if missing:
+                raw_data = get_data(
+                    self.table_name, fields=missing, filters=filters, limit=limit
+                )["data"]
+                self._cached_rows = len(raw_data)
+                self._cached_columns.update(self._to_arrays(raw_data, missing))
+            return dict(self._cached_columns), self._cached_rows
+
+
+class ReaderScan(chdb.PyReader):
+    """One scan of a DataReader, with its own cursor and pushed down filters.
+
+    Every table reference of a query reads through its own scan, so concurrent
+    queries and self-joins on the same reader never share a cursor.
+    """
+
+    def __init__(
+        self,
+        reader: DataReader,
+        filters: Optional[Filters] = None,
+        limit: Optional[int] = None,
+    ):
+        self.reader = reader
+        self.table_name = reader.table_name
         self.cursor = 0
+        self._filters: Filters = list(filters or [])
+        self._limit = limit
+        self._pages: Optional[Iterator[Tuple[Dict[str, np.ndarray], int]]] = None
+        self._num_rows = 0
+        self._cancelled = False
+        # What the scan served to chDB, and the time chDB waited for it
+        self.rows_read = 0
+        self.bytes_read = 0
+        self.batches = 0
+        self.read_seconds = 0.0
+        self.data: Dict[str, np.ndarray] = {}
         super().__init__(self.data)
 
     def get_schema(self):
-        return infer_data_types(self.data)
+        return self.reader.get_schema()
 
     def read(self, col_names, count):
-        if not self.data or self.cursor >= len(next(iter(self.data.values()))):
+        start = time.perf_counter()
+        batch = self._read(col_names, count)
+        self.read_seconds += time.perf_counter() - start
+        if batch:
+            self.batches += 1
+            self.rows_read += len(batch[0])
+            self.bytes_read += sum(getattr(col, "nbytes", 0) for col in batch)
+        return batch
+
+    def _read(self, col_names, count):
+        if self._cancelled:
+            self.close()
+            return []
+        if self.reader.streaming:
+            return self._read_streaming(col_names, count)
+
+        if self.cursor == 0:
+            self.data, self._num_rows = self.reader._load_columns(
+                list(col_names), self._filters, self._limit
+            )
+
+        if not self.data or self.cursor >= self._num_rows:
             self.cursor = 0
             return []
 
         start = self.cursor
-        end = min(start + count, len(next(iter(self.data.values()))))
+        end = min(start + count, self._num_rows)
         self.cursor = end
 
         return [self.data[col][start:end] for col in col_names]
 
+    def _read_streaming(self, col_names, count):
+        """Serve a batch from the current page, fetching the next page when done"""
+        if self._pages is None:
+            self._pages = self.reader._iter_pages(
+                list(col_names), self._filters, self._limit
+            )
+            self._num_rows = 0
+            self.cursor = 0
+
+        while self.cursor >= self._num_rows:
+            page = next(self._pages, None)
+            if page is None:
+                # End of the collection, the next scan starts from the first page
+                self.close()
+                return []
+            # Replacing the buffer releases the consumed page
+            self.data, self._num_rows = page
+            self.cursor = 0
+
+        start = self.cursor
+        end = min(start + count, self._num_rows)
+        self.cursor = end
+
+        return [self.data[col][start:end] for col in col_names]
+
+    def cancel(self) -> None:
+        """End the scan early, chDB sees the end of the collection.
+
+        Safe from any thread, the next read() releases the scan.
+        """
+        self._cancelled = True
+
+    def close(self) -> None:
+        """Stop the page iteration and release the buffered page"""
+        if self._pages is not None:
+            self._pages.close()
+            self._pages = None
+        self.data = {}
+        self._num_rows = 0
+        self.cursor = 0
+
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,103 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional, Tuple
+import numpy as np
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_QUEUE_DEPTH = 8
+
+
+class PagePrefetcher:
+    """Iterate over source pages while the following pages are fetched.
+
+    Pages are requested by offset on a small thread pool, so the latency of
+    several slow requests overlaps with each other and with chDB consuming the
+    current page. At most queue_depth pages are in flight or waiting to be
+    consumed, which bounds memory whatever the speed of the consumer.
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[[int, int], Tuple[Dict[str, np.ndarray], int]],
+        page_size: int,
+        limit: Optional[int] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        queue_depth: int = DEFAULT_QUEUE_DEPTH,
+    ):
+        """Initialize PagePrefetcher.
+
+        Args:
+            fetch_page: Function fetching (offset, limit) rows as columnar
+                arrays, returning them with the number of rows the source
+                returned
+            page_size: Number of rows requested per page
+            limit: Maximum number of rows to fetch, None for no limit
+            concurrency: Number of pages fetched at the same time
+            queue_depth: Maximum number of pages fetched ahead of the consumer
+        """
+        self._fetch_page = fetch_page
+        self._page_size = page_size
+        self._limit = limit
+        self._queue_depth = max(queue_depth, 1)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(concurrency, 1), thread_name_prefix="page-prefetch"
+        )
+        self._pending: Deque[Tuple[int, Future]] = deque()
+        self._next_offset = 0
+        self._exhausted = False
+
+    def __iter__(self) -> "PagePrefetcher":
+        return self
+
+    def __next__(self) -> Tuple[Dict[str, np.ndarray], int]:
+        while True:
+            self._fill()
+            if not self._pending:
+                self.close()
+                raise StopIteration
+
+            size, future = self._pending.popleft()
+            try:
+                page = future.result()
+            except BaseException:
+                self.close()
+                raise
+
+            # Rows lacking every requested field still count, the page
+            # has no columns then
+            rows = page[1]
+            if rows < size:
+                # A short page is the end of the collection, later requests
+                # can only return empty pages
+                self._exhausted = True
+                self._cancel_pending()
+            if rows:
+                return page
+
+    def _fill(self) -> None:
+        """Request pages until the queue is full"""
+        while not self._exhausted and len(self._pending) < self._queue_depth:
+            size = self._page_size
+            if self._limit is not None:
+                size = min(size, self._limit - self._next_offset)
+                if size <= 0:
+                    self._exhausted = True
+                    return
+            future = self._executor.submit(self._fetch_page, self._next_offset, size)
+            self._pending.append((size, future))
+            self._next_offset += size
+
+    def _cancel_pending(self) -> None:
+        """Drop pages that were requested but will not be consumed"""
+        while self._pending:
+            _, future = self._pending.pop()
+            future.cancel()
+
+    def close(self) -> None:
+        """Stop fetching and release the thread pool"""
+        self._exhausted = True
+        self._cancel_pending()
+        self._executor.shutdown(wait=False)
+
+    def __del__(self):
+        self.close()
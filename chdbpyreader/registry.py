@@ -0,0 +1,194 @@
+import itertools
+import re
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Python() table references in a query, chDB resolves the name to an object
+PYTHON_TABLE_PATTERN = re.compile(r"Python\((\w+)\)")
+# String literals, masked before looking for column names
+STRING_LITERAL_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'")
+# Identifiers of a query, quoted or not
+IDENTIFIER_TOKEN_PATTERN = re.compile(r"`([^`]+)`|([A-Za-z_]\w*)")
+
+
+class ReaderRegistry:
+    """Registry of reader instances under names unique in the process.
+
+    SQL refers to a reader as Python(name). Readers are only weakly
+    referenced, a reader leaves the registry when nothing else uses it.
+    """
+
+    def __init__(self):
+        self._readers: "weakref.WeakValueDictionary[str, Any]" = (
+            weakref.WeakValueDictionary()
+        )
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def unique_name(self, prefix: str) -> str:
+        """Return a name never returned before, usable as a Python identifier"""
+        with self._lock:
+            return f"{prefix}_{next(self._counter)}"
+
+    def register(self, reader: Any, prefix: str = "reader") -> str:
+        """Register a reader and return its unique name"""
+        name = self.unique_name(f"reader_{prefix}")
+        self._readers[name] = reader
+        return name
+
+    def get(self, name: str) -> Optional[Any]:
+        """Return the reader registered under name, None if there is none"""
+        return self._readers.get(name)
+
+    def bind_scans(
+        self,
+        sql: str,
+        namespace: Dict[str, Any],
+        scan_args: Optional[Dict[str, tuple]] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Give every Python() table of a query its own scan.
+
+        chDB looks Python(name) up in the globals of the calling frames, so
+        the scans are published in namespace, the globals of the module
+        running the query, under names unique to this query.
+
+        Args:
+            sql: Query referencing registered readers as Python(name)
+            namespace: Globals of the module calling chDB
+            scan_args: Optional (filters, limit) by reader name, applied to
+                the first reference of that reader only
+
+        Returns:
+            The SQL referencing the scans, and the scans by name to release
+            with release_scans()
+        """
+        scan_args = dict(scan_args or {})
+        scans: Dict[str, Any] = {}
+
+        def bind(match: "re.Match") -> str:
+            reader_name = match.group(1)
+            reader = self.get(reader_name)
+            if reader is None:
+                # Not a registered reader, chDB resolves the name itself
+                return match.group(0)
+            filters, limit = scan_args.pop(reader_name, ([], None))
+            name = self.unique_name(f"scan_{reader_name}")
+            scans[name] = reader.scan(filters, limit)
+            return f"Python({name})"
+
+        bound_sql = PYTHON_TABLE_PATTERN.sub(bind, sql)
+        namespace.update(scans)
+        return bound_sql, scans
+
+    @staticmethod
+    def materialize_scans(
+        sql: str, scans: Dict[str, Any], run: Callable[[str], Any]
+    ) -> Tuple[str, List[str]]:
+        """Read every Python() table of a query but the first into a temporary table.
+
+        chDB binds all Python() tables of one query to the first object it
+        resolves, so a query reading two readers, or one reader twice, would
+        read the first one everywhere. The other scans are read beforehand
+        by queries of their own, copying only the columns the query names,
+        see scan_columns().
+
+        Args:
+            sql: Query returned by bind_scans()
+            scans: Scans returned by bind_scans()
+            run: Function running a statement, e.g. SessionPool.query
+
+        Returns:
+            The SQL reading the temporary tables instead, and the names of
+            the tables to drop after the query
+        """
+        tables = []
+        try:
+            for name in list(scans)[1:]:
+                table = f"tmp_{name}"
+                columns = [column for column, _ in scans[name].get_schema()]
+                selected = ", ".join(
+                    f"`{column}`" for column in scan_columns(sql, name, columns)
+                )
+                run(
+                    f"CREATE TEMPORARY TABLE {table} ENGINE = Memory "
+                    f"AS SELECT {selected} FROM Python({name})"
+                )
+                tables.append(table)
+                sql = sql.replace(f"Python({name})", table)
+        except BaseException:
+            for table in tables:
+                run(f"DROP TEMPORARY TABLE IF EXISTS {table}")
+            raise
+        return sql, tables
+
+    @staticmethod
+    def release_scans(namespace: Dict[str, Any], scans: Dict[str, Any]) -> None:
+        """Unpublish and close the scans created by bind_scans()"""
+        for name, scan in scans.items():
+            namespace.pop(name, None)
+            scan.close()
+
+
+def scan_columns(sql: str, name: str, columns: List[str]) -> List[str]:
+    """Columns of a Python() table a query may read, in table order.
+
+    A column is kept when its name appears in the query, qualified or not,
+    and every column when the query reading the table selects * or alias.*.
+    Unrelated names sharing a column name keep it too, never the reverse.
+
+    Args:
+        sql: Query reading the table as Python(name)
+        name: Name the table is bound to
+        columns: Columns of the table
+    """
+    # Parentheses and names inside string literals are not SQL
+    masked = STRING_LITERAL_PATTERN.sub(
+        lambda m: "'" + " " * (len(m[0]) - 2) + "'", sql
+    )
+    match = re.search(rf"Python\({name}\)(?:\s+AS\s+(`[^`]+`|\w+))?", masked)
+    if match is None:
+        return columns
+    # Only the query reading the table sees its columns, outer queries see
+    # the ones it selects
+    selected = _select_list(masked, match.start())
+    alias = (match.group(1) or "").strip("`")
+    star = rf"(?:`{re.escape(alias)}`|\b{re.escape(alias)})\.\*"
+    if alias and re.search(star, selected):
+        return columns
+    if "*" in re.sub(r"[`\w]+\.\*", "", selected):
+        return columns
+    names = {
+        quoted or plain for quoted, plain in IDENTIFIER_TOKEN_PATTERN.findall(masked)
+    }
+    # A query reading no column still needs the rows
+    return [column for column in columns if column in names] or columns[:1]
+
+
+def _select_list(sql: str, position: int) -> str:
+    """Select list of the query reading the table at a position, at its level"""
+    depth = 0
+    start = 0
+    for i in range(position - 1, -1, -1):
+        if sql[i] == ")":
+            depth += 1
+        elif sql[i] == "(":
+            if depth == 0:
+                start = i + 1
+                break
+            depth -= 1
+    # Parts of the query at its own level, subqueries and calls blanked
+    level = []
+    depth = 0
+    for char in sql[start:position]:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        level.append(char if depth == 0 and char not in "()" else " ")
+    text = "".join(level)
+    select = re.search(r"\bSELECT\b(.*?)\bFROM\b", text, re.IGNORECASE | re.DOTALL)
+    return select.group(1) if select else ""
+
+
+READERS = ReaderRegistry()
@@ -0,0 +1,489 @@
+import datetime
+import re
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+import numpy as np
+
+# NumPy dtypes used for column buffers of each ClickHouse type
+NUMPY_DTYPES = {
+    "Int32": np.int32,
+    "Int64": np.int64,
+    "UInt64": np.uint64,
+    "Float64": np.float64,
+    "Bool": np.bool_,
+    "Date": np.dtype("datetime64[s]"),
+    "Date32": np.dtype("datetime64[s]"),
+    "DateTime": np.dtype("datetime64[s]"),
+}
+
+DEFAULT_SAMPLE_SIZE = 1000  # Values per column inspected by infer_data_types
+# String columns with fewer distinct values than this share of the sample
+# are LowCardinality
+LOW_CARDINALITY_RATIO = 0.1
+
+# ISO 8601 dates and times without timezone, the ones NumPy parses exactly
+DATETIME_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,9})?)?)?"
+)
+DIGIT_PATTERN = re.compile(r"\d")
+# Fraction digits of DateTime64 for each NumPy datetime unit
+DATETIME64_PRECISION = {"ms": 3, "us": 6, "ns": 9}
+INT32_RANGE = (-(2**31), 2**31 - 1)
+INT64_RANGE = (-(2**63), 2**63 - 1)
+UINT64_MAX = 2**64 - 1
+DATE_RANGE = (np.datetime64("1970-01-01"), np.datetime64("2149-06-06"))
+
+DEFAULT_TEMPLATE_CACHE_SIZE = 1024  # Compiled SQL templates kept per cache
+
+
+def infer_data_types(
+    data: Dict[str, List[Any]],
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    low_cardinality_ratio: float = LOW_CARDINALITY_RATIO,
+    complete: bool = True,
+) -> Dict[str, str]:
+    """Infer column types from data.
+
+    Each column is typed from up to sample_size values spread over the
+    whole column, not from its first value. Integers widen from Int32 to
+    Int64 and UInt64, integers mixed with floats are Float64, ISO 8601
+    strings are Date, DateTime or DateTime64, and repetitive strings are
+    LowCardinality. Columns with nulls are Nullable.
+
+    Args:
+        data: Dictionary of column names to lists of values
+        sample_size: Maximum number of values inspected per column
+        low_cardinality_ratio: Distinct values to sampled values ratio under
+            which a string column is LowCardinality
+        complete: Whether data holds every row of the source, integer columns
+            of a partial sample are at least Int64
+
+    Returns:
+        Dictionary mapping column names to ClickHouse types
+    """
+    return {
+        col_name: infer_column_type(
+            values, sample_size, low_cardinality_ratio, complete
+        )
+        for col_name, values in data.items()
+    }
+
+
+def infer_column_type(
+    values: List[Any],
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    low_cardinality_ratio: float = LOW_CARDINALITY_RATIO,
+    complete: bool = True,
+) -> str:
+    """Infer the ClickHouse type of one column, see infer_data_types"""
+    sample = values
+    if len(values) > sample_size:
+        # Evenly spaced positions, so every part of the column is represented
+        positions = np.linspace(0, len(values) - 1, sample_size).astype(np.intp)
+        sample = list(map(values.__getitem__, positions))
+        complete = False
+
+    non_null = [v for v in sample if v is not None]
+    if not non_null:
+        return "Nullable(String)"  # Default to String if all values are None
+
+    col_type = _infer_non_null_type(non_null, low_cardinality_ratio, complete)
+    if len(non_null) < len(sample):
+        if col_type.startswith("LowCardinality("):
+            return f"LowCardinality(Nullable({col_type[15:-1]}))"
+        return f"Nullable({col_type})"
+    return col_type
+
+
+def _infer_non_null_type(
+    values: List[Any], low_cardinality_ratio: float, complete: bool
+) -> str:
+    """Type of a sample of non-null values"""
+    value_types = set(map(type, values))
+
+    if value_types <= {bool, np.bool_}:
+        return "Bool"
+
+    if all(issubclass(t, (int, np.integer)) for t in value_types):
+        low, high = min(values), max(values)
+        if complete and INT32_RANGE[0] <= low and high <= INT32_RANGE[1]:
+            return "Int32"
+        if INT64_RANGE[0] <= low and high <= INT64_RANGE[1]:
+            return "Int64"
+        if low >= 0 and high <= UINT64_MAX:
+            return "UInt64"
+        return "Float64"  # Wider than any integer type chDB reads
+
+    if all(issubclass(t, (int, float, np.integer, np.floating)) for t in value_types):
+        return "Float64"
+
+    if value_types == {str}:
+        return _infer_string_type(values, low_cardinality_ratio)
+
+    return "String"  # Default to String for unknown or mixed types
+
+
+def _infer_string_type(values: List[str], low_cardinality_ratio: float) -> str:
+    """Type of a sample of strings, temporal when all of them are ISO 8601"""
+    if all(map(DATETIME_PATTERN.fullmatch, values)):
+        try:
+            parsed = np.array(values, dtype="datetime64")
+        except ValueError:
+            parsed = None  # Invalid dates, e.g. 2024-02-30
+        if parsed is not None:
+            unit = np.datetime_data(parsed.dtype)[0]
+            low, high = parsed.min(), parsed.max()
+            if unit == "D":
+                in_range = DATE_RANGE[0] <= low and high <= DATE_RANGE[1]
+                return "Date" if in_range else "Date32"
+            if unit in DATETIME64_PRECISION:
+                return f"DateTime64({DATETIME64_PRECISION[unit]})"
+            return "DateTime"
+
+    if len(set(values)) <= len(values) * low_cardinality_ratio:
+        return "LowCardinality(String)"
+    return "String"
+
+
+def value_shape(value: str) -> str:
+    """Shape of a string, its digits replaced by 0, e.g. 0000-00-00"""
+    return DIGIT_PATTERN.sub("0", value)
+
+
+def base_type(col_type: str) -> str:
+    """Strip the Nullable and LowCardinality wrappers of a ClickHouse type"""
+    while col_type.startswith(("Nullable(", "LowCardinality(")):
+        col_type = col_type[col_type.index("(") + 1 : -1]
+    return col_type
+
+
+def numpy_dtype(col_type: str) -> Optional[np.dtype]:
+    """NumPy dtype of the column buffers of a ClickHouse type, None for objects"""
+    col_type = base_type(col_type)
+    if col_type.startswith("DateTime64"):
+        return np.dtype("datetime64[us]")  # The finest unit chDB reads
+    dtype = NUMPY_DTYPES.get(col_type)
+    return None if dtype is None else np.dtype(dtype)
+
+
+def chdb_dtype(col_type: str) -> str:
+    """Type name a PyReader reports to chDB for a ClickHouse type"""
+    dtype = numpy_dtype(col_type)
+    return "str" if dtype is None else dtype.name
+
+
+def python_table_type(col_type: str) -> str:
+    """ClickHouse type chDB reads a column of a type as from a Python table.
+
+    chDB reads no nulls from Python tables. Numeric and Bool columns with
+    nulls are read as Float64, nulls being NaN, and temporal and string
+    columns with nulls as strings, nulls being empty strings.
+    """
+    if "Nullable(" not in col_type:
+        return col_type
+    inner = base_type(col_type)
+    if inner == "Bool" or inner.startswith(("Int", "UInt", "Float")):
+        return "Float64"
+    if col_type.startswith("LowCardinality("):
+        return "LowCardinality(String)"
+    return "String"
+
+
+def wider_type(col_type: str, values: List[Any]) -> str:
+    """Type chDB reads from a Python table holding a column type and values.
+
+    Numbers of another numeric type widen the column to Float64, other
+    values to String, see python_table_type for nulls.
+    """
+    non_null = [v for v in values if v is not None]
+    col_type = base_type(col_type)
+    value_type = col_type
+    if non_null:
+        value_type = base_type(infer_column_type(non_null, complete=False))
+    if value_type != col_type:
+        numeric = all(
+            t == "Bool" or t.startswith(("Int", "UInt", "Float"))
+            for t in (col_type, value_type)
+        )
+        value_type = "Float64" if numeric else "String"
+    if len(non_null) < len(values):
+        value_type = f"Nullable({value_type})"
+    return python_table_type(value_type)
+
+
+def typed_array(values: List[Any], dtype: np.dtype) -> Optional[np.ndarray]:
+    """Convert values to an array of a dtype, None if it cannot hold them exactly.
+
+    Floats hold nulls as NaN. Integer and Bool arrays only hold values equal
+    to their float value, e.g. not 2.5, and datetime arrays no nulls.
+    """
+    try:
+        array = np.asarray(values, dtype=dtype)
+    except (TypeError, ValueError, OverflowError):
+        return None  # e.g. nulls in integers, or too large integers
+    if dtype.kind == "M":
+        return None if np.isnat(array).any() else array
+    if dtype.kind in "iub":
+        try:
+            exact = np.array_equal(array, np.asarray(values, dtype=np.float64))
+        except (TypeError, ValueError):
+            exact = False
+        return array if exact else None
+    return array
+
+
+def to_numpy_array(values: List[Any], col_type: str) -> np.ndarray:
+    """Convert a column of values to a typed NumPy array.
+
+    Args:
+        values: List or array of column values
+        col_type: ClickHouse type of the column
+
+    Returns:
+        Array of the dtype of col_type (see numpy_dtype) when it holds the
+        values exactly, otherwise a Float64 array for numbers, e.g. floats
+        in an integer column, or an object array referencing the values
+    """
+    dtype = numpy_dtype(col_type)
+    if isinstance(values, np.ndarray) and values.dtype == dtype:
+        return values  # Already built by convert_to_columnar(data, schema)
+    if dtype is not None:
+        array = typed_array(values, dtype)
+        if array is None and dtype.kind in "iub":
+            array = typed_array(values, np.dtype(np.float64))
+        if array is not None:
+            return array
+
+    # Strings and mixed values stay Python objects, chDB reads them as is
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def to_numpy_columns(
+    data: Dict[str, List[Any]], schema: Dict[str, str]
+) -> Dict[str, np.ndarray]:
+    """Convert columnar data to typed NumPy arrays.
+
+    Args:
+        data: Dictionary of column names to lists of values
+        schema: Dictionary mapping column names to ClickHouse types
+
+    Returns:
+        Dictionary mapping column names to NumPy arrays
+    """
+    return {
+        col: to_numpy_array(values, schema.get(col, "String"))
+        for col, values in data.items()
+    }
+
+
+def convert_to_columnar(
+    data: List[Dict[str, Any]], schema: Optional[Dict[str, str]] = None
+) -> Dict[str, Union[List[Any], np.ndarray]]:
+    """Convert row-based data to columnar format.
+
+    Columns are ordered by first appearance in the rows. When every row has
+    the same keys, the usual shape of an API page, each column is extracted
+    in one C-level pass instead of a Python loop per value.
+
+    Args:
+        data: List of dictionaries representing rows
+        schema: Optional dictionary mapping column names to ClickHouse types,
+            numeric and temporal columns their type holds exactly are then
+            built directly as typed NumPy arrays
+
+    Returns:
+        Dictionary mapping column names to lists of values, or NumPy arrays
+        for the typed columns
+    """
+    if not data:
+        return {}
+
+    first_keys = data[0].keys()
+    if all(row.keys() == first_keys for row in data):
+        columns = list(first_keys)
+        getters = {col: itemgetter(col) for col in columns}
+    else:
+        # Rows with missing or extra keys, absent values become None
+        columns = list(dict.fromkeys(key for row in data for key in row))
+        getters = {col: _get_or_none(col) for col in columns}
+
+    columnar_data: Dict[str, Union[List[Any], np.ndarray]] = {}
+    for col in columns:
+        values = list(map(getters[col], data))
+        dtype = numpy_dtype(schema[col]) if schema and col in schema else None
+        array = typed_array(values, dtype) if dtype is not None else None
+        # Values the type cannot hold stay Python objects, see to_numpy_array
+        columnar_data[col] = values if array is None else array
+
+    return columnar_data
+
+
+def _get_or_none(key: str):
+    """Return a function reading key from a row, None when the row lacks it"""
+    return lambda row: row.get(key)
+
+
+def iter_columnar(
+    chunks: Iterable[List[Dict[str, Any]]],
+    schema: Optional[Dict[str, str]] = None,
+) -> Iterator[Dict[str, Union[List[Any], np.ndarray]]]:
+    """Convert chunks of rows to column batches, one chunk at a time.
+
+    Only the current chunk is held in memory. Column order is stable across
+    batches: a batch has every column seen so far, in order of first
+    appearance, with None for the columns its rows lack.
+
+    Args:
+        chunks: Iterable of lists of dictionaries representing rows
+        schema: Optional dictionary mapping column names to ClickHouse types,
+            see convert_to_columnar
+
+    Yields:
+        Dictionary mapping column names to the values of one chunk
+    """
+    columns: Dict[str, None] = {}
+    for chunk in chunks:
+        if not chunk:
+            continue
+        batch = convert_to_columnar(chunk, schema)
+        columns.update(dict.fromkeys(batch))
+        yield {
+            col: batch[col] if col in batch else [None] * len(chunk) for col in columns
+        }
+
+
+def quote_string(value: str) -> str:
+    """Quote a string literal for ClickHouse SQL"""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def query_param_type(value: Any) -> str:
+    """ClickHouse type of a query parameter holding a Python value"""
+    if value is None:
+        return "Nullable(String)"
+    if isinstance(value, (bool, np.bool_)):
+        return "Bool"
+    if isinstance(value, (int, np.integer)):
+        if value > INT64_RANGE[1]:
+            return "UInt64"
+        return "Int64"
+    if isinstance(value, (float, np.floating)):
+        return "Float64"
+    if isinstance(value, datetime.datetime):
+        return "DateTime64(6)"
+    if isinstance(value, datetime.date):
+        return "Date32"
+    if isinstance(value, np.ndarray):
+        if value.dtype == np.float32:
+            return "Array(Float32)"
+        return f"Array({query_param_type(value.tolist()[0] if len(value) else '')})"
+    if isinstance(value, (list, tuple, set, frozenset)):
+        types = {query_param_type(v) for v in value if v is not None}
+        if types <= {"Int64", "UInt64", "Float64"} and len(types) > 1:
+            types = {"Float64"}
+        element = types.pop() if len(types) == 1 else "String"
+        if None in value:
+            element = f"Nullable({element})"
+        return f"Array({element})"
+    return "String"
+
+
+def format_query_param(value: Any) -> str:
+    """Text of a query parameter value, as ClickHouse parses it in SET param_"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (bool, np.bool_)):
+        return "true" if value else "false"
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return "[" + ",".join(map(_query_param_literal, value)) + "]"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    # Parameter values are in the escaped format
+    text = str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def _query_param_literal(value: Any) -> str:
+    """Element of an array query parameter, a SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, datetime.datetime):
+        return quote_string(value.isoformat(sep=" "))
+    if isinstance(value, (str, datetime.date)):
+        return quote_string(str(value))
+    return format_query_param(value)
+
+
+def query_params_setting(params: Dict[str, Any]) -> str:
+    """SET statement binding query parameters for the following queries"""
+    settings = ", ".join(
+        f"param_{name} = {quote_string(format_query_param(value))}"
+        for name, value in params.items()
+    )
+    return f"SET {settings}"
+
+
+# Query parameter placeholders, e.g. {p0:Int64}
+QUERY_PARAM_PATTERN = re.compile(r"\{(\w+):([^{}]+)\}")
+
+
+def render_query_params(sql: str, params: Dict[str, Any]) -> str:
+    """Inline bound parameter values into SQL, for display only"""
+
+    def render(match: "re.Match") -> str:
+        name = match.group(1)
+        if name not in params:
+            return match.group(0)
+        value = params[name]
+        if isinstance(value, (list, tuple, set, frozenset, np.ndarray)):
+            return format_query_param(value)
+        return _query_param_literal(value)
+
+    return QUERY_PARAM_PATTERN.sub(render, sql)
+
+
+class TemplateCache:
+    """Bounded cache of compiled SQL templates keyed by query shape.
+
+    Queries differing only in bound values have the same shape, so they
+    share one template and send chDB the same SQL text.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_TEMPLATE_CACHE_SIZE):
+        self.max_size = max_size
+        self._templates: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, shape: Hashable, compile: Callable[[], str]) -> str:
+        """Return the template of a shape, compiling it on a miss"""
+        with self._lock:
+            template = self._templates.get(shape)
+            if template is not None:
+                self._templates.move_to_end(shape)
+                return template
+        template = compile()
+        with self._lock:
+            self._templates[shape] = template
+            if len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
@@ -1,8 +1,20 @@
 from typing import Type, List, Dict, Any, Optional, Union
 import numpy as np
+from chdbpyreader.utils import (
+    TemplateCache,
+    query_param_type,
+    query_params_setting,
+    quote_string,
+)
 from .models import Table, VectorIndex, Field
 import datetime
 
+# Comparison of each filter() lookup, e.g. age__gte=18
+FILTER_OPERATORS = {"gte": ">=", "lte": "<=", "eq": "="}
+
+# SQL of each search shape, searches differing only in values share it
+QUERY_TEMPLATES = TemplateCache()
+
 
 class Query:
     def __init__(self, db, table_class: Type[Table]):
@@ -10,6 +22,7 @@ class Query:
         self.table_class = table_class
         self.table_name = table_class.__name__.lower()
         self._filters = []
+        self._params: Dict[str, Any] = {}
         self._limit = None
         self._index_name = None
         self._search_text = None
@@ -27,16 +40,14 @@ class Query:
     def filter(self, **kwargs) -> "Query":
         """Add WHERE conditions to the query"""
         for field, value in kwargs.items():
+            op = "eq"
             if "__" in field:
                 field, op = field.split("__")
-                if op == "gte":
-                    self._filters.append(f"{field} >= {self._format_value(value)}")
-                elif op == "lte":
-                    self._filters.append(f"{field} <= {self._format_value(value)}")
-                elif op == "eq":
-                    self._filters.append(f"{field} = {self._format_value(value)}")
-            else:
-                self._filters.append(f"{field} = {self._format_value(value)}")
+            if op in FILTER_OPERATORS:
+                # Values are bound as query parameters, not pasted into the SQL
+                self._filters.append(
+                    f"{field} {FILTER_OPERATORS[op]} {self._bind_value(value)}"
+                )
         return self
 
     def limit(self, n: int) -> "Query":
@@ -44,17 +55,23 @@ class Query:
         self._limit = n
         return self
 
+    def _bind_value(self, value: Any) -> str:
+        """Bind a value to a new query parameter and return its placeholder"""
+        name = f"p{len(self._params)}"
+        self._params[name] = value
+        return f"{{{name}:{query_param_type(value)}}}"
+
     def _format_value(self, value: Any) -> str:
         """Format a value for SQL insertion"""
         if value is None:
             return "NULL"
         elif isinstance(value, str):
-            return f"'{value}'"
+            return quote_string(value)
         elif isinstance(value, (int, float, bool)):
             return str(value)
         elif isinstance(value, datetime.datetime):
             # Format datetime in ClickHouse's expected format: 'YYYY-MM-DD HH:MM:SS'
-            return f"'{value.strftime('%Y-%m-%d %H:%M:%S')}'"
+            return quote_string(value.strftime("%Y-%m-%d %H:%M:%S"))
         elif isinstance(value, np.ndarray):
             return f"[{','.join(map(str, value))}]"
         elif isinstance(value, list):
@@ -69,7 +86,7 @@ class Query:
             else:
                 return "NULL"
         else:
-            return f"'{str(value)}'"
+            return quote_string(str(value))
 
     def insert(self, data: Union[Dict[str, Any], Table]) -> None:
         """Insert a single record"""
@@ -156,26 +173,23 @@ class Query:
             raise ValueError(f"Vector index {self._index_name} not found")
 
         # Generate embedding for search text
-        search_embedding = self._generate_embedding(self._search_text)
-        embedding_str = "[" + ",".join(map(str, search_embedding)) + "]"
-
-        # Build the query
-        where_clause = " AND ".join(self._filters) if self._filters else "1=1"
-        limit_clause = f"LIMIT {self._limit}" if self._limit else ""
-
-        query = f"""
-        SELECT 
-            *,
-            {index.distance_function}({index.embedding_column}, {embedding_str}) as similarity_score
-        FROM {self.table_name}
-        WHERE {where_clause}
-        ORDER BY similarity_score ASC
-        {limit_clause}
-        """
+        params = dict(self._params)
+        params["embedding"] = self._generate_embedding(self._search_text)
+
+        # Build the query, once per shape
+        shape = (
+            self.table_name,
+            index.distance_function,
+            index.embedding_column,
+            tuple(self._filters),
+            self._limit,
+        )
+        query = QUERY_TEMPLATES.get(shape, lambda: self._build_query(index))
 
         # Execute query
         cur = self.db.conn.cursor()
         print(query)
+        cur.execute(query_params_setting(params))
         cur.execute(query)
         results = []
         for row in cur:
@@ -186,3 +200,22 @@ class Query:
         cur.close()
 
         return results
+
+    def _build_query(self, index: VectorIndex) -> str:
+        """SQL template of the search, values are {name:Type} parameters"""
+        where_clause = " AND ".join(self._filters) if self._filters else "1=1"
+        limit_clause = f"LIMIT {self._limit}" if self._limit else ""
+        distance = (
+            f"{index.distance_function}"
+            f"({index.embedding_column}, {{embedding:Array(Float32)}})"
+        )
+
+        return f"""
+        SELECT
+            *,
+            {distance} as similarity_score
+        FROM {self.table_name}
+        WHERE {where_clause}
+        ORDER BY similarity_score ASC
+        {limit_clause}
+        """
@@ -0,0 +1,134 @@
+import glob
+import hashlib
+import os
+from typing import Any, List, Optional, Tuple
+from chainfunc.session_pool import get_pool, MEMORY_PATH
+from datasource.snapshot import SnapshotCache, SNAPSHOT_FORMATS
+
+DEFAULT_CONVERSION_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "data-sdk", "columnar"
+)
+DEFAULT_CONVERSION_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "data-sdk", "columnar-tables"
+)
+DEFAULT_CONVERSION_MAX_BYTES = 10 * 1024**3
+DEFAULT_CONVERSION_DATABASE = "file_copies"
+
+CONVERSION_FORMATS = set(SNAPSHOT_FORMATS) | {"MergeTree"}
+
+
+class ConversionCache:
+    """Columnar copies of text file sources, made on first use.
+
+    Parsing CSV text, schema inference included, costs every query the
+    whole file. The first query converts the source to a Parquet or Native
+    file, or to a local MergeTree table, and later queries scan the needed
+    columns of the copy. Copies are named after the path, modification time
+    and size of the source files, so a changed source is converted again.
+    """
+
+    def __init__(
+        self,
+        format: str = "Parquet",
+        directory: str = DEFAULT_CONVERSION_DIR,
+        max_bytes: Optional[int] = DEFAULT_CONVERSION_MAX_BYTES,
+        path: Optional[str] = None,
+        database: str = DEFAULT_CONVERSION_DATABASE,
+    ):
+        """Initialize ConversionCache.
+
+        Args:
+            format: Parquet or Native for file copies, MergeTree for tables
+            directory: Directory holding the file copies
+            max_bytes: Size above which the least recently used file copies
+                are evicted, None for no bound
+            path: chDB data path holding the MergeTree copies, defaults to
+                the path of the session pool, or DEFAULT_CONVERSION_PATH
+                when the pool is in memory
+            database: Database of the MergeTree copies
+        """
+        if format not in CONVERSION_FORMATS:
+            raise ValueError(f"Unsupported conversion format: {format}")
+        self.format = format
+        self.database = database
+        self.path: Optional[str] = None
+        self._files: Optional[SnapshotCache] = None
+        if format == "MergeTree":
+            if path is None:
+                pool_path = get_pool().path
+                in_memory = pool_path == MEMORY_PATH
+                path = DEFAULT_CONVERSION_PATH if in_memory else pool_path
+            self.path = os.path.abspath(path)
+        else:
+            # Copies never expire, a changed source gets a new key
+            self._files = SnapshotCache(
+                directory, ttl=None, max_bytes=max_bytes, format=format
+            )
+
+    @staticmethod
+    def source_state(source_path: str) -> List[Tuple[str, Any, Any]]:
+        """Path, modification time and size of each source file"""
+        state = []
+        for path in sorted(glob.glob(source_path)) or [source_path]:
+            try:
+                stat = os.stat(path)
+                state.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append((os.path.abspath(path), None, None))
+        return state
+
+    def table_function(self, source_path: str, table_func: str) -> str:
+        """Table function reading the columnar copy of a source.
+
+        Args:
+            source_path: Path or glob pattern of the source files
+            table_func: Table function reading the source files
+        """
+        # Copies of one source share a prefix, the suffix follows its state
+        source = hashlib.sha256(table_func.encode()).hexdigest()[:16]
+        state = self.source_state(source_path)
+        version = hashlib.sha256(repr(state).encode()).hexdigest()[:16]
+        if self._files is not None:
+            return self._file(table_func, source, version)
+        return self._table(table_func, source, version)
+
+    def _file(self, table_func: str, source: str, version: str) -> str:
+        """Columnar file copy of a source, replacing its earlier copies"""
+        files = self._files
+        key = f"{source}_{version}"
+        path = files.get(key)
+        if path is None:
+            path = files.put(key, table_func)
+            for entry in os.scandir(files.directory):
+                other = entry.name.split(".")[0]
+                if other.startswith(f"{source}_") and other != key:
+                    files.invalidate(other)
+        return files.table_function(path)
+
+    def _table(self, table_func: str, source: str, version: str) -> str:
+        """Local MergeTree copy of a source, replacing its earlier copies"""
+        pool = get_pool(self.path)
+        prefix = f"copy_{source}_"
+        name = f"{prefix}{version}"
+        pool.query(f"CREATE DATABASE IF NOT EXISTS {self.database}")
+        result = pool.query(
+            f"SELECT name FROM system.tables WHERE database = '{self.database}' "
+            f"AND startsWith(name, '{prefix}')",
+            "TabSeparatedRaw",
+        )
+        tables = result.bytes().decode().split()
+        if name not in tables:
+            # Built under another name, a failed copy is never served
+            building = f"{name}_building"
+            pool.query(f"DROP TABLE IF EXISTS {self.database}.{building}")
+            pool.query(
+                f"CREATE TABLE {self.database}.{building} "
+                f"ENGINE = MergeTree ORDER BY tuple() AS SELECT * FROM {table_func}"
+            )
+            pool.query(
+                f"RENAME TABLE {self.database}.{building} TO {self.database}.{name}"
+            )
+        for table in tables:
+            if table != name:
+                pool.query(f"DROP TABLE IF EXISTS {self.database}.{table}")
+        return f"{self.database}.{name}"
@@ -1,8 +1,46 @@
-from typing import Dict, Any, Optional, Union, Callable
+from typing import Dict, Any, List, Optional, Union, Callable
 from enum import Enum
 from dataclasses import dataclass
 from chainfunc.query_builder import QueryBuilder
-from chdbpyreader.data_reader import DataReader
+from chainfunc.session_pool import SessionPool, configure_pool, DEFAULT_POOL_SIZE
+from chainfunc.result_cache import (
+    ResultCache,
+    configure_result_cache,
+    get_result_cache,
+    DEFAULT_RESULT_CACHE_BYTES,
+    DEFAULT_POSTGRES_TTL,
+)
+from chainfunc.schema_cache import (
+    SchemaCache,
+    configure_schema_cache,
+    get_schema_cache,
+    DEFAULT_SCHEMA_CACHE_DIR,
+    DEFAULT_POSTGRES_SCHEMA_TTL,
+)
+from chdbpyreader.data_reader import (
+    DataReader,
+    DEFAULT_PAGE_SIZE,
+    SCHEMA_SAMPLE_ROWS,
+)
+from chdbpyreader.prefetch import DEFAULT_CONCURRENCY, DEFAULT_QUEUE_DEPTH
+from datasource.sync import CollectionSync
+from datasource.conversion import (
+    ConversionCache,
+    DEFAULT_CONVERSION_DIR,
+    DEFAULT_CONVERSION_MAX_BYTES,
+)
+from datasource.replica import TableReplica
+from datasource.partitioning import (
+    PARTITIONING_SCHEMES,
+    hive_partitions,
+    partitioned_table,
+)
+from datasource.snapshot import (
+    SnapshotCache,
+    DEFAULT_SNAPSHOT_DIR,
+    DEFAULT_SNAPSHOT_TTL,
+    DEFAULT_SNAPSHOT_MAX_BYTES,
+)
 
 
 class SourceType(Enum):
@@ -19,6 +57,12 @@ class PostgresConfig:
     user: str = ""
     password: str = ""
     schema: Optional[str] = None
+    replicate: bool = False  # Serve tables from local MergeTree replicas
+    refresh: Union[str, float, None] = "manual"  # e.g. "5m", or refresh() only
+    replica_key: Optional[Union[str, List[str]]] = None  # Columns of a row's key
+    # Column only growing for new and updated rows, for incremental refreshes
+    replica_watermark: Optional[str] = None
+    replica_path: Optional[str] = None  # Defaults to the session pool path
 
 
 @dataclass
@@ -26,12 +70,32 @@ class APIConfig:
     url: str
     api_key: Optional[str] = None
     headers: Optional[Dict[str, str]] = None
+    streaming: bool = False  # Fetch pages lazily instead of the whole collection
+    page_size: int = DEFAULT_PAGE_SIZE
+    prefetch: bool = False  # Fetch the next pages in background threads
+    prefetch_concurrency: int = DEFAULT_CONCURRENCY
+    prefetch_queue_depth: int = DEFAULT_QUEUE_DEPTH
+    snapshot: bool = False  # Serve collections from a local snapshot file
+    snapshot_dir: str = DEFAULT_SNAPSHOT_DIR
+    snapshot_ttl: Optional[float] = DEFAULT_SNAPSHOT_TTL
+    snapshot_max_bytes: Optional[int] = DEFAULT_SNAPSHOT_MAX_BYTES
+    snapshot_format: str = "Parquet"  # Parquet or Native
+    sync: bool = False  # Keep collections in local tables synced by watermark
+    sync_path: Optional[str] = None  # Defaults to the session pool path
+    watermark: str = "created_at"  # Column that only grows for new rows
+    schema_sample_rows: int = SCHEMA_SAMPLE_ROWS  # Rows sampled to infer types
 
 
 @dataclass
 class FileConfig:
-    path: str
+    path: str  # Path or glob pattern, e.g. data/events/date=*/part-*.parquet
     format: str = "CSV"  # CSV, Parquet, etc.
+    partitioning: Optional[str] = None  # "hive" for key=value directories
+    max_threads: Optional[int] = None  # Files read in parallel
+    # Serve queries from a Parquet, Native or MergeTree copy made on first use
+    columnar: Optional[str] = None
+    columnar_dir: str = DEFAULT_CONVERSION_DIR
+    columnar_max_bytes: Optional[int] = DEFAULT_CONVERSION_MAX_BYTES
 
 
 class DataSource:
@@ -42,6 +106,10 @@ class DataSource:
         self.config = self._parse_config(kwargs)
         self._table_name = None
         self._reader = None
+        self._readers: Dict[str, DataReader] = {}
+        self._sync = None
+        self._conversion = None
+        self._replica = None
 
     @staticmethod
     def connect(source_type: str, **kwargs) -> "DataSource":
@@ -64,24 +132,153 @@ class DataSource:
     def _get_clickhouse_table_function(self) -> str:
         """Generate ClickHouse table function based on source type"""
         if self.source_type == SourceType.POSTGRES:
-            config = self.config
-            schema_part = f", schema='{config.schema}'" if config.schema else ""
-            return (
-                f"postgresql('{config.host}:{config.port}', "
-                f"'{config.database}', '{self._table_name}', "
-                f"'{config.user}', '{config.password}'{schema_part})"
-            )
+            table_func = self._get_postgres_table_function()
+            if self.config.replicate:
+                return self._get_replica().table(self._replica_name(), table_func)
+            return table_func
         elif self.source_type == SourceType.FILE:
-            config = self.config
-            return f"file('{config.path}', '{config.format}')"
+            return self._get_file_table_function()
         elif self.source_type == SourceType.API:
-            # Initialize reader if not already done
-            if not self._reader and self._table_name:
-                self._reader = DataReader(self._table_name)
-            return "Python(reader)"
+            if self.config.sync:
+                self.sync()
+                return self._get_sync().table_name(self._table_name)
+            if self.config.snapshot:
+                return self._get_snapshot_table_function()
+            self._init_reader()
+            return f"Python({self._reader.name})"
         else:
             raise ValueError(f"Unsupported source type: {self.source_type}")
 
+    def _get_postgres_table_function(self) -> str:
+        config = self.config
+        schema_part = f", schema='{config.schema}'" if config.schema else ""
+        return (
+            f"postgresql('{config.host}:{config.port}', "
+            f"'{config.database}', '{self._table_name}', "
+            f"'{config.user}', '{config.password}'{schema_part})"
+        )
+
+    def _get_file_table_function(self) -> str:
+        """Table function reading the files, with their partition columns"""
+        config = self.config
+        table_func = f"file('{config.path}', '{config.format}')"
+        if config.partitioning is not None:
+            if config.partitioning not in PARTITIONING_SCHEMES:
+                raise ValueError(f"Unsupported partitioning: {config.partitioning}")
+            # Listed again for every table, new partitions are seen by later queries
+            partitions = hive_partitions(config.path)
+            table_func = partitioned_table(table_func, partitions, config.max_threads)
+        elif config.max_threads:
+            table_func = partitioned_table(table_func, {}, config.max_threads)
+        if config.columnar:
+            # Checked for every table, a changed source is converted again
+            return self._get_conversion().table_function(config.path, table_func)
+        return table_func
+
+    def _get_conversion(self) -> ConversionCache:
+        if self._conversion is None:
+            config = self.config
+            self._conversion = ConversionCache(
+                config.columnar,
+                directory=config.columnar_dir,
+                max_bytes=config.columnar_max_bytes,
+            )
+        return self._conversion
+
+    def _init_reader(self) -> None:
+        """Initialize the reader of the current collection if not already done"""
+        if not self._table_name:
+            return
+        self._reader = self._readers.get(self._table_name)
+        if not self._reader:
+            self._reader = self._readers[self._table_name] = DataReader(
+                self._table_name,
+                streaming=self.config.streaming,
+                page_size=self.config.page_size,
+                prefetch=self.config.prefetch,
+                concurrency=self.config.prefetch_concurrency,
+                queue_depth=self.config.prefetch_queue_depth,
+                sample_rows=self.config.schema_sample_rows,
+            )
+
+    def _get_sync(self) -> CollectionSync:
+        if self._sync is None:
+            self._sync = CollectionSync(self.config.sync_path)
+        return self._sync
+
+    def sync(self, name: Optional[str] = None) -> int:
+        """Append new rows of an API collection to its local table.
+
+        Args:
+            name: Collection to sync, defaults to the current collection
+
+        Returns:
+            Number of rows appended
+        """
+        if self.source_type != SourceType.API:
+            raise ValueError("sync() method is only available for API sources")
+        if name:
+            self._table_name = name
+        self._init_reader()
+        return self._get_sync().sync(
+            self._table_name, self._reader, self.config.watermark
+        )
+
+    def _get_replica(self) -> TableReplica:
+        if self._replica is None:
+            config = self.config
+            self._replica = TableReplica(
+                config.replica_path,
+                refresh=config.refresh,
+                key=config.replica_key,
+                watermark=config.replica_watermark,
+            )
+        return self._replica
+
+    def _replica_name(self) -> str:
+        """Replica name of the current table, unique across databases"""
+        parts = [self.config.database, self.config.schema, self._table_name]
+        return "_".join(part for part in parts if part)
+
+    def refresh(self, name: Optional[str] = None, full: bool = False) -> int:
+        """Bring the local replica of a postgres table up to date.
+
+        Args:
+            name: Table to refresh, defaults to the current table
+            full: Copy the whole table even with a replica_watermark
+
+        Returns:
+            Number of rows copied
+        """
+        if self.source_type != SourceType.POSTGRES or not self.config.replicate:
+            raise ValueError("refresh() is only available for replicated postgres")
+        if name:
+            self._table_name = name
+        return self._get_replica().refresh(
+            self._replica_name(), self._get_postgres_table_function(), full
+        )
+
+    def _get_snapshot_table_function(self) -> str:
+        """Table function reading the collection snapshot, fetched on a miss"""
+        config = self.config
+        cache = SnapshotCache(
+            config.snapshot_dir,
+            ttl=config.snapshot_ttl,
+            max_bytes=config.snapshot_max_bytes,
+            format=config.snapshot_format,
+        )
+        # Callers with other credentials may see other data. The key is a
+        # digest, the api_key never reaches the shared snapshot directory.
+        key = cache.key(config.url, self._table_name, config.headers, config.api_key)
+        path = cache.get(key)
+        if path is None:
+            self._init_reader()
+            path = cache.put(key, "Python(reader)", self._reader)
+        # Queries read the snapshot, not a reader. On a hit the reader would
+        # still be the one of the previous collection.
+        self._reader = None
+        return cache.table_function(path)
+
     def collection(self, name: str) -> QueryBuilder:
         """For API sources - specify the collection/endpoint"""
         if self.source_type != SourceType.API:
@@ -93,12 +290,104 @@ class DataSource:
         """Create a QueryBuilder for the specified table"""
         self._table_name = name
         table_func = self._get_clickhouse_table_function()
-        return QueryBuilder(table_func, self._reader)
+        # Snapshots, local tables and subqueries are not named after the table
+        alias = (
+            name
+            if self.source_type == SourceType.API or table_func.startswith("(")
+            else None
+        )
+        path = self._sync.path if self._sync else None
+        if self._conversion and self._conversion.path:
+            path = self._conversion.path
+        if self.source_type == SourceType.POSTGRES and self.config.replicate:
+            # The alias of the postgresql() table function, queries do not
+            # change with the replica
+            alias = f"{self.config.database}_{name}"
+            path = self._get_replica().path
+        builder = QueryBuilder(table_func, self._reader, alias=alias, path=path)
+        if self._reader:
+            # Column types inferred by the reader, e.g. DateTime
+            builder.state.schema = dict(self._reader.column_types)
+        return builder
 
     def execute_raw_query(self, query: str) -> str:
         """Execute a raw SQL query"""
         return f"{query} FROM {self._get_clickhouse_table_function()}"
 
+    @staticmethod
+    def configure_pool(
+        path: Optional[str] = None,
+        size: int = DEFAULT_POOL_SIZE,
+        timeout: Optional[float] = None,
+    ) -> SessionPool:
+        """Set the chDB session pool all queries run on.
+
+        Args:
+            path: chDB data path, None for an in-memory session
+            size: Maximum number of connections checked out at the same time
+            timeout: Seconds to wait for a free connection, None to wait forever
+        """
+        return configure_pool(path, size=size, timeout=timeout)
+
+    @staticmethod
+    def configure_result_cache(
+        max_bytes: int = DEFAULT_RESULT_CACHE_BYTES,
+        directory: Optional[str] = None,
+        disk_max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        postgres_ttl: float = DEFAULT_POSTGRES_TTL,
+    ) -> ResultCache:
+        """Set the result cache used by QueryBuilder.cached().
+
+        Args:
+            max_bytes: Size of the results held in memory
+            directory: Directory of the disk tier, None for memory only
+            disk_max_bytes: Size above which old results are removed from
+                disk, None for no bound
+            ttl: Seconds any result is served, None to serve results until
+                their sources change
+            postgres_ttl: Seconds a result reading postgres is served
+        """
+        return configure_result_cache(
+            max_bytes,
+            directory=directory,
+            disk_max_bytes=disk_max_bytes,
+            ttl=ttl,
+            postgres_ttl=postgres_ttl,
+        )
+
+    @staticmethod
+    def configure_schema_cache(
+        directory: Optional[str] = DEFAULT_SCHEMA_CACHE_DIR,
+        postgres_ttl: float = DEFAULT_POSTGRES_SCHEMA_TTL,
+    ) -> SchemaCache:
+        """Set the cache of the column types of file, postgres and local tables.
+
+        Args:
+            directory: Directory of the schemas of file and postgres sources,
+                None for memory only
+            postgres_ttl: Seconds a postgres schema is served
+        """
+        return configure_schema_cache(directory, postgres_ttl=postgres_ttl)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Drop cached results and schemas of a table and refetch its API collection.
+
+        Args:
+            name: Table or collection, defaults to every table of this source
+        """
+        names = [name] if name else list(self._readers)
+        for table_name in names:
+            reader = self._readers.get(table_name)
+            if reader is not None:
+                reader.refresh()
+                get_result_cache().invalidate(reader.name)
+            get_result_cache().invalidate(table_name)
+            get_schema_cache().invalidate(table_name)
+        if self.source_type == SourceType.FILE and not name:
+            get_result_cache().invalidate(self.config.path)
+            get_schema_cache().invalidate(self.config.path)
+
     @staticmethod
     def set_question_func(func: Callable) -> None:
         """Set the question function for all QueryBuilder instances."""
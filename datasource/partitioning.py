@@ -0,0 +1,88 @@
+import glob
+import os
+import re
+from typing import Dict, Optional, Set
+from urllib.parse import unquote
+
+# Directory of a hive-style partition, e.g. date=2024-01-01
+HIVE_SEGMENT_PATTERN = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)=(.*)$")
+# Value of a partition written for NULL keys, by Hive and Spark
+HIVE_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+PARTITIONING_SCHEMES = {"hive"}
+
+# ClickHouse type of partition values matching each pattern, in order
+PARTITION_TYPES = [
+    ("Date", re.compile(r"^\d{4}-\d{2}-\d{2}$")),
+    ("Int64", re.compile(r"^-?\d{1,18}$")),
+]
+
+
+def hive_partitions(path: str) -> Dict[str, str]:
+    """Partition columns of the files matching a path and their types.
+
+    The columns are the key=value directories of the matching files, in
+    path order. A column whose values are all dates or integers gets that
+    type, String otherwise, Nullable if some files have no value.
+
+    Args:
+        path: Path or glob pattern of the files
+    """
+    values: Dict[str, Set[str]] = {}
+    for file_path in glob.iglob(path):
+        for segment in os.path.dirname(file_path).split(os.sep):
+            match = HIVE_SEGMENT_PATTERN.match(segment)
+            if match:
+                values.setdefault(match.group(1), set()).add(unquote(match.group(2)))
+    return {column: _partition_type(values[column]) for column in values}
+
+
+def _partition_type(values: Set[str]) -> str:
+    known = [value for value in values if value != HIVE_NULL_PARTITION]
+    type_name = "String"
+    for name, pattern in PARTITION_TYPES:
+        if known and all(pattern.match(value) for value in known):
+            type_name = name
+            break
+    if len(known) < len(values):
+        type_name = f"Nullable({type_name})"
+    return type_name
+
+
+def partition_column(column: str, type_name: str) -> str:
+    """Expression of a partition column, computed from the file path.
+
+    chDB prunes the files of a file() table on conditions that only depend
+    on _path, so filters on partition columns skip whole directories.
+    """
+    value = f"decodeURLComponent(extract(_path, '/{column}=([^/]*)/'))"
+    if type_name.startswith("Nullable("):
+        value = f"nullIf({value}, '{HIVE_NULL_PARTITION}')"
+        type_name = type_name[len("Nullable(") : -1]
+    if type_name != "String":
+        value = f"to{type_name}({value})"
+    return f"{value} AS {column}"
+
+
+def partitioned_table(
+    table_func: str,
+    partitions: Dict[str, str],
+    max_threads: Optional[int] = None,
+) -> str:
+    """Subquery reading a file() table function with its partition columns.
+
+    Args:
+        table_func: file() table function over the partitioned files
+        partitions: Partition column types by name, see hive_partitions()
+        max_threads: Number of files read in parallel, chDB's default if None
+    """
+    # Files written with PARTITION BY, see QueryBuilder.to_file(), also hold
+    # the partition columns, replaced by the pruning ones
+    columns = [f"* EXCEPT ({', '.join(partitions)})" if partitions else "*"]
+    columns += [
+        partition_column(column, type_name) for column, type_name in partitions.items()
+    ]
+    sql = f"SELECT {', '.join(columns)} FROM {table_func}"
+    if max_threads:
+        sql += f" SETTINGS max_threads = {int(max_threads)}"
+    return f"({sql})"
@@ -0,0 +1,197 @@
+import os
+import re
+import time
+from typing import Dict, List, Optional, Union
+from chainfunc.session_pool import get_pool, MEMORY_PATH
+from chainfunc.result_cache import get_result_cache
+from chainfunc.schema_cache import get_schema_cache
+from chdbpyreader.utils import quote_string
+
+DEFAULT_REPLICA_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "data-sdk", "replicas"
+)
+DEFAULT_REPLICA_DATABASE = "replicas"
+REFRESH_TABLE = "_replica_refreshes"
+
+# Refresh intervals such as "30s", "5m", "1h" or "1d"
+INTERVAL_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$")
+INTERVAL_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_refresh(refresh: Union[str, float, None]) -> Optional[float]:
+    """Seconds between refreshes of a replica, None to refresh manually"""
+    if refresh is None or refresh == "manual":
+        return None
+    if isinstance(refresh, (int, float)):
+        return float(refresh)
+    match = INTERVAL_PATTERN.match(refresh)
+    if not match:
+        raise ValueError(f"Invalid refresh policy: {refresh}")
+    return float(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+
+
+class TableReplica:
+    """Keep remote tables, e.g. postgres ones, in local MergeTree tables.
+
+    The first use copies the whole table. Later refreshes copy it again
+    and swap the copy in, or, with a watermark column that only grows for
+    new and updated rows (e.g. `updated_at` or a serial `id`), append the
+    rows after the last local watermark, or from it on with a key. With a
+    key, the rows of the replica are deduplicated by key, the last appended
+    row winning, and read through FINAL. Rows deleted at the source stay in
+    an incremental replica until the next full refresh.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        database: str = DEFAULT_REPLICA_DATABASE,
+        refresh: Union[str, float, None] = "manual",
+        key: Optional[Union[str, List[str]]] = None,
+        watermark: Optional[str] = None,
+    ):
+        """Initialize TableReplica.
+
+        Args:
+            path: chDB data path holding the replicas, defaults to the path
+                of the session pool, or DEFAULT_REPLICA_PATH when the pool
+                is in memory
+            database: Database of the replicas
+            refresh: Interval after which a replica is refreshed when used,
+                e.g. "5m" or seconds, "manual" to only refresh in refresh()
+            key: Column or columns identifying a row
+            watermark: Column only growing for new and updated rows, None to
+                always copy whole tables
+        """
+        if path is None:
+            pool_path = get_pool().path
+            path = DEFAULT_REPLICA_PATH if pool_path == MEMORY_PATH else pool_path
+        self.path = os.path.abspath(path)
+        self.database = database
+        self.interval = parse_refresh(refresh)
+        self.key = [key] if isinstance(key, str) else list(key or [])
+        self.watermark = watermark
+        # Last refresh time of each replica, read from REFRESH_TABLE once
+        self._refreshed: Dict[str, float] = {}
+        self._query(f"CREATE DATABASE IF NOT EXISTS {database}")
+        self._query(
+            f"CREATE TABLE IF NOT EXISTS {database}.{REFRESH_TABLE} ("
+            "name String, refreshed_at DateTime64(6) DEFAULT now64(6)"
+            ") ENGINE = ReplacingMergeTree(refreshed_at) ORDER BY name"
+        )
+
+    def _query(self, sql: str, output_format: str = "CSV"):
+        """Run a query against the replica data path"""
+        return get_pool(self.path).query(sql, output_format)
+
+    def table_name(self, name: str) -> str:
+        """Fully qualified name of the replica of a table"""
+        return f"{self.database}.`{name}`"
+
+    def table(self, name: str, table_func: str) -> str:
+        """Table expression reading the replica, refreshed per the policy.
+
+        Args:
+            name: Name of the replicated table
+            table_func: Table function reading the table, e.g. postgresql()
+        """
+        refreshed = self.refreshed_at(name)
+        if refreshed is None:
+            self.refresh(name, table_func, full=True)
+        elif self.interval is not None and time.time() - refreshed > self.interval:
+            self.refresh(name, table_func)
+        if self.key:
+            # Rows replaced by later refreshes are only merged away eventually
+            return f"(SELECT * FROM {self.table_name(name)} FINAL)"
+        return self.table_name(name)
+
+    def refreshed_at(self, name: str) -> Optional[float]:
+        """Time of the last refresh of a replica, None if there is none"""
+        if name not in self._refreshed:
+            result = self._query(
+                f"SELECT toUnixTimestamp64Micro(max(refreshed_at)) "
+                f"FROM {self.database}.{REFRESH_TABLE} "
+                f"WHERE name = {quote_string(name)} HAVING count() > 0",
+                "TabSeparatedRaw",
+            )
+            value = result.bytes().decode().strip()
+            if not value:
+                return None
+            self._refreshed[name] = int(value) / 1e6
+        return self._refreshed[name]
+
+    def refresh(self, name: str, table_func: str, full: bool = False) -> int:
+        """Bring a replica up to date with its table.
+
+        Args:
+            name: Name of the replicated table
+            table_func: Table function reading the table
+            full: Copy the whole table even with a watermark column
+
+        Returns:
+            Number of rows copied
+        """
+        table = self.table_name(name)
+        if full or not self.watermark or self.refreshed_at(name) is None:
+            copied = self._copy(name, table_func)
+        else:
+            copied = self._append(table, table_func)
+        self._query(
+            f"INSERT INTO {self.database}.{REFRESH_TABLE} (name) "
+            f"SELECT {quote_string(name)}"
+        )
+        self._refreshed[name] = time.time()
+        if copied:
+            # Cached results and schemas of the replica are out of date
+            get_result_cache().invalidate(table)
+            get_schema_cache().invalidate(table)
+        return copied
+
+    def _copy(self, name: str, table_func: str) -> int:
+        """Copy a whole table and swap it in for the replica"""
+        table = self.table_name(name)
+        building = self.table_name(f"{name}_building")
+        if self.key:
+            key = ", ".join(f"`{column}`" for column in self.key)
+            engine = (
+                f"ReplacingMergeTree ORDER BY ({key}) "
+                "SETTINGS allow_nullable_key = 1"
+            )
+        else:
+            engine = "MergeTree ORDER BY tuple()"
+        self._query(f"DROP TABLE IF EXISTS {building}")
+        self._query(
+            f"CREATE TABLE {building} ENGINE = {engine} "
+            f"AS SELECT * FROM {table_func}"
+        )
+        # Queries reading the replica see the old or the new copy, never none
+        self._query(f"CREATE TABLE IF NOT EXISTS {table} AS {building}")
+        self._query(f"EXCHANGE TABLES {building} AND {table}")
+        self._query(f"DROP TABLE IF EXISTS {building}")
+        return self._count(table)
+
+    def _append(self, table: str, table_func: str) -> int:
+        """Append the rows from the last local watermark on.
+
+        Rows written at the source after the last refresh may share its
+        watermark, e.g. the same updated_at. With a key they are read again
+        and deduplicated, without one only later watermarks are appended.
+        """
+        watermark = f"`{self.watermark}`"
+        operator = ">=" if self.key else ">"
+        result = self._query(
+            f"SELECT toString(max({watermark})) FROM {table}", "TabSeparatedRaw"
+        )
+        value = result.bytes().decode().strip()
+        before = self._count(table)
+        # A constant condition, the postgres table function sends it to the
+        # server, which only returns the new rows
+        self._query(
+            f"INSERT INTO {table} SELECT * FROM {table_func} "
+            f"WHERE {watermark} {operator} {quote_string(value)}"
+        )
+        return self._count(table) - before
+
+    def _count(self, table: str) -> int:
+        result = self._query(f"SELECT count() FROM {table}", "TabSeparated")
+        return int(result.bytes())
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Any, List, Optional, Tuple
+from chainfunc.session_pool import get_pool
+from chainfunc.arrow import INTEGER_DATE_FORMATS, date_preserving_columns
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "data-sdk", "snapshots"
+)
+DEFAULT_SNAPSHOT_TTL = 3600  # Seconds a snapshot is served before refetching
+DEFAULT_SNAPSHOT_MAX_BYTES = 10 * 1024**3
+
+# File extension of each supported snapshot format
+SNAPSHOT_FORMATS = {"Parquet": "parquet", "Native": "native"}
+
+
+class SnapshotCache:
+    """On-disk cache of source snapshots, shared by every process on the host.
+
+    A snapshot is a single Parquet or Native file named after the hash of its
+    key. Files are written under a temporary name and renamed into place, so
+    readers in other processes never see a partial snapshot. Expired files
+    and, above max_bytes, the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_SNAPSHOT_DIR,
+        ttl: Optional[float] = DEFAULT_SNAPSHOT_TTL,
+        max_bytes: Optional[int] = DEFAULT_SNAPSHOT_MAX_BYTES,
+        format: str = "Parquet",
+    ):
+        """Initialize SnapshotCache.
+
+        Args:
+            directory: Directory holding the snapshot files
+            ttl: Seconds after which a snapshot is stale, None to never expire
+            max_bytes: Total size above which old snapshots are evicted,
+                None for no bound
+            format: File format of the snapshots, Parquet or Native
+        """
+        if format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unsupported snapshot format: {format}")
+        self.directory = os.path.abspath(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.format = format
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, *parts: Any) -> str:
+        """Build a snapshot key from the parts identifying the source data"""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        """Path of the snapshot file for a key"""
+        return os.path.join(self.directory, f"{key}.{SNAPSHOT_FORMATS[self.format]}")
+
+    def table_function(self, path: str) -> str:
+        """ClickHouse table function reading a snapshot file"""
+        return f"file('{path}', '{self.format}')"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the snapshot path for a key, None if missing or expired"""
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if self._expired(stat.st_mtime):
+            return None
+        # The access time orders snapshots for LRU eviction, the modification
+        # time keeps the time the snapshot was written
+        os.utime(path, (time.time(), stat.st_mtime))
+        return path
+
+    def put(self, key: str, table_func: str, reader: Any = None) -> str:
+        """Write a snapshot of a table function and return its path.
+
+        Args:
+            key: Snapshot key, see key()
+            table_func: Table function to copy, e.g. "Python(reader)"
+            reader: DataReader referenced as Python(reader) by table_func
+
+        Returns:
+            Path of the written snapshot file
+        """
+        path = self.path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        if reader is not None:
+            # A fresh scan of the whole collection
+            reader = reader.scan()
+        try:
+            # chDB resolves Python(reader) from the local `reader` variable
+            pool = get_pool()
+            columns = "*"
+            if self.format in INTEGER_DATE_FORMATS:
+                # Dates read back as dates, not as the integers chDB writes
+                result = pool.query(f"DESCRIBE TABLE {table_func}", "TabSeparatedRaw")
+                columns = date_preserving_columns(
+                    line.split("\t")[:2]
+                    for line in result.bytes().decode().splitlines()
+                )
+            pool.query(
+                f"INSERT INTO FUNCTION {self.table_function(tmp_path)} "
+                f"SELECT {columns} FROM {table_func}"
+            )
+            os.replace(tmp_path, path)
+        finally:
+            if reader is not None:
+                reader.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict(keep=path)
+        return path
+
+    def invalidate(self, key: str) -> None:
+        """Remove the snapshot of a key"""
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove expired snapshots, then the least recently used above max_bytes.
+
+        Args:
+            keep: Snapshot path never evicted, e.g. the one just written
+        """
+        snapshots: List[Tuple[float, int, str]] = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Removed by another process
+            if entry.path == keep:
+                total += stat.st_size
+            elif self._expired(stat.st_mtime):
+                self._remove(entry.path)
+            else:
+                snapshots.append((stat.st_atime, stat.st_size, entry.path))
+
+        if self.max_bytes is None:
+            return
+        total += sum(size for _, size, _ in snapshots)
+        for _, size, path in sorted(snapshots):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _expired(self, mtime: float) -> bool:
+        return self.ttl is not None and time.time() - mtime > self.ttl
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,155 @@
+import os
+from typing import Any, Optional
+from chdbpyreader.utils import base_type, quote_string
+from chdbpyreader.registry import READERS
+from chainfunc.session_pool import get_pool, MEMORY_PATH
+from chainfunc.result_cache import get_result_cache
+
+DEFAULT_SYNC_PATH = os.path.join(os.path.expanduser("~"), ".cache", "data-sdk", "sync")
+DEFAULT_SYNC_DATABASE = "api_sync"
+WATERMARK_TABLE = "_sync_watermarks"
+
+
+def _literal(value: Any) -> str:
+    """SQL literal of a watermark value"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(value)
+    return quote_string(str(value))
+
+
+class CollectionSync:
+    """Keep API collections in local MergeTree tables.
+
+    Rows of a collection only ever arrive with a larger watermark column
+    (e.g. `created_at` or `id`), so each sync asks the source for the rows
+    after the last stored watermark, appends them and records the new
+    watermark. A refresh costs the number of new rows, not the collection size.
+    """
+
+    def __init__(
+        self, path: Optional[str] = None, database: str = DEFAULT_SYNC_DATABASE
+    ):
+        """Initialize CollectionSync.
+
+        Args:
+            path: chDB data path holding the synced tables, defaults to the
+                path of the session pool, or DEFAULT_SYNC_PATH when the pool
+                is in memory
+            database: Database of the synced tables
+        """
+        if path is None:
+            pool_path = get_pool().path
+            path = DEFAULT_SYNC_PATH if pool_path == MEMORY_PATH else pool_path
+        self.path = os.path.abspath(path)
+        self.database = database
+        self._query(f"CREATE DATABASE IF NOT EXISTS {database}")
+        self._query(
+            f"CREATE TABLE IF NOT EXISTS {database}.{WATERMARK_TABLE} ("
+            "collection String, column String, value String, "
+            "synced_at DateTime64(6) DEFAULT now64(6)"
+            ") ENGINE = ReplacingMergeTree(synced_at) ORDER BY collection"
+        )
+
+    def _query(self, sql: str, output_format: str = "CSV"):
+        """Run a query against the sync data path"""
+        return get_pool(self.path).query(sql, output_format)
+
+    def table_name(self, collection: str) -> str:
+        """Fully qualified name of the local table of a collection"""
+        return f"{self.database}.`{collection}`"
+
+    def watermark(self, collection: str) -> Optional[str]:
+        """Last synced watermark of a collection, None before the first sync"""
+        result = self._query(
+            f"SELECT argMax(value, synced_at) FROM {self.database}.{WATERMARK_TABLE} "
+            f"WHERE collection = {quote_string(collection)} HAVING count() > 0",
+            "TabSeparatedRaw",
+        )
+        value = result.bytes().decode().rstrip("\n")
+        return value if value else None
+
+    def _count(self, collection: str) -> int:
+        result = self._query(
+            f"SELECT count() FROM {self.table_name(collection)}", "TabSeparated"
+        )
+        return int(result.bytes())
+
+    def sync(self, collection: str, reader: Any, watermark_column: str) -> int:
+        """Append the rows added to a collection since the last sync.
+
+        Args:
+            collection: Name of the API collection
+            reader: DataReader of the collection
+            watermark_column: Column that only grows for new rows
+
+        Returns:
+            Number of rows appended
+        """
+        schema = dict(reader.column_types)
+        if watermark_column not in schema:
+            raise ValueError(
+                f"Watermark column {watermark_column} not found in {collection}"
+            )
+        # A sort key cannot be Nullable, rows lacking it are read as the default
+        schema[watermark_column] = base_type(schema[watermark_column])
+        table = self.table_name(collection)
+        columns = ", ".join(f"`{name}` {col_type}" for name, col_type in schema.items())
+        self._query(
+            f"CREATE TABLE IF NOT EXISTS {table} ({columns}) "
+            f"ENGINE = MergeTree ORDER BY `{watermark_column}`"
+        )
+
+        # Pages loaded by earlier queries predate the rows to append
+        reader.refresh()
+        watermark = self.watermark(collection)
+        conditions, filters = [], []
+        if watermark is not None:
+            value = self._parse_watermark(watermark, schema[watermark_column])
+            conditions.append(f"`{watermark_column}` > {_literal(value)}")
+            if reader.can_push_down(watermark_column, ">", value):
+                filters.append((watermark_column, ">", value))
+        # Rows added while the sync runs are left for the next one
+        last = reader.max_value(watermark_column, filters)
+        if last is None:
+            return 0
+        conditions.append(f"`{watermark_column}` <= {_literal(last)}")
+        if reader.can_push_down(watermark_column, "<=", last):
+            filters.append((watermark_column, "<=", last))
+
+        before = self._count(collection)
+        # The scan of the reader gets the pushed filters, see
+        # ReaderRegistry.bind_scans, chDB evaluates the WHERE for the others
+        sql, scans = READERS.bind_scans(
+            f"INSERT INTO {table} SELECT * FROM Python({reader.name}) "
+            f"WHERE {' AND '.join(conditions)}",
+            globals(),
+            {reader.name: (filters, None)},
+        )
+        try:
+            self._query(sql)
+        finally:
+            READERS.release_scans(globals(), scans)
+        appended = self._count(collection) - before
+
+        if appended:
+            # Stored as the source represents it, later syncs compare it
+            # with the source values
+            self._query(
+                f"INSERT INTO {self.database}.{WATERMARK_TABLE} "
+                "(collection, column, value) VALUES "
+                f"({quote_string(collection)}, {quote_string(watermark_column)}, "
+                f"{quote_string(str(last))})"
+            )
+            # Cached results of the local table are out of date
+            get_result_cache().invalidate(table)
+        return appended
+
+    @staticmethod
+    def _parse_watermark(value: str, col_type: str) -> Any:
+        """Convert a stored watermark back to the type the source compares"""
+        col_type = base_type(col_type)
+        if "Int" in col_type:
+            return int(value)
+        if "Float" in col_type:
+            return float(value)
+        return value
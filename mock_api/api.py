@@ -1,12 +1,54 @@
-from typing import Dict, Any
+import operator
+from typing import Dict, Any, List, Optional, Tuple
 
+# Filter operators supported by the API, applied to (row value, filter value)
+FILTER_OPERATORS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<>": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "IN": lambda value, values: value in values,
+    "NOT IN": lambda value, values: value not in values,
+    "BETWEEN": lambda value, bounds: bounds[0] <= value <= bounds[1],
+}
 
-def get_data(table_name: str) -> Dict[str, Any]:
+
+def _matches(row: Dict[str, Any], filters: List[Tuple[str, str, Any]]) -> bool:
+    """Check whether a row satisfies all filters"""
+    for field, op, value in filters:
+        row_value = row.get(field)
+        if row_value is None:
+            return False
+        try:
+            if not FILTER_OPERATORS[op.upper()](row_value, value):
+                return False
+        except TypeError:
+            # Values that cannot be compared never match
+            return False
+    return True
+
+
+def get_data(
+    table_name: str,
+    fields: Optional[List[str]] = None,
+    filters: Optional[List[Tuple[str, str, Any]]] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
     """
     Get data from a table with support for field selection, filtering, and pagination.
 
     Args:
         table_name: Name of the table to query
+        fields: Fields to include in each row, None for all fields
+        filters: (field, operator, value) conditions rows must all satisfy,
+            operators are the keys of FILTER_OPERATORS
+        offset: Number of rows to skip before the returned page
+        limit: Maximum number of rows to return, None for all remaining rows
 
     Returns:
         Dict containing the table name and filtered/selected data
@@ -262,4 +304,17 @@ def get_data(table_name: str) -> Dict[str, Any]:
     # Get the data for the requested table
     data = sample_data.get(table_name, [])
 
-    return {"table_name": table_name, "data": data, "total_count": len(data)}
+    # Apply filters before pagination so pages hold matching rows only
+    if filters:
+        data = [row for row in data if _matches(row, filters)]
+    total_count = len(data)
+
+    # Apply pagination
+    end = None if limit is None else offset + limit
+    data = data[offset:end]
+
+    # Apply field selection
+    if fields is not None:
+        data = [{field: row[field] for field in fields if field in row} for row in data]
+
+    return {"table_name": table_name, "data": data, "total_count": total_count}
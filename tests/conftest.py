@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The packages of the repository are imported from its root
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def run_script(tmp_path):
+    """Run Python code in a fresh interpreter, for behaviour at process exit
+    or of chDB data paths, which only open once per process"""
+
+    def run(code: str, timeout: float = 120) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [sys.executable, "-c", textwrap.dedent(code)],
+            cwd=ROOT,
+            env={**os.environ, "HOME": str(tmp_path)},
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+
+    return run
@@ -0,0 +1,151 @@
+import pytest
+import chdbpyreader.data_reader as data_reader
+from chdbpyreader.data_reader import DataReader
+from datasource import DataSource
+
+
+@pytest.fixture
+def scores(monkeypatch):
+    """Users with a score column, integers in its first rows only"""
+    get_data = data_reader.get_data
+
+    def with_scores(table_name, **kwargs):
+        page = get_data(table_name, **kwargs)
+        page["data"] = [
+            dict(row, score=row["id"] if row["id"] <= 10 else row["id"] + 0.5)
+            for row in page["data"]
+        ]
+        return page
+
+    monkeypatch.setattr(data_reader, "get_data", with_scores)
+
+
+@pytest.fixture
+def nicknames(monkeypatch):
+    """Users with a nickname and a rating, missing from the rows 7 to 12"""
+    get_data = data_reader.get_data
+
+    def with_nicknames(table_name, fields=None, **kwargs):
+        page = get_data(table_name, **kwargs)
+        rows = [
+            (
+                dict(row, nickname=f"u{row['id']}", rating=row["id"] + 0.5)
+                if not 7 <= row["id"] <= 12
+                else row
+            )
+            for row in page["data"]
+        ]
+        if fields is not None:
+            rows = [{f: row[f] for f in fields if f in row} for row in rows]
+        page["data"] = rows
+        return page
+
+    monkeypatch.setattr(data_reader, "get_data", with_nicknames)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_values_outside_the_sample_are_read_on_the_first_run(scores, streaming):
+    users = DataSource(
+        "API", url="http://x", streaming=streaming, page_size=4, schema_sample_rows=10
+    )
+    query = users.collection("users").select(["id", "score"])
+
+    frame = query.to_dataframe()
+    values = frame["score"].tolist()
+
+    assert values[:10] == list(range(1, 11))
+    assert values[10:] == [i + 0.5 for i in range(11, 21)]
+    assert frame["id"].tolist() == list(range(1, 21))
+
+
+def test_collections_without_streaming_are_typed_from_every_row(scores):
+    reader = DataReader("users", sample_rows=10)
+
+    assert reader.column_types["id"] == "Int32"
+    assert reader.column_types["score"] == "Float64"
+
+
+def test_nullable_columns_read_as_nan_or_empty_strings(monkeypatch):
+    get_data = data_reader.get_data
+
+    def with_nulls(table_name, **kwargs):
+        page = get_data(table_name, **kwargs)
+        for row in page["data"]:
+            if row.get("id") == 2:
+                row["created_at"] = None
+            row["rank"] = None if row.get("id") == 3 else row.get("id")
+        return page
+
+    monkeypatch.setattr(data_reader, "get_data", with_nulls)
+    reader = DataReader("users")
+    users = DataSource("API", url="http://x").collection("users")
+    frame = users.select(["id", "created_at", "rank"]).limit(3).to_dataframe()
+
+    assert reader.column_types["created_at"] == "String"
+    assert reader.column_types["rank"] == "Float64"
+    assert frame["created_at"].tolist() == ["2024-01-01", "", "2024-01-03"]
+    assert frame["rank"].isna().tolist() == [False, False, True]
+    assert not reader.can_push_down("rank", "!=", 1)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Arguments of the source requests made after the fixture is set up"""
+    get_data = data_reader.get_data
+    requests = []
+
+    def recorded(table_name, **kwargs):
+        requests.append(kwargs)
+        return get_data(table_name, **kwargs)
+
+    monkeypatch.setattr(data_reader, "get_data", recorded)
+    return requests
+
+
+def _scan_ids(reader, count=100):
+    scan = reader.scan()
+    ids, batch = [], scan.read(["id"], count)
+    while batch:
+        ids.extend(batch[0].tolist())
+        batch = scan.read(["id"], count)
+    return ids
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_streaming_reads_the_collection_page_by_page(calls, prefetch):
+    reader = DataReader("users", streaming=True, page_size=6, prefetch=prefetch)
+    del calls[:]
+
+    assert _scan_ids(reader) == list(range(1, 21))
+    assert sorted(call["offset"] for call in calls)[:4] == [0, 6, 12, 18]
+    assert all(call["limit"] == 6 for call in calls)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_pages_lacking_the_queried_fields_read_as_nulls(nicknames, streaming):
+    users = DataSource("API", url="http://x", streaming=streaming, page_size=6)
+    frame = users.collection("users").select(["nickname", "rating"]).to_dataframe()
+
+    present = [not 7 <= i <= 12 for i in range(1, 21)]
+    assert frame["nickname"].tolist() == [
+        f"u{i}" if kept else "" for i, kept in zip(range(1, 21), present)
+    ]
+    assert frame["rating"].notna().tolist() == present
+
+
+def test_prefetching_reads_past_pages_lacking_the_queried_fields(nicknames):
+    users = DataSource(
+        "API", url="http://x", streaming=True, page_size=6, prefetch=True
+    )
+    values = users.collection("users").select(["nickname"]).to_dict()["nickname"]
+
+    assert len(values) == 20
+    assert values[12:] == [f"u{i}" for i in range(13, 21)]
+
+
+def test_only_the_queried_columns_are_fetched(calls):
+    users = DataSource("API", url="http://x").collection("users")
+    del calls[:]
+
+    assert users.select(["name"]).limit(1).to_dict() == {"name": ["John Doe"]}
+    assert [call["fields"] for call in calls] == [["name"]]
@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+
+from datasource import DataSource
+from datasource.partitioning import hive_partitions
+from mock_api.api import get_data
+
+USERS = get_data("users")["data"]
+
+
+def test_partitioned_export_reads_back_with_hive_partitioning(tmp_path):
+    users = DataSource("API", url="http://x").collection("users")
+    users.select(["id", "subscription_status"]).to_file(
+        str(tmp_path / "users"), partition_by="subscription_status"
+    )
+    pattern = str(tmp_path / "users" / "*" / "*.parquet")
+    files = DataSource("file", path=pattern, format="Parquet", partitioning="hive")
+
+    assert sorted(os.listdir(tmp_path / "users")) == [
+        "subscription_status=active",
+        "subscription_status=inactive",
+    ]
+    assert hive_partitions(pattern) == {"subscription_status": "String"}
+    query = files.table("users").filter("subscription_status", "=", "inactive")
+    assert query.select(["id"]).order_by("id").to_dict()["id"] == [
+        row["id"] for row in USERS if row["subscription_status"] == "inactive"
+    ]
+
+
+def test_partition_columns_are_typed(tmp_path):
+    directories = ["day=2024-01-01/n=1", "day=2024-01-02/n=__HIVE_DEFAULT_PARTITION__"]
+    for directory in directories:
+        os.makedirs(tmp_path / directory)
+        (tmp_path / directory / "part.csv").write_text("id\n1\n")
+
+    assert hive_partitions(str(tmp_path / "*" / "*" / "*.csv")) == {
+        "day": "Date",
+        "n": "Nullable(Int64)",
+    }
+
+
+def test_csv_files_are_served_from_a_columnar_copy(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_text("id,v\n1,a\n2,b\n")
+    directory = tmp_path / "columnar"
+    events = DataSource(
+        "file",
+        path=str(path),
+        format="CSVWithNames",
+        columnar="Parquet",
+        columnar_dir=str(directory),
+    )
+
+    query = events.table("events")
+    assert "'Parquet'" in query.state.table
+    assert query.to_dict() == {"id": [1, 2], "v": ["a", "b"]}
+    assert len(os.listdir(directory)) == 1
+
+    path.write_text("id,v\n1,a\n2,b\n3,c\n")
+    assert events.table("events").to_dict()["v"] == ["a", "b", "c"]
+
+
+def test_columnar_copies_keep_date_columns(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_text("id,day,at\n1,2024-01-02,2024-01-02 03:04:05\n")
+    columnar = DataSource(
+        "file",
+        path=str(path),
+        format="CSVWithNames",
+        columnar="Parquet",
+        columnar_dir=str(tmp_path / "columnar"),
+    )
+
+    frame = columnar.table("events").filter("day", "=", "2024-01-02").to_dataframe()
+    assert frame["day"].tolist() == [pd.Timestamp(2024, 1, 2)]
+    assert frame["at"].dt.tz_localize(None).tolist() == [
+        pd.Timestamp(2024, 1, 2, 3, 4, 5)
+    ]
@@ -0,0 +1,104 @@
+import pytest
+
+import chdbpyreader.data_reader as data_reader
+from datasource import DataSource
+from mock_api.api import get_data
+
+
+def _rows(builder, columns):
+    # Joins also select every column of the joined table
+    return builder.to_dataframe().iloc[:, :columns].values.tolist()
+
+
+def test_join_of_two_collections():
+    api = DataSource("API", url="http://x")
+    users = api.collection("users").select(["id", "subscription_status"])
+    comments = api.collection("comments").select(["id", "users.subscription_status"])
+    comments.join(users, on={"user_id": "id"}).filter(
+        "users.subscription_status", "=", "inactive"
+    )
+
+    status = {
+        row["id"]: row["subscription_status"] for row in get_data("users")["data"]
+    }
+    expected = [
+        [row["id"], "inactive"]
+        for row in get_data("comments")["data"]
+        if status.get(row["user_id"]) == "inactive"
+    ]
+    assert _rows(comments.order_by("id"), 2) == expected
+
+
+def test_join_reads_each_collection_for_shared_columns():
+    api = DataSource("API", url="http://x")
+    users = api.collection("users").select(["id", "created_at"])
+    comments = api.collection("comments").select(["id", "text", "users.id"])
+    comments.join(users, on={"user_id": "id"}).order_by("id").limit(2)
+
+    expected = [
+        [row["id"], row["text"], row["user_id"]] for row in get_data("comments")["data"]
+    ]
+    assert _rows(comments, 3) == expected[:2]
+
+
+def test_joined_collections_fetch_only_the_queried_columns(monkeypatch):
+    fields = {}
+
+    def recorded(table_name, **kwargs):
+        fields.setdefault(table_name, []).append(kwargs.get("fields"))
+        return get_data(table_name, **kwargs)
+
+    monkeypatch.setattr(data_reader, "get_data", recorded)
+    api = DataSource("API", url="http://x")
+    users = api.collection("users").select(["id", "subscription_status"])
+    comments = api.collection("comments").select(["id", "users.subscription_status"])
+    comments.join(users, on={"user_id": "id"}).order_by("id").limit(1)
+    fields.clear()
+
+    assert len(_rows(comments, 2)) == 1
+    assert {tuple(f) for f in fields["users"]} == {("id", "subscription_status")}
+    assert {tuple(f) for f in fields["comments"]} == {("id", "user_id")}
+
+
+def test_self_join_of_a_collection():
+    api = DataSource("API", url="http://x")
+    users = api.collection("users")
+    pairs = (
+        users.select(["id", "next.id"])
+        .join(f"Python({users._reader.name})", on={"id": "next.id - 1"}, alias="next")
+        .order_by("id")
+        .limit(3)
+    )
+
+    assert _rows(pairs, 2) == [[1, 2], [2, 3], [3, 4]]
+
+
+def _events(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_text("id,parent\n1,0\n2,1\n3,1\n4,2\n")
+    return DataSource("file", path=str(path), format="CSVWithNames")
+
+
+def test_self_join_of_a_builder_under_its_own_alias(tmp_path):
+    events = _events(tmp_path)
+    parents = events.table("events").filter("parent", "=", 0)
+    children = (
+        events.table("events")
+        .select(["id"])
+        .join(parents, on={"parent": "id"}, alias="root")
+        .order_by("id")
+    )
+
+    assert " AS root ON " in children._build_sql()
+    assert _rows(children, 1) == [[2], [3]]
+
+
+def test_join_rejects_duplicate_aliases(tmp_path):
+    events = _events(tmp_path)
+    query = events.table("events")
+
+    with pytest.raises(ValueError, match="Duplicate table alias"):
+        query.join(events.table("events"), on={"parent": "id"})
+    query.join(events.table("events"), on={"parent": "id"}, alias="parent")
+    with pytest.raises(ValueError, match="Duplicate table alias"):
+        query.join(events.table("events"), on={"parent": "id"}, alias="parent")
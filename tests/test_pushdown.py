@@ -0,0 +1,46 @@
+from datasource import DataSource
+from mock_api.api import get_data
+
+
+def _ids(builder):
+    return builder.to_dataframe()["id"].tolist()
+
+
+def test_typed_filters_are_pushed_down():
+    users = DataSource("API", url="http://x").collection("users")
+    users.filter("id", "<=", 3).filter("name", "IN", ["John Doe", "Bob Smith"])
+
+    filters, _ = users._scan_args()[users._reader.name]
+
+    assert filters == [("id", "<=", 3), ("name", "IN", ["John Doe", "Bob Smith"])]
+    assert _ids(users) == [1, 3]
+
+
+def test_filters_chdb_converts_stay_in_chdb(tmp_path):
+    path = tmp_path / "users.csv"
+    rows = get_data("users")["data"]
+    path.write_text(
+        "id,name\n" + "".join(f"{row['id']},{row['name']}\n" for row in rows)
+    )
+    users = DataSource("API", url="http://x").collection("users").filter("id", "=", "2")
+    file_users = DataSource("file", path=str(path), format="CSVWithNames")
+
+    assert users._scan_args()[users._reader.name] == ([], None)
+    assert _ids(users) == _ids(file_users.table("users").filter("id", "=", "2")) == [2]
+
+
+def test_temporal_filters_need_the_source_shape():
+    users = DataSource("API", url="http://x").collection("users")
+    users.filter("created_at", ">=", "2024-01-19 00:00:00")
+
+    assert users._scan_args()[users._reader.name] == ([], None)
+    assert _ids(users) == [19, 20]
+    assert users._reader.can_push_down("created_at", ">=", "2024-01-19")
+
+
+def test_limits_of_aggregated_select_lists_stay_in_chdb():
+    users = DataSource("API", url="http://x").collection("users")
+    users.select(["max(users.id) AS m", "count(users.id) AS n"]).limit(5)
+
+    assert users._scan_args()[users._reader.name] == ([], None)
+    assert users.to_dict() == {"m": [20], "n": [20]}
@@ -0,0 +1,123 @@
+import asyncio
+import sys
+
+import pandas as pd
+
+from datasource import DataSource
+from mock_api.api import get_data
+
+USERS = get_data("users")["data"]
+
+
+def _users():
+    return DataSource("API", url="http://x").collection("users")
+
+
+def test_dataframes_keep_the_column_types():
+    frame = _users().select(["id", "created_at"]).limit(2).to_dataframe()
+
+    assert str(frame["id"].dtype) == "int32"
+    assert frame["created_at"].dt.tz_localize(None).tolist() == [
+        pd.Timestamp(2024, 1, 1),
+        pd.Timestamp(2024, 1, 2),
+    ]
+
+
+def test_batches_are_streamed_in_order():
+    batches = list(_users().select(["id"]).iter_batches(batch_rows=7))
+
+    assert [batch.num_rows for batch in batches] == [7, 7, 6]
+    assert [i for batch in batches for i in batch.column("id").to_pylist()] == [
+        row["id"] for row in USERS
+    ]
+
+
+def test_queries_inside_the_batch_loop_fail_fast(run_script):
+    result = run_script(
+        """
+        from chainfunc.query_builder import QueryBuilder
+        from datasource import DataSource
+
+        users = DataSource("API", url="http://x").collection("users")
+        numbers = QueryBuilder("numbers(10000000)", alias="numbers")
+        for batch in numbers.iter_batches(batch_rows=5):
+            try:
+                users.limit(1).to_dict()
+            except RuntimeError as e:
+                print("iter_batches() loop" in str(e))
+            break
+        print(users.select(["id"]).limit(1).to_dict())
+        """,
+        timeout=60,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["True", "{'id': [1]}"]
+
+
+def test_filter_values_are_bound_as_parameters():
+    value = "x' OR 1=1 --"
+    query = _users().filter("name", "=", value)
+
+    assert value not in query._get_sql()
+    assert query.state.params == {"p0": value}
+    assert query.to_dict() == {}
+    users = _users()
+    assert users._copy().filter("id", "=", 1)._get_sql() == (
+        users._copy().filter("id", "=", 2)._get_sql()
+    )
+
+
+def test_queries_run_through_the_async_api():
+    async def run():
+        return await asyncio.gather(
+            _users().filter("id", "<=", 2).select(["id"]).execute_async("CSV"),
+            _users().select(["id"]).limit(1).to_dataframe_async(),
+        )
+
+    csv, frame = asyncio.run(run())
+
+    assert csv.bytes().decode().split() == ["1", "2"]
+    assert frame["id"].tolist() == [1]
+
+
+def test_materialized_results_are_read_locally():
+    with _users().filter("subscription_status", "=", "active").materialize() as table:
+        assert table.state.table.startswith("materialized_users")
+        ids = table.select(["id"]).order_by("id").to_dict()["id"]
+
+    assert ids == [row["id"] for row in USERS if row["subscription_status"] == "active"]
+
+
+def test_runs_are_profiled():
+    query = _users().profile()
+    query.execute("CSV")
+
+    assert query.stats.queries == 1
+    assert query.stats.sources["users"].rows == len(USERS)
+    assert query.stats.rows_read >= len(USERS)
+    if sys.platform.startswith("linux"):
+        assert query.stats.process_peak_memory is not None
+
+
+def test_groups_are_aggregated_in_chdb():
+    query = (
+        _users()
+        .group_by("subscription_status")
+        .agg(users=("count",), last=("max", "id"))
+        .having("users", ">", 1)
+        .order_by("subscription_status")
+    )
+
+    statuses = sorted({row["subscription_status"] for row in USERS})
+    assert query.to_dict() == {
+        "subscription_status": statuses,
+        "users": [
+            sum(row["subscription_status"] == status for row in USERS)
+            for status in statuses
+        ],
+        "last": [
+            max(row["id"] for row in USERS if row["subscription_status"] == status)
+            for status in statuses
+        ],
+    }
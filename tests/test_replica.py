@@ -0,0 +1,97 @@
+def test_append_reads_rows_sharing_the_last_watermark(run_script, tmp_path):
+    result = run_script(
+        f"""
+        from datasource.replica import TableReplica
+
+        path = {str(tmp_path / "events.csv")!r}
+        table_func = f"file('{{path}}', 'CSVWithNames')"
+        with open(path, "w") as f:
+            f.write("id,updated,v\\n1,1,a\\n2,2,b\\n")
+        replica = TableReplica(
+            {str(tmp_path / "data")!r}, key="id", watermark="updated"
+        )
+        replica.refresh("events", table_func, full=True)
+        # Written after the refresh, in the same second as row 2
+        with open(path, "w") as f:
+            f.write("id,updated,v\\n1,1,a\\n2,2,c\\n3,2,d\\n")
+        replica.refresh("events", table_func)
+        rows = replica._query(
+            f"SELECT id, v FROM {{replica.table('events', table_func)}} ORDER BY id",
+            "TabSeparated",
+        )
+        print(rows.bytes().decode(), end="")
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["1\ta", "2\tc", "3\td"]
+
+
+def test_postgres_tables_are_served_from_replicas(run_script, tmp_path):
+    result = run_script(
+        f"""
+        from datasource import DataSource
+
+        path = {str(tmp_path / "events.csv")!r}
+        with open(path, "w") as f:
+            f.write("id,v\\n1,a\\n2,b\\n")
+        # Stands in for the postgresql() table function of the table
+        DataSource._get_postgres_table_function = (
+            lambda self: f"file('{{path}}', 'CSVWithNames')"
+        )
+        shop = DataSource(
+            "postgres",
+            host="db",
+            database="shop",
+            replicate=True,
+            replica_path={str(tmp_path / "data")!r},
+        )
+
+        def ids():
+            events = shop.table("events").select(["id"]).order_by("id")
+            return events.state.table, events.to_dict()["id"]
+
+        print(*ids())
+        with open(path, "w") as f:
+            f.write("id,v\\n1,a\\n2,b\\n3,c\\n")
+        print(*ids())
+        print(shop.refresh("events"), *ids())
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == [
+        "replicas.`shop_events` [1, 2]",
+        "replicas.`shop_events` [1, 2]",
+        "3 replicas.`shop_events` [1, 2, 3]",
+    ]
+
+
+def test_replicas_are_refreshed_after_the_interval(run_script, tmp_path):
+    result = run_script(
+        f"""
+        import time
+        from datasource.replica import TableReplica, parse_refresh
+
+        print(parse_refresh("90s"), parse_refresh("5m"), parse_refresh("1h"))
+        path = {str(tmp_path / "events.csv")!r}
+        table_func = f"file('{{path}}', 'CSVWithNames')"
+        with open(path, "w") as f:
+            f.write("id\\n1\\n")
+        replica = TableReplica({str(tmp_path / "data")!r}, refresh="5m")
+
+        def count():
+            table = replica.table("events", table_func)
+            return replica._count(table)
+
+        print(count())
+        with open(path, "w") as f:
+            f.write("id\\n1\\n2\\n")
+        print(count())
+        replica._refreshed["events"] = time.time() - 301
+        print(count())
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["90.0 300.0 3600.0", "1", "1", "2"]
@@ -0,0 +1,77 @@
+from chainfunc.result_cache import BufferedResult, ResultCache
+from datasource import DataSource
+
+API_RUN = """
+from chainfunc.result_cache import ResultCache
+from datasource import DataSource
+
+cache = ResultCache(directory={directory!r})
+DataSource("API", url="http://x").collection("users").cached(cache).execute("CSV")
+print(cache.stats.hits, cache.stats.disk_hits)
+"""
+
+
+def test_api_results_stay_out_of_the_disk_tier(run_script, tmp_path):
+    script = API_RUN.format(directory=str(tmp_path / "results"))
+
+    runs = [run_script(script) for _ in range(2)]
+
+    assert [run.returncode for run in runs] == [0, 0], runs[-1].stderr
+    assert [run.stdout.strip() for run in runs] == ["0 0", "0 0"]
+
+
+def test_api_results_are_cached_in_memory():
+    cache = ResultCache()
+    users = DataSource("API", url="http://x").collection("users").cached(cache)
+
+    first = users.execute("CSV").bytes()
+
+    assert users.execute("CSV").bytes() == first
+    assert cache.stats.hits == 1
+
+
+def test_local_table_results_follow_inserts(tmp_path):
+    cache = ResultCache(directory=str(tmp_path / "results"))
+    api = DataSource("API", url="http://x")
+    table = (
+        api.collection("users")
+        .filter("id", "<=", 2)
+        .to_table("cached_users", order_by="id")
+    )
+    count = table.agg(n=("count",)).cached(cache)
+
+    assert count.execute("CSV").bytes() == b"2\n"
+    api.collection("users").filter("id", ">", 18).to_table(
+        "cached_users", if_exists="append"
+    )
+
+    assert count.execute("CSV").bytes() == b"4\n"
+    assert count.execute("CSV").bytes() == b"4\n"
+    assert cache.stats.hits == 1
+    assert not list((tmp_path / "results").iterdir())
+
+
+def test_temporary_table_results_are_not_cached():
+    cache = ResultCache()
+    users = DataSource("API", url="http://x").collection("users").materialize()
+
+    users.cached(cache).execute("CSV")
+    users.execute("CSV")
+
+    assert cache.stats.hits == 0
+    assert cache.stats.entries == 0
+
+
+def test_postgres_credentials_stay_out_of_the_disk_tier(tmp_path):
+    directory = tmp_path / "results"
+    cache = ResultCache(directory=str(directory))
+    sql = "SELECT * FROM postgresql('db:5432', 'shop', 'orders', 'app', 's3cret')"
+
+    cache.put("key", BufferedResult(b"1\n"), sql, ttl=60)
+
+    meta = [path.read_text() for path in directory.glob("*.json")]
+    assert len(meta) == 1
+    assert "'orders'" in meta[0] and "s3cret" not in meta[0]
+    assert "app" not in meta[0]
+    cache.invalidate("orders")
+    assert not list(directory.iterdir())
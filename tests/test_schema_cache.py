@@ -0,0 +1,47 @@
+import pandas as pd
+
+from chainfunc.schema_cache import configure_schema_cache
+from datasource import DataSource
+
+
+def _events(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_text("id,ts\n1,2024-01-02 03:04:05\n2,2024-02-03 04:05:06\n")
+    configure_schema_cache(str(tmp_path / "schemas"))
+    return DataSource("file", path=str(path), format="CSVWithNames")
+
+
+def test_schema_is_discovered_once(tmp_path):
+    events = _events(tmp_path)
+
+    schema = {"id": "Nullable(Int64)", "ts": "Nullable(DateTime)"}
+    assert events.table("events").get_schema() == {"events": schema}
+    assert events.table("events")._table_schema() == schema
+    assert list((tmp_path / "schemas").iterdir())
+
+
+def test_expressions_named_like_columns_keep_their_type(tmp_path):
+    events = _events(tmp_path)
+    query = events.table("events").select(["id", "toDate(events.ts) AS ts"])
+
+    assert query._schema_types() is None
+    assert query.to_dataframe()["ts"].tolist() == [
+        pd.Timestamp(2024, 1, 2),
+        pd.Timestamp(2024, 2, 3),
+    ]
+    assert events.table("events").select(["id", "ts"])._schema_types() == [
+        "Nullable(Int64)",
+        "Nullable(DateTime)",
+    ]
+
+
+def test_postgres_credentials_stay_out_of_the_directory(tmp_path):
+    cache = configure_schema_cache(str(tmp_path / "schemas"))
+    table = "postgresql('db:5432', 'shop', 'orders', 'app', 's3cret')"
+
+    cache._store("key", {"id": "Int64"}, None, table)
+
+    text = (tmp_path / "schemas" / "key.json").read_text()
+    assert "'orders'" in text and "s3cret" not in text
+    cache.invalidate("orders")
+    assert not list((tmp_path / "schemas").iterdir())
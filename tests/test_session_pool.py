@@ -0,0 +1,52 @@
+def test_process_exits_cleanly_with_open_pool(run_script):
+    result = run_script(
+        """
+        import tempfile
+        from datasource import DataSource
+
+        ds = DataSource("API", url="http://x", sync=True, sync_path=tempfile.mkdtemp())
+        print(len(ds.collection("comments").to_dataframe()))
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "20"
+
+
+def test_moving_to_data_path_keeps_session_tables(run_script):
+    result = run_script(
+        """
+        import tempfile
+        from datasource import DataSource
+        from chainfunc.session_pool import get_pool
+
+        api = DataSource("API", url="http://x")
+        users = api.collection("users").materialize()
+        try:
+            get_pool(tempfile.mkdtemp())
+        except ValueError:
+            assert get_pool().path == ":memory:"
+            print(users.agg(n=("count",)).execute("CSV").bytes().decode().strip())
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "20"
+
+
+def test_empty_memory_session_moves_to_data_path(run_script):
+    result = run_script(
+        """
+        import tempfile
+        from datasource import DataSource
+        from chainfunc.session_pool import get_pool
+
+        api = DataSource("API", url="http://x")
+        api.collection("users").limit(1).execute("CSV")
+        path = tempfile.mkdtemp()
+        print(get_pool(path).path == path)
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "True"
@@ -0,0 +1,74 @@
+import chdbpyreader.data_reader as data_reader
+from chainfunc.session_pool import get_pool
+from datasource import DataSource
+from datasource.snapshot import SnapshotCache
+
+
+def _names(directory):
+    users = DataSource("API", url="http://x", snapshot=True, snapshot_dir=directory)
+    return users.collection("users").select(["name"]).order_by("id").limit(2)
+
+
+def test_snapshots_are_reused_without_the_source(monkeypatch, tmp_path):
+    directory = str(tmp_path / "snapshots")
+    expected = {"name": ["John Doe", "Jane Doe"]}
+    assert _names(directory).to_dict() == expected
+    assert [path.suffix for path in (tmp_path / "snapshots").iterdir()] == [".parquet"]
+
+    def unavailable(table_name, **kwargs):
+        raise ConnectionError("source is down")
+
+    monkeypatch.setattr(data_reader, "get_data", unavailable)
+    assert _names(directory).to_dict() == expected
+
+
+def test_snapshot_hits_do_not_use_the_previous_collection(tmp_path):
+    directory = str(tmp_path / "snapshots")
+    warm = DataSource("API", url="http://x", snapshot=True, snapshot_dir=directory)
+    warm.collection("comments").to_dict()
+    api = DataSource("API", url="http://x", snapshot=True, snapshot_dir=directory)
+
+    api.collection("users")
+    comments = api.collection("comments").filter("id", "<=", 2)
+
+    assert comments._reader is None
+    assert not comments.state.schema
+    assert comments.select(["id"]).to_dict() == {"id": [1, 2]}
+
+
+def test_snapshots_are_kept_apart_by_api_key(tmp_path):
+    directory = tmp_path / "snapshots"
+    for api_key in ["first-secret", "second-secret", "first-secret"]:
+        api = DataSource(
+            "API",
+            url="http://x",
+            api_key=api_key,
+            snapshot=True,
+            snapshot_dir=str(directory),
+        )
+        api.collection("users").to_dict()
+
+    names = [path.name for path in directory.iterdir()]
+    assert len(names) == 2
+    assert not any("secret" in name for name in names)
+
+
+def test_snapshots_keep_dates(tmp_path):
+    cache = SnapshotCache(str(tmp_path / "snapshots"))
+    path = cache.put(
+        "dates",
+        "(SELECT toDate('2024-01-02') AS day, "
+        "toDateTime('2024-01-02 03:04:05', 'UTC') AS at)",
+    )
+
+    result = get_pool().query(
+        f"SELECT toTypeName(day), toTypeName(at), day, at "
+        f"FROM {cache.table_function(path)}",
+        "TabSeparatedRaw",
+    )
+    assert result.bytes().decode().rstrip("\n").split("\t") == [
+        "Nullable(Date32)",
+        "Nullable(DateTime64(3, 'UTC'))",
+        "2024-01-02",
+        "2024-01-02 03:04:05.000",
+    ]
@@ -0,0 +1,91 @@
+def test_sync_appends_rows_after_the_watermark(run_script):
+    result = run_script(
+        """
+        import tempfile
+        import chdbpyreader.data_reader as data_reader
+        from datasource import DataSource
+
+        get_data = data_reader.get_data
+        max_id = 10
+        pushed = []
+
+        def growing_source(table_name, filters=None, **kwargs):
+            pushed.append(list(filters or []))
+            page = get_data(table_name, filters=filters, **kwargs)
+            page["data"] = [row for row in page["data"] if row["id"] <= max_id]
+            return page
+
+        data_reader.get_data = growing_source
+        ds = DataSource(
+            "API",
+            url="http://x",
+            sync=True,
+            sync_path=tempfile.mkdtemp(),
+            watermark="id",
+        )
+        print(ds.sync("users"))
+        max_id = 20
+        print(ds.sync("users"), pushed[-1])
+        print(ds.sync("users"))
+        users = ds.collection("users").order_by("id")
+        print(users.state.table, users.to_dataframe()["id"].tolist())
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == [
+        "10",
+        "10 [('id', '>', 10), ('id', '<=', 20)]",
+        "0",
+        f"api_sync.`users` {list(range(1, 21))}",
+    ]
+
+
+def test_sync_keeps_datetime_watermarks_of_the_source(run_script):
+    result = run_script(
+        """
+        import tempfile
+        import chdbpyreader.data_reader as data_reader
+        from datasource import DataSource
+        from mock_api.api import _matches
+
+        get_data = data_reader.get_data
+        max_id = 3
+
+        def timestamped_source(table_name, fields=None, filters=None, **kwargs):
+            rows = [
+                dict(row, updated=f"2024-01-20T{8 + row['id']:02d}:00:00")
+                for row in get_data(table_name)["data"]
+                if row["id"] <= max_id
+            ]
+            rows = [row for row in rows if _matches(row, filters or [])]
+            offset, limit = kwargs.get("offset", 0), kwargs.get("limit")
+            rows = rows[offset : None if limit is None else offset + limit]
+            if fields:
+                rows = [{field: row.get(field) for field in fields} for row in rows]
+            return {"data": rows}
+
+        data_reader.get_data = timestamped_source
+        ds = DataSource(
+            "API",
+            url="http://x",
+            sync=True,
+            sync_path=tempfile.mkdtemp(),
+            watermark="updated",
+        )
+        print(ds.sync("users"), ds._get_sync().watermark("users"))
+        print(ds.sync("users"))
+        max_id = 5
+        print(ds.sync("users"), ds._get_sync().watermark("users"))
+        users = ds.collection("users").select(["id"]).order_by("id")
+        print(users.to_dataframe()["id"].tolist())
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == [
+        "3 2024-01-20T11:00:00",
+        "0",
+        "2 2024-01-20T13:00:00",
+        "[1, 2, 3, 4, 5]",
+    ]
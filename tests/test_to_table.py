@@ -0,0 +1,27 @@
+def test_append_round_trip(run_script, tmp_path):
+    result = run_script(
+        f"""
+        from datasource import DataSource
+
+        path = {str(tmp_path / "events.csv")!r}
+        with open(path, "w") as f:
+            f.write("id,ts\\n1,2024-01-02 03:04:05\\n2,2024-01-03 00:00:00\\n")
+        events = DataSource("file", path=path, format="CSVWithNames")
+        events.table("ev").select(["id", "ts"]).filter("id", "=", 1).to_table(
+            "events", engine="Memory"
+        )
+        table = (
+            events.table("ev")
+            .select(["id", "ts"])
+            .filter("id", "=", 2)
+            .to_table("events", if_exists="append")
+        )
+        print(table.order_by("id").execute("TabSeparated"), end="")
+        """
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == [
+        "1\t2024-01-02 03:04:05",
+        "2\t2024-01-03 00:00:00",
+    ]
@@ -0,0 +1,82 @@
+import numpy as np
+from chdbpyreader.utils import (
+    convert_to_columnar,
+    infer_data_types,
+    iter_columnar,
+    python_table_type,
+    to_numpy_array,
+    to_numpy_columns,
+    wider_type,
+)
+
+
+def test_to_numpy_columns_builds_typed_buffers():
+    data = {"id": [1, 2, 3], "score": [0.5, 1.5, 2.5], "name": ["a", "b", "c"]}
+    schema = infer_data_types(data)
+
+    columns = to_numpy_columns(data, schema)
+
+    assert columns["id"].dtype == np.int32
+    assert columns["score"].dtype == np.float64
+    assert columns["name"].dtype == object
+    assert columns["name"].tolist() == ["a", "b", "c"]
+
+
+def test_integer_arrays_never_truncate():
+    floats = to_numpy_array([1, 2.5, 3.9], "Int64")
+    too_large = to_numpy_array([1, 2**40], "Int32")
+
+    assert floats.dtype == np.float64
+    assert floats.tolist() == [1, 2.5, 3.9]
+    assert too_large.dtype == np.float64
+    assert too_large.tolist() == [1, 2**40]
+
+
+def test_nulls_never_become_values():
+    dates = to_numpy_array(["2024-01-01", None, "not a date"], "Date")
+    numbers = to_numpy_array([1, None, 3], "Float64")
+
+    assert dates.dtype == object
+    assert dates.tolist() == ["2024-01-01", None, "not a date"]
+    assert np.isnan(numbers[1])
+
+
+def test_nullable_columns_are_read_as_types_holding_nulls():
+    schema = infer_data_types({"n": [1, None], "day": ["2024-01-01", None]})
+
+    assert schema == {"n": "Nullable(Int32)", "day": "Nullable(Date)"}
+    assert python_table_type(schema["n"]) == "Float64"
+    assert python_table_type(schema["day"]) == "String"
+    assert python_table_type("LowCardinality(Nullable(String))") == (
+        "LowCardinality(String)"
+    )
+
+
+def test_wider_type_holds_unexpected_values():
+    assert wider_type("Int32", [1, 2.5]) == "Float64"
+    assert wider_type("Int64", [1, None]) == "Float64"
+    assert wider_type("Date", ["2024-01-01", "n/a"]) == "String"
+    assert wider_type("Date", [None]) == "String"
+
+
+def test_columnar_conversion_keeps_the_row_order_of_columns():
+    rows = [{"b": 1, "a": "x"}, {"b": 2, "c": 3.5}]
+
+    assert convert_to_columnar(rows) == {
+        "b": [1, 2],
+        "a": ["x", None],
+        "c": [None, 3.5],
+    }
+    batches = list(iter_columnar([rows[:1], [], rows[1:]]))
+    assert [list(batch) for batch in batches] == [["b", "a"], ["b", "a", "c"]]
+    assert batches[1]["a"] == [None]
+
+
+def test_columnar_conversion_builds_typed_columns():
+    columns = convert_to_columnar(
+        [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}],
+        {"id": "Int64", "name": "String"},
+    )
+
+    assert columns["id"].dtype == np.int64
+    assert columns["name"] == ["a", "b"]